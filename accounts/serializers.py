@@ -1,14 +1,18 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from boxer_platform.renditions import ImageRenditionsField
 
 User = get_user_model()
 
 
 class UserSerializer(serializers.ModelSerializer):
+    avatar_renditions = ImageRenditionsField('avatar')
+    
     class Meta:
         model = User
-        fields = ('id', 'username', 'email', 'first_name', 'last_name', 'avatar', 'created_at')
+        fields = ('id', 'username', 'email', 'first_name', 'last_name', 'avatar', 'avatar_renditions',
+                  'created_at')
         read_only_fields = ('id', 'created_at')
 
 
@@ -0,0 +1,17 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from boxer_platform.renditions import AVATAR_WIDTHS, delete_renditions, sync_renditions
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def avatar_saved(sender, instance, **kwargs):
+    """Сгенерировать копии аватара после загрузки"""
+    sync_renditions(instance, 'avatar', 'avatar_renditions', AVATAR_WIDTHS)
+
+
+@receiver(post_delete, sender=User)
+def avatar_deleted(sender, instance, **kwargs):
+    delete_renditions(instance.avatar.storage, instance.avatar_renditions)
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import ChatMessage
+from django.utils import timezone
+from .answer_cache import evict
+from .models import CachedAnswer, ChatMessage, ConversationSummary
 
 
 @admin.register(ChatMessage)
@@ -13,3 +15,35 @@ class ChatMessageAdmin(admin.ModelAdmin):
         return obj.message[:50] + '...' if len(obj.message) > 50 else obj.message
     
     message_preview.short_description = 'Сообщение'
+
+
+@admin.register(CachedAnswer)
+class CachedAnswerAdmin(admin.ModelAdmin):
+    list_display = ('question_preview', 'hits', 'last_hit_at', 'expires_at', 'created_at')
+    search_fields = ('question', 'response')
+    readonly_fields = ('question', 'normalized_question', 'question_hash', 'hits',
+                       'created_at', 'last_hit_at')
+    exclude = ('signature',)
+    actions = ('invalidate', 'remove_expired')
+    
+    def question_preview(self, obj):
+        return obj.question[:50] + '...' if len(obj.question) > 50 else obj.question
+    
+    question_preview.short_description = 'Вопрос'
+    
+    @admin.action(description='Сбросить выбранные ответы (запросить у AI заново)')
+    def invalidate(self, request, queryset):
+        updated = queryset.update(expires_at=timezone.now())
+        self.message_user(request, f'Сброшено ответов: {updated}')
+    
+    @admin.action(description='Удалить просроченные и вытеснить лишние записи')
+    def remove_expired(self, request, queryset):
+        evict()
+        self.message_user(request, 'Кэш очищен')
+
+
+@admin.register(ConversationSummary)
+class ConversationSummaryAdmin(admin.ModelAdmin):
+    list_display = ('user', 'covered_until', 'updated_at')
+    search_fields = ('user__username', 'user__email', 'summary')
+    readonly_fields = ('covered_until', 'updated_at')
@@ -0,0 +1,265 @@
+"""
+Ограничение числа одновременных запросов к AI тренеру для всех воркеров.
+
+Слот - ключ ai-admission:slot:<i> в общем кэше (i < AI_MAX_IN_FLIGHT),
+занимается атомарным cache.add со случайным токеном и сроком жизни
+чуть больше AI_PROVIDER_TIMEOUT, поэтому слот упавшего воркера
+освобождается сам. Без общего кэша (LocMemCache, REDIS_URL не задан)
+слоты и очередь заменяет счётчик в памяти процесса (LocalTicket): лимит
+AI_MAX_IN_FLIGHT действует в каждом воркере отдельно, порядок внутри
+уровня не гарантируется. Об этом при старте предупреждает проверка
+ai_coach.W001 (ai_coach.checks).
+
+Если свободного слота нет, запрос встаёт в очередь своего уровня
+(ai_coach.quota.get_tier): номер выдаёт атомарный incr счётчика tail,
+слот может занять только запрос с номером не больше head, так что
+внутри уровня порядок FIFO. Пока очередь владельцев курсов (paid) не
+пуста, остальные слот не занимают. Ушедший из очереди запрос удаляет
+ключ своего номера; номер без ключа (ожидание закончилось, воркер
+упал) пропускается тем, кто следит за головой очереди.
+
+Всего в очередях не больше AI_ADMISSION_QUEUE_SIZE запросов, ждут они
+не дольше AI_ADMISSION_WAIT секунд по уровню. Кому не хватило места
+или времени, получает AdmissionRejected - ответ 429 с Retry-After.
+"""
+import asyncio
+import random
+import secrets
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from boxer_platform.cache import is_shared_cache
+
+from .quota import get_tier
+
+SLOT_PREFIX = 'ai-admission:slot'
+QUEUE_PREFIX = 'ai-admission:queue'
+# Запас срока слота сверх AI_PROVIDER_TIMEOUT на поиск материалов и запись в БД
+SLOT_LEASE_MARGIN = 30
+# Защита от двойного сдвига головы очереди
+ADVANCE_GUARD_TIMEOUT = 60
+POLL_INTERVAL = 0.05
+PRIORITY_TIER = 'paid'
+TIERS = (PRIORITY_TIER, 'free')
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, retry_after):
+        super().__init__('AI тренер перегружен')
+        self.retry_after = retry_after
+
+
+def _head_key(tier):
+    return f'{QUEUE_PREFIX}:{tier}:head'
+
+
+def _tail_key(tier):
+    return f'{QUEUE_PREFIX}:{tier}:tail'
+
+
+def _number_key(tier, number):
+    return f'{QUEUE_PREFIX}:{tier}:number:{number}'
+
+
+def _queue_state():
+    """{tier: (head, tail)}: ждут номера head..tail, очередь пуста при head > tail"""
+    keys = [key for tier in TIERS for key in (_head_key(tier), _tail_key(tier))]
+    values = cache.get_many(keys)
+    return {
+        tier: (values.get(_head_key(tier), 1), values.get(_tail_key(tier), 0))
+        for tier in TIERS
+    }
+
+
+def _advance(tier, number):
+    """Сдвинуть голову очереди с номера number (один раз на номер)"""
+    if cache.add(f'{QUEUE_PREFIX}:{tier}:advance:{number}', 1, ADVANCE_GUARD_TIMEOUT):
+        cache.add(_head_key(tier), 1, None)
+        cache.incr(_head_key(tier))
+
+
+def _skip_abandoned(tier, head):
+    """Пропустить голову очереди, если её запрос уже не ждёт; True, если пропущена"""
+    if cache.get(_number_key(tier, head)) is not None:
+        return False
+    _advance(tier, head)
+    return True
+
+
+def _lease_slot(token):
+    keys = [f'{SLOT_PREFIX}:{index}' for index in range(settings.AI_MAX_IN_FLIGHT)]
+    taken = cache.get_many(keys)
+    free = [key for key in keys if key not in taken]
+    random.shuffle(free)
+    timeout = int(settings.AI_PROVIDER_TIMEOUT) + SLOT_LEASE_MARGIN
+    for key in free:
+        if cache.add(key, token, timeout):
+            return key
+    return None
+
+
+def _release(key, value):
+    # Между get и delete срок мог истечь, а ключ - достаться другому запросу;
+    # окно мало, и в худшем случае лимит на мгновение превышается на один
+    if cache.get(key) == value:
+        cache.delete(key)
+
+
+class Ticket:
+    """Запрос к AI: место в очереди и занятый слот; release() освобождает слот"""
+
+    def __init__(self, tier):
+        self.tier = tier
+        self.token = secrets.token_hex(8)
+        self.number = None
+        self.slot_key = None
+
+    def _blocked_by(self, state):
+        """(уровень, голова) очереди, которая должна пройти раньше, или None"""
+        for tier in TIERS:
+            head, tail = state[tier]
+            if tier == self.tier and self.number is not None:
+                if head < self.number:
+                    return tier, head
+                break
+            if head <= tail:
+                return tier, head
+            if tier == self.tier:
+                break
+        return None
+
+    def try_admit(self):
+        """Занять слот, если подошла очередь и он есть"""
+        for _ in range(settings.AI_ADMISSION_QUEUE_SIZE + 1):
+            blocker = self._blocked_by(_queue_state())
+            if blocker is None or not _skip_abandoned(*blocker):
+                break
+        if blocker is not None:
+            return False
+        self.slot_key = _lease_slot(self.token)
+        if self.slot_key is None:
+            return False
+        self.leave_queue()
+        return True
+
+    def enqueue(self, wait):
+        """Встать в очередь; False, если она заполнена"""
+        state = _queue_state()
+        waiting = sum(max(tail - head + 1, 0) for head, tail in state.values())
+        if waiting >= settings.AI_ADMISSION_QUEUE_SIZE:
+            return False
+        cache.add(_tail_key(self.tier), 0, None)
+        number = cache.incr(_tail_key(self.tier))
+        cache.set(_number_key(self.tier, number), self.token, int(wait) + 2)
+        self.number = number
+        return True
+
+    def leave_queue(self):
+        if self.number is None:
+            return
+        cache.delete(_number_key(self.tier, self.number))
+        head = cache.get(_head_key(self.tier), 1)
+        if head == self.number:
+            _advance(self.tier, self.number)
+        self.number = None
+
+    def release(self):
+        self.leave_queue()
+        if self.slot_key is not None:
+            _release(self.slot_key, self.token)
+            self.slot_key = None
+
+
+# Слоты и очередь процесса, когда кэш не общий
+_local_lock = threading.Lock()
+_local = {'in_flight': 0, 'waiting': Counter()}
+
+
+class LocalTicket:
+    """Запрос к AI в пределах процесса: тот же интерфейс, что у Ticket"""
+
+    def __init__(self, tier):
+        self.tier = tier
+        self.queued = False
+        self.admitted = False
+
+    def try_admit(self):
+        with _local_lock:
+            if _local['in_flight'] >= settings.AI_MAX_IN_FLIGHT:
+                return False
+            if self.tier != PRIORITY_TIER and _local['waiting'][PRIORITY_TIER]:
+                return False
+            _local['in_flight'] += 1
+            self.admitted = True
+        self.leave_queue()
+        return True
+
+    def enqueue(self, wait):
+        with _local_lock:
+            if sum(_local['waiting'].values()) >= settings.AI_ADMISSION_QUEUE_SIZE:
+                return False
+            _local['waiting'][self.tier] += 1
+            self.queued = True
+        return True
+
+    def leave_queue(self):
+        with _local_lock:
+            if self.queued:
+                _local['waiting'][self.tier] -= 1
+                self.queued = False
+
+    def release(self):
+        self.leave_queue()
+        with _local_lock:
+            if self.admitted:
+                _local['in_flight'] -= 1
+                self.admitted = False
+
+
+def _new_ticket(tier):
+    return Ticket(tier) if is_shared_cache() else LocalTicket(tier)
+
+
+def acquire(user):
+    """Занять слот (с ожиданием в очереди) или выбросить AdmissionRejected"""
+    tier = get_tier(user)
+    ticket = _new_ticket(tier)
+    if ticket.try_admit():
+        return ticket
+    wait = settings.AI_ADMISSION_WAIT[tier]
+    if not ticket.enqueue(wait):
+        raise AdmissionRejected(settings.AI_ADMISSION_RETRY_AFTER)
+    deadline = time.monotonic() + wait
+    try:
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            if ticket.try_admit():
+                return ticket
+    finally:
+        ticket.leave_queue()
+    raise AdmissionRejected(settings.AI_ADMISSION_RETRY_AFTER)
+
+
+async def aacquire(user):
+    """Асинхронный вариант acquire: ожидание не занимает поток"""
+    tier = await sync_to_async(get_tier)(user)
+    ticket = _new_ticket(tier)
+    if await sync_to_async(ticket.try_admit)():
+        return ticket
+    wait = settings.AI_ADMISSION_WAIT[tier]
+    if not await sync_to_async(ticket.enqueue)(wait):
+        raise AdmissionRejected(settings.AI_ADMISSION_RETRY_AFTER)
+    deadline = time.monotonic() + wait
+    try:
+        while time.monotonic() < deadline:
+            await asyncio.sleep(POLL_INTERVAL)
+            if await sync_to_async(ticket.try_admit)():
+                return ticket
+    finally:
+        await sync_to_async(ticket.leave_queue)()
+    raise AdmissionRejected(settings.AI_ADMISSION_RETRY_AFTER)
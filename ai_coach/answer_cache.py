@@ -0,0 +1,161 @@
+"""
+Кэш ответов AI тренера на повторяющиеся вопросы.
+
+Вопрос нормализуется (регистр, ё, пунктуация, пробелы) и разбивается на
+символьные триграммы. По ним строится MinHash-сигнатура из NUM_PERM
+значений: доля совпавших значений двух сигнатур оценивает коэффициент
+Жаккара множеств триграмм, то есть близость формулировок.
+
+Чтобы не сравнивать вопрос со всеми записями, сигнатура режется на BANDS
+полос по ROWS значений (LSH). Хэш каждой полосы хранится в AnswerCacheBand
+с индексом, кандидаты - записи, у которых совпала хотя бы одна полоса.
+При сходстве 0.8 кандидат находится с вероятностью > 99.9%.
+
+Сигнатура вопроса запоминается в процессе (lru_cache), поэтому store
+после промаха lookup не считает её повторно. Записи живут
+AI_ANSWER_CACHE_TTL; просроченные и давно не использованные сверх
+AI_ANSWER_CACHE_MAX_ENTRIES (LRU) удаляет не store, а периодическая
+команда evict_answer_cache, чтобы запись стоила O(1).
+"""
+import hashlib
+import random
+import re
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import AnswerCacheBand, CachedAnswer
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+# Простое число Мерсенна 2^61 - 1 для универсального хэширования
+MERSENNE_PRIME = (1 << 61) - 1
+
+_rng = random.Random(20240601)
+PERMUTATIONS = [
+    (_rng.randrange(1, MERSENNE_PRIME), _rng.randrange(0, MERSENNE_PRIME))
+    for _ in range(NUM_PERM)
+]
+
+NON_WORD_RE = re.compile(r'[^\w]+')
+
+
+def normalize_question(text):
+    text = text.lower().replace('ё', 'е')
+    return ' '.join(NON_WORD_RE.sub(' ', text).split())
+
+
+def _shingles(normalized):
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized}
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+@lru_cache(maxsize=1024)
+def minhash_signature(normalized):
+    hashes = [
+        int.from_bytes(hashlib.md5(shingle.encode()).digest()[:8], 'big')
+        for shingle in _shingles(normalized)
+    ]
+    return tuple(
+        min((a * value + b) % MERSENNE_PRIME for value in hashes)
+        for a, b in PERMUTATIONS
+    )
+
+
+def band_keys(signature):
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.md5(','.join(map(str, rows)).encode()).hexdigest()
+        keys.append(f'{band}:{digest[:32]}')
+    return keys
+
+
+def estimate_similarity(first, second):
+    return sum(1 for a, b in zip(first, second) if a == b) / NUM_PERM
+
+
+def lookup(question):
+    """
+    Найти ответ на такой же или похожий вопрос. При попадании
+    увеличивается счётчик и обновляется время использования.
+    """
+    normalized = normalize_question(question)
+    if not normalized:
+        return None
+    now = timezone.now()
+    signature = minhash_signature(normalized)
+
+    candidate_ids = AnswerCacheBand.objects.filter(
+        key__in=band_keys(signature)
+    ).values('entry_id')
+    best, best_similarity = None, settings.AI_ANSWER_CACHE_SIMILARITY
+    for entry in CachedAnswer.objects.filter(id__in=candidate_ids, expires_at__gt=now):
+        similarity = estimate_similarity(signature, entry.signature)
+        if similarity >= best_similarity:
+            best, best_similarity = entry, similarity
+    if best is None:
+        return None
+
+    CachedAnswer.objects.filter(id=best.id).update(hits=F('hits') + 1, last_hit_at=now)
+    return best
+
+
+def store(question, response):
+    """Сохранить ответ (старые записи удаляет evict_answer_cache)"""
+    normalized = normalize_question(question)
+    if not normalized:
+        return None
+    now = timezone.now()
+    question_hash = hashlib.sha256(normalized.encode()).hexdigest()
+    signature = minhash_signature(normalized)
+    expires_at = now + timedelta(seconds=settings.AI_ANSWER_CACHE_TTL)
+
+    try:
+        with transaction.atomic():
+            entry, created = CachedAnswer.objects.update_or_create(
+                question_hash=question_hash,
+                defaults={
+                    'question': question,
+                    'normalized_question': normalized,
+                    'signature': list(signature),
+                    'response': response,
+                    'expires_at': expires_at,
+                    'last_hit_at': now,
+                },
+            )
+            if created:
+                AnswerCacheBand.objects.bulk_create(
+                    AnswerCacheBand(entry=entry, key=key) for key in band_keys(signature)
+                )
+    except IntegrityError:
+        # Тот же вопрос параллельно сохранил другой запрос
+        return None
+    return entry
+
+
+def evict(now=None):
+    """
+    Удалить просроченные записи и самые давно использованные сверх лимита;
+    возвращает (просроченных, вытесненных)
+    """
+    now = now or timezone.now()
+    # delete() считает и каскадно удалённые полосы, нужны только записи
+    _, deleted = CachedAnswer.objects.filter(expires_at__lte=now).delete()
+    expired = deleted.get(CachedAnswer._meta.label, 0)
+    overflow = CachedAnswer.objects.count() - settings.AI_ANSWER_CACHE_MAX_ENTRIES
+    evicted = 0
+    if overflow > 0:
+        stale_ids = list(
+            CachedAnswer.objects.order_by('last_hit_at').values_list('id', flat=True)[:overflow]
+        )
+        evicted = len(stale_ids)
+        CachedAnswer.objects.filter(id__in=stale_ids).delete()
+    return expired, evicted
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AiCoachConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ai_coach'
+    
+    def ready(self):
+        from . import checks, signals  # noqa: F401
@@ -0,0 +1,20 @@
+"""Проверки настроек AI тренера при старте (manage.py check, runserver, migrate)"""
+from django.conf import settings
+from django.core import checks
+
+from boxer_platform.cache import is_shared_cache
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Без общего кэша лимиты AI тренера действуют в каждом воркере отдельно"""
+    if settings.DEBUG or is_shared_cache():
+        return []
+    return [
+        checks.Warning(
+            'Кэш не общий для процессов: лимит одновременных запросов и дневной '
+            'лимит AI тренера считаются в каждом воркере отдельно.',
+            hint='Задайте REDIS_URL (см. README_DEPLOY.md, раздел 3.1).',
+            id='ai_coach.W001',
+        )
+    ]
@@ -0,0 +1,62 @@
+"""
+Management command для замера времени старта процесса с ленивым
+импортом SDK Gemini (ai_coach.providers) и без него
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Выполняется в отдельном процессе, чтобы каждый замер был «холодным».
+# Загрузка URLConf импортирует все представления - как при старте воркера.
+PROBE = """
+import time
+start = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+boot = time.perf_counter() - start
+sdk_loaded = 'google.generativeai' in __import__('sys').modules
+start = time.perf_counter()
+import google.generativeai
+sdk = time.perf_counter() - start
+print(boot, sdk, int(sdk_loaded))
+"""
+
+
+class Command(BaseCommand):
+    help = 'Замерить время старта Django и стоимость импорта google.generativeai'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Количество запусков (берётся медиана)',
+        )
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'boxer_platform.settings'))
+        boots, sdks = [], []
+        for _ in range(options['repeat']):
+            output = subprocess.run(
+                [sys.executable, '-W', 'ignore', '-c', PROBE],
+                cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+            ).stdout.split()
+            boot, sdk, sdk_loaded = float(output[0]), float(output[1]), output[2] == '1'
+            if sdk_loaded:
+                self.stdout.write(self.style.WARNING('SDK Gemini импортируется при старте - ленивый импорт не работает'))
+            boots.append(boot)
+            sdks.append(sdk)
+
+        boot = statistics.median(boots) * 1000
+        sdk = statistics.median(sdks) * 1000
+        self.stdout.write(f'Старт Django (ленивый импорт SDK): {boot:.0f} мс')
+        self.stdout.write(f'Импорт google.generativeai:       {sdk:.0f} мс')
+        self.stdout.write(self.style.SUCCESS(
+            f'Старт с импортом SDK при загрузке: {boot + sdk:.0f} мс, экономия {sdk / (boot + sdk):.0%}'
+        ))
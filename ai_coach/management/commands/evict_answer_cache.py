@@ -0,0 +1,18 @@
+"""
+Management command для очистки кэша ответов AI тренера
+(ai_coach.answer_cache): удаляет просроченные записи и давно не
+использованные сверх AI_ANSWER_CACHE_MAX_ENTRIES. Запускается по cron.
+"""
+from django.core.management.base import BaseCommand
+
+from ai_coach.answer_cache import evict
+
+
+class Command(BaseCommand):
+    help = 'Удалить просроченные и лишние записи кэша ответов AI тренера'
+
+    def handle(self, *args, **options):
+        expired, evicted = evict()
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено просроченных: {expired}, вытеснено сверх лимита: {evicted}'
+        ))
@@ -0,0 +1,157 @@
+"""
+Память диалога AI тренера.
+
+В запрос к AI вместе с вопросом уходят последние AI_MEMORY_TURNS реплик
+и краткий конспект (ConversationSummary) всего, что было раньше. Объём
+истории не растёт вместе с перепиской: build_context делает два
+индексированных запроса, а AI_PROMPT_TOKEN_BUDGET жёстко ограничивает
+размер запроса - старые реплики отбрасываются, конспект обрезается.
+
+Конспект обновляется в фоновом потоке, когда вне окна последних реплик
+накопилось AI_MEMORY_SUMMARY_LAG ещё не учтённых сообщений, поэтому
+ответ пользователю не ждёт суммаризации.
+
+История нужна только уточняющим вопросам (is_follow_up): коротким или
+ссылающимся на сказанное раньше («а левой?», «расскажи подробнее об
+этом»). Самостоятельный вопрос отвечается без истории, и такой ответ
+можно брать из общего кэша ответов (ai_coach.answer_cache) и класть в него.
+"""
+import re
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from . import providers
+from .models import ChatMessage, ConversationSummary
+
+# Грубая оценка числа токенов для русского текста
+CHARS_PER_TOKEN = 3
+# Меньше этого конспект не имеет смысла
+MIN_SUMMARY_TOKENS = 50
+# Сколько сообщений сворачивается в конспект за один проход
+SUMMARY_BATCH_SIZE = 40
+# Длина реплики, передаваемой на суммаризацию
+SUMMARY_TURN_CHARS = 600
+REFRESH_LOCK_TIMEOUT = 60 * 5
+
+# Вопрос короче считается уточнением предыдущего
+MIN_STANDALONE_WORDS = 3
+# Слова, отсылающие к предыдущим репликам
+FOLLOW_UP_WORDS = frozenset({
+    'это', 'этот', 'эта', 'эти', 'этого', 'этой', 'этому', 'этим', 'этом', 'этих',
+    'он', 'она', 'оно', 'они', 'его', 'ее', 'их', 'ему', 'ей', 'им', 'ним', 'нему',
+    'ней', 'них', 'там', 'тогда', 'такой', 'такое', 'такая', 'такие',
+    'подробнее', 'еще', 'выше', 'раньше', 'предыдущий', 'предыдущее', 'дальше',
+    'продолжи', 'продолжай', 'тоже', 'также',
+})
+# Союзы, с которых начинается продолжение разговора («а если левой?»)
+FOLLOW_UP_OPENERS = frozenset({'а', 'и', 'но', 'тогда'})
+WORD_RE = re.compile(r'\w+')
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _turn(role, text):
+    return {'role': role, 'parts': [text]}
+
+
+def is_follow_up(message):
+    """Вопрос продолжает разговор и без истории непонятен"""
+    words = WORD_RE.findall(message.lower().replace('ё', 'е'))
+    if len(words) < MIN_STANDALONE_WORDS or words[0] in FOLLOW_UP_OPENERS:
+        return True
+    return not FOLLOW_UP_WORDS.isdisjoint(words)
+
+
+def build_context(user, message):
+    """
+    История для запроса к AI. Ответ, полученный с историей, зависит
+    от переписки пользователя и не попадает в общий кэш ответов.
+    """
+    recent = list(
+        ChatMessage.objects.filter(user=user)
+        .order_by('-created_at')
+        .values_list('message', 'response')[:settings.AI_MEMORY_TURNS]
+    )
+    summary = ConversationSummary.objects.filter(user=user).values_list('summary', flat=True).first()
+
+    budget = settings.AI_PROMPT_TOKEN_BUDGET - estimate_tokens(message)
+    history = []
+    for question, answer in recent:
+        cost = estimate_tokens(question) + estimate_tokens(answer)
+        if cost > budget:
+            break
+        budget -= cost
+        history[:0] = [_turn('user', question), _turn('model', answer)]
+
+    if summary and budget >= MIN_SUMMARY_TOKENS:
+        summary = summary[:budget * CHARS_PER_TOKEN]
+        history[:0] = [
+            _turn('user', f'Краткое содержание нашего предыдущего разговора:\n{summary}'),
+            _turn('model', 'Понял, учту это в ответах.'),
+        ]
+    return history
+
+
+def _unsummarized(user_id, covered_until):
+    messages = ChatMessage.objects.filter(user_id=user_id)
+    if covered_until is not None:
+        messages = messages.filter(created_at__gt=covered_until)
+    return messages
+
+
+def maybe_refresh_summary(user_id):
+    """Запустить обновление конспекта в фоне, если он сильно отстал"""
+    covered_until = ConversationSummary.objects.filter(
+        user_id=user_id
+    ).values_list('covered_until', flat=True).first()
+    threshold = settings.AI_MEMORY_TURNS + settings.AI_MEMORY_SUMMARY_LAG
+    # Не считаем всю историю: достаточно знать, что сообщений не меньше порога
+    pending = _unsummarized(user_id, covered_until).values_list('id', flat=True)[:threshold]
+    if len(pending) < threshold:
+        return False
+    if not cache.add(f'ai-memory:refresh:{user_id}', 1, REFRESH_LOCK_TIMEOUT):
+        return False
+    threading.Thread(target=_refresh_summary, args=(user_id,), daemon=True).start()
+    return True
+
+
+def _refresh_summary(user_id):
+    try:
+        refresh_summary(user_id)
+    except providers.ProviderError:
+        # Конспект обновится при одном из следующих сообщений
+        pass
+    finally:
+        cache.delete(f'ai-memory:refresh:{user_id}')
+        connection.close()
+
+
+def refresh_summary(user_id):
+    """Свернуть в конспект сообщения старше окна последних реплик"""
+    summary, _ = ConversationSummary.objects.get_or_create(user_id=user_id)
+    window_start = ChatMessage.objects.filter(user_id=user_id).order_by(
+        '-created_at'
+    ).values_list('created_at', flat=True)[settings.AI_MEMORY_TURNS - 1:settings.AI_MEMORY_TURNS].first()
+    if window_start is None:
+        return summary
+    messages = list(
+        _unsummarized(user_id, summary.covered_until)
+        .filter(created_at__lt=window_start)
+        .order_by('created_at')[:SUMMARY_BATCH_SIZE]
+    )
+    if not messages:
+        return summary
+
+    lines = [f'Прежний конспект:\n{summary.summary or "(пусто)"}', '', 'Новые реплики:']
+    for chat_message in messages:
+        lines.append(f'Ученик: {chat_message.message[:SUMMARY_TURN_CHARS]}')
+        lines.append(f'Тренер: {chat_message.response[:SUMMARY_TURN_CHARS]}')
+    summary.summary = providers.summarize('\n'.join(lines)).strip()
+    summary.covered_until = messages[-1].created_at
+    summary.save(update_fields=['summary', 'covered_until', 'updated_at'])
+    return summary
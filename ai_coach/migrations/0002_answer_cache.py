@@ -0,0 +1,43 @@
+# Generated by Django 4.2.11 on 2026-10-18 08:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_coach', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question', models.TextField(verbose_name='Вопрос')),
+                ('normalized_question', models.TextField(verbose_name='Нормализованный вопрос')),
+                ('question_hash', models.CharField(max_length=64, unique=True)),
+                ('signature', models.JSONField(default=list)),
+                ('response', models.TextField(verbose_name='Ответ AI')),
+                ('hits', models.PositiveIntegerField(default=0, verbose_name='Попаданий')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_hit_at', models.DateTimeField(auto_now_add=True, verbose_name='Последнее использование')),
+                ('expires_at', models.DateTimeField(verbose_name='Действует до')),
+            ],
+            options={
+                'verbose_name': 'Кэшированный ответ',
+                'verbose_name_plural': 'Кэш ответов',
+                'ordering': ['-hits'],
+                'indexes': [models.Index(fields=['last_hit_at'], name='ai_coach_answer_lru_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AnswerCacheBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(db_index=True, max_length=40)),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bands', to='ai_coach.cachedanswer')),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.11 on 2026-10-18 08:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_coach', '0002_answer_cache'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['user', 'created_at'], name='ai_chat_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.11 on 2026-10-18 08:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_coach', '0004_conversation_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='sources',
+            field=models.JSONField(blank=True, default=list, verbose_name='Материалы'),
+        ),
+    ]
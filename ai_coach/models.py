@@ -9,12 +9,68 @@ class ChatMessage(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_messages')
     message = models.TextField(verbose_name="Сообщение пользователя")
     response = models.TextField(verbose_name="Ответ AI")
+    # Уроки и таймкоды, на которые опирался ответ (ai_coach.retrieval)
+    sources = models.JSONField(default=list, blank=True, verbose_name="Материалы")
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         verbose_name = "Сообщение чата"
         verbose_name_plural = "Сообщения чата"
         ordering = ['created_at']
+        indexes = [
+            # История и дневной лимит: диапазон created_at по пользователю
+            models.Index(fields=['user', 'created_at'], name='ai_chat_user_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
+
+
+class CachedAnswer(models.Model):
+    """
+    Ответ AI на часто задаваемый вопрос (ai_coach.answer_cache).
+    Похожие формулировки находятся по MinHash-сигнатуре через AnswerCacheBand.
+    """
+    question = models.TextField(verbose_name="Вопрос")
+    normalized_question = models.TextField(verbose_name="Нормализованный вопрос")
+    question_hash = models.CharField(max_length=64, unique=True)
+    signature = models.JSONField(default=list)
+    response = models.TextField(verbose_name="Ответ AI")
+    hits = models.PositiveIntegerField(default=0, verbose_name="Попаданий")
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(auto_now_add=True, verbose_name="Последнее использование")
+    expires_at = models.DateTimeField(verbose_name="Действует до")
+    
+    class Meta:
+        verbose_name = "Кэшированный ответ"
+        verbose_name_plural = "Кэш ответов"
+        ordering = ['-hits']
+        indexes = [
+            # Вытеснение давно не использованных записей (LRU)
+            models.Index(fields=['last_hit_at'], name='ai_coach_answer_lru_idx'),
+        ]
+    
+    def __str__(self):
+        return self.question[:50]
+
+
+class AnswerCacheBand(models.Model):
+    """Полоса LSH: записи с совпавшей полосой - кандидаты в похожие вопросы"""
+    entry = models.ForeignKey(CachedAnswer, on_delete=models.CASCADE, related_name='bands')
+    key = models.CharField(max_length=40, db_index=True)
+
+
+class ConversationSummary(models.Model):
+    """Сжатое содержание старой части диалога с AI тренером (ai_coach.memory)"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='coach_summary')
+    summary = models.TextField(blank=True, verbose_name="Краткое содержание")
+    # Сообщения с created_at <= covered_until уже учтены в summary
+    covered_until = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Память диалога"
+        verbose_name_plural = "Память диалогов"
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.updated_at.strftime('%Y-%m-%d %H:%M')}"
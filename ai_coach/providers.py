@@ -0,0 +1,322 @@
+"""
+Провайдеры AI для тренера.
+
+Провайдер выбирается настройкой AI_PROVIDER:
+- gemini - Google Gemini. SDK google.generativeai импортируется при первом
+  запросе к AI, а не при загрузке модуля: импорт занимает заметную долю
+  старта воркера и management-команд, которым AI не нужен
+  (см. benchmark_ai_startup). Модель создаётся один раз на процесс,
+  системный промпт передаётся как system_instruction;
+- stub - детерминированные ответы без сети для нагрузочного тестирования
+  чата (задержка AI_STUB_LATENCY).
+
+Каждый вызов ограничен сроком AI_PROVIDER_TIMEOUT секунд на все попытки.
+Временные сбои (таймаут, 429, 5xx) повторяются до AI_PROVIDER_RETRIES раз
+со случайной экспоненциальной паузой. Автомат защиты (CircuitBreaker)
+хранит счётчик сбоев в общем кэше: после AI_CIRCUIT_FAILURES сбоев подряд
+все воркеры на AI_CIRCUIT_RESET секунд сразу получают CircuitOpen, не
+дожидаясь таймаутов. Ошибки провайдера приводятся к ProviderError и его
+подклассам.
+
+history - предыдущие реплики в формате Gemini:
+[{'role': 'user' | 'model', 'parts': [текст]}, ...] (см. ai_coach.memory).
+"""
+import asyncio
+import hashlib
+import random
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+
+from .prompts import SUMMARY_PROMPT, SYSTEM_PROMPT
+
+GEMINI_MODEL = 'gemini-2.5-flash'
+INSTRUCTIONS = {
+    'coach': SYSTEM_PROMPT,
+    'summary': SUMMARY_PROMPT,
+}
+
+
+class ProviderError(Exception):
+    """Ошибка вызова AI"""
+    # Временный сбой: вызов можно повторить, учитывается автоматом защиты
+    transient = False
+
+
+class ProviderTimeout(ProviderError):
+    transient = True
+
+
+class ProviderRateLimited(ProviderError):
+    transient = True
+
+
+class ProviderUnavailable(ProviderError):
+    """Ошибка сервера провайдера или сети"""
+    transient = True
+
+
+class ProviderModelNotFound(ProviderError):
+    pass
+
+
+class CircuitOpen(ProviderError):
+    """Провайдер признан неработающим, вызов не выполнялся"""
+
+
+# --- Gemini ---
+
+_models = {}
+_model_lock = threading.Lock()
+
+
+def get_model(kind='coach'):
+    """Общий для процесса экземпляр GenerativeModel с инструкцией INSTRUCTIONS[kind]"""
+    model = _models.get(kind)
+    if model is None:
+        with _model_lock:
+            model = _models.get(kind)
+            if model is None:
+                import google.generativeai as genai
+
+                genai.configure(api_key=settings.GEMINI_API_KEY)
+                model = genai.GenerativeModel(GEMINI_MODEL, system_instruction=INSTRUCTIONS[kind])
+                _models[kind] = model
+    return model
+
+
+def _gemini_error(error):
+    """Исключение SDK -> ProviderError"""
+    from google.api_core import exceptions as api_exceptions
+
+    if isinstance(error, (api_exceptions.ResourceExhausted, api_exceptions.TooManyRequests)):
+        return ProviderRateLimited(str(error))
+    if isinstance(error, api_exceptions.NotFound):
+        return ProviderModelNotFound(str(error))
+    if isinstance(error, (api_exceptions.DeadlineExceeded, TimeoutError, asyncio.TimeoutError)):
+        return ProviderTimeout(str(error))
+    if isinstance(error, (api_exceptions.ServerError, ConnectionError)):
+        return ProviderUnavailable(str(error))
+    return ProviderError(str(error))
+
+
+class GeminiProvider:
+    name = 'gemini'
+
+    def is_configured(self):
+        return bool(settings.GEMINI_API_KEY)
+
+    def generate(self, kind, contents, timeout):
+        try:
+            return get_model(kind).generate_content(contents, request_options={'timeout': timeout}).text
+        except Exception as e:
+            raise _gemini_error(e) from e
+
+    async def stream(self, kind, contents, timeout):
+        try:
+            response = await get_model(kind).generate_content_async(
+                contents, stream=True, request_options={'timeout': timeout}
+            )
+            async for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            raise _gemini_error(e) from e
+
+
+# --- Заглушка ---
+
+STUB_REPLIES = [
+    'Держите подбородок опущенным, а руки - у лица.',
+    'Начните с трёх раундов по три минуты на груше с минутным отдыхом.',
+    'Удар идёт от толчка задней ноги и поворота корпуса, а не только от руки.',
+    'После каждой серии возвращайтесь в стойку и смещайтесь с линии атаки.',
+]
+
+
+class StubProvider:
+    """Детерминированный ответ по хэшу вопроса, без обращения к сети"""
+    name = 'stub'
+
+    def is_configured(self):
+        return True
+
+    def _reply(self, kind, contents):
+        message = contents[-1]['parts'][0]
+        if kind == 'summary':
+            return f'Конспект: {message[:200]}'
+        digest = hashlib.sha256(message.encode()).hexdigest()
+        return f'[stub {digest[:8]}] {STUB_REPLIES[int(digest, 16) % len(STUB_REPLIES)]}'
+
+    def generate(self, kind, contents, timeout):
+        if settings.AI_STUB_LATENCY > timeout:
+            time.sleep(timeout)
+            raise ProviderTimeout('stub: превышен срок ответа')
+        time.sleep(settings.AI_STUB_LATENCY)
+        return self._reply(kind, contents)
+
+    async def stream(self, kind, contents, timeout):
+        words = self._reply(kind, contents).split(' ')
+        # Задержка до первого фрагмента, дальше слова идут без пауз
+        await asyncio.sleep(settings.AI_STUB_LATENCY)
+        for index, word in enumerate(words):
+            yield word if index == 0 else f' {word}'
+
+
+PROVIDERS = {
+    'gemini': GeminiProvider,
+    'stub': StubProvider,
+}
+_providers = {}
+
+
+def get_provider():
+    name = settings.AI_PROVIDER
+    provider = _providers.get(name)
+    if provider is None:
+        if name not in PROVIDERS:
+            raise ImproperlyConfigured(f'Неизвестный AI_PROVIDER: {name}')
+        provider = _providers.setdefault(name, PROVIDERS[name]())
+    return provider
+
+
+def is_configured():
+    return get_provider().is_configured()
+
+
+# --- Автомат защиты и повторы ---
+
+class CircuitBreaker:
+    """Общий для всех процессов счётчик временных сбоев провайдера"""
+
+    def __init__(self, name):
+        self.failures_key = f'ai-circuit:{name}:failures'
+        self.open_key = f'ai-circuit:{name}:open'
+
+    def allow(self):
+        return cache.get(self.open_key) is None
+
+    def record_success(self):
+        cache.delete(self.failures_key)
+
+    def record_failure(self):
+        threshold = settings.AI_CIRCUIT_FAILURES
+        cache.add(self.failures_key, 0, settings.AI_CIRCUIT_WINDOW)
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            failures = 1
+            cache.set(self.failures_key, failures, settings.AI_CIRCUIT_WINDOW)
+        if failures >= threshold:
+            cache.set(self.open_key, 1, settings.AI_CIRCUIT_RESET)
+            # После паузы одного сбоя достаточно, чтобы снова разомкнуть цепь
+            cache.set(self.failures_key, threshold - 1, settings.AI_CIRCUIT_WINDOW + settings.AI_CIRCUIT_RESET)
+
+
+def _circuit_open_error():
+    return CircuitOpen('AI провайдер временно недоступен')
+
+
+def _backoff(attempt):
+    """Пауза перед повтором: случайная в [0, base * 2^attempt], не больше AI_PROVIDER_BACKOFF_MAX"""
+    return random.uniform(0, min(settings.AI_PROVIDER_BACKOFF * 2 ** attempt, settings.AI_PROVIDER_BACKOFF_MAX))
+
+
+def _should_retry(error, attempt, deadline):
+    """Пауза перед следующей попыткой или None, если повторять не нужно"""
+    if not error.transient or attempt >= settings.AI_PROVIDER_RETRIES:
+        return None
+    delay = _backoff(attempt)
+    if time.monotonic() + delay >= deadline:
+        return None
+    return delay
+
+
+def _call(kind, contents):
+    provider = get_provider()
+    breaker = CircuitBreaker(provider.name)
+    if not breaker.allow():
+        raise _circuit_open_error()
+    deadline = time.monotonic() + settings.AI_PROVIDER_TIMEOUT
+    attempt = 0
+    while True:
+        try:
+            result = provider.generate(kind, contents, deadline - time.monotonic())
+        except ProviderError as e:
+            if e.transient:
+                breaker.record_failure()
+            delay = _should_retry(e, attempt, deadline)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            if not breaker.allow():
+                raise _circuit_open_error() from e
+            attempt += 1
+        else:
+            breaker.record_success()
+            return result
+
+
+async def _stream(kind, contents):
+    """
+    Фрагменты ответа. Срок действует на весь поток; повтор возможен,
+    только пока клиенту не отдано ни одного фрагмента.
+    """
+    provider = get_provider()
+    breaker = CircuitBreaker(provider.name)
+    if not await sync_to_async(breaker.allow)():
+        raise _circuit_open_error()
+    deadline = time.monotonic() + settings.AI_PROVIDER_TIMEOUT
+    attempt = 0
+    while True:
+        started = False
+        chunks = provider.stream(kind, contents, deadline - time.monotonic())
+        try:
+            while True:
+                try:
+                    text = await asyncio.wait_for(chunks.__anext__(), deadline - time.monotonic())
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise ProviderTimeout('Превышен срок ответа AI')
+                started = True
+                yield text
+        except ProviderError as e:
+            if e.transient:
+                await sync_to_async(breaker.record_failure)()
+            delay = None if started else _should_retry(e, attempt, deadline)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            if not await sync_to_async(breaker.allow)():
+                raise _circuit_open_error() from e
+            attempt += 1
+        else:
+            await sync_to_async(breaker.record_success)()
+            return
+        finally:
+            await chunks.aclose()
+
+
+def _contents(message, history):
+    return [*(history or []), {'role': 'user', 'parts': [message]}]
+
+
+def generate_reply(message, history=None):
+    """Ответ AI тренера целиком"""
+    return _call('coach', _contents(message, history))
+
+
+async def stream_reply(message, history=None):
+    """Ответ AI тренера фрагментами по мере генерации"""
+    async for text in _stream('coach', _contents(message, history)):
+        yield text
+
+
+def summarize(text):
+    """Обновлённый конспект диалога (см. ai_coach.memory)"""
+    return _call('summary', _contents(text, None))
@@ -0,0 +1,83 @@
+"""
+Дневной лимит сообщений AI тренеру.
+
+Счётчик сообщений пользователя за текущие сутки (по TIME_ZONE, Москва)
+хранится в общем кэше и увеличивается атомарным incr до вызова AI, поэтому
+параллельные запросы не проскакивают лимит, а проверка стоит O(1).
+Если ключа нет (первое сообщение за день, вытеснение, рестарт Redis),
+он заполняется подсчётом ChatMessage за полуинтервал
+[начало суток, начало следующих суток) по индексу (user, created_at).
+
+Очистка истории чата не уменьшает счётчик в кэше, поэтому лимит
+нельзя обойти удалением сообщений.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from courses.entitlements import get_purchased_course_ids
+from .models import ChatMessage
+
+
+def day_bounds(now=None):
+    """Начало текущих и следующих суток в локальном часовом поясе"""
+    today = timezone.localdate(now)
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(today, time.min), tz)
+    end = timezone.make_aware(datetime.combine(today + timedelta(days=1), time.min), tz)
+    return start, end
+
+
+def get_tier(user):
+    """'paid' - есть доступ хотя бы к одному курсу, иначе 'free'"""
+    return 'paid' if get_purchased_course_ids(user) else 'free'
+
+
+def get_daily_limit(user):
+    return settings.AI_DAILY_MESSAGE_LIMITS[get_tier(user)]
+
+
+def _counter_key(user_id, start):
+    return f'ai-quota:{user_id}:{start.date().isoformat()}'
+
+
+def _seed_counter(user, key, start, end):
+    """Заполнить счётчик из БД, если его нет в кэше"""
+    if cache.get(key) is None:
+        used = ChatMessage.objects.filter(user=user, created_at__gte=start, created_at__lt=end).count()
+        # Ключ живёт до конца суток (с запасом на расхождение часов)
+        timeout = int((end - timezone.now()).total_seconds()) + 60
+        cache.add(key, used, timeout)
+
+
+def get_usage(user):
+    """{'used', 'limit', 'remaining', 'resets_at'} на текущие сутки"""
+    start, end = day_bounds()
+    key = _counter_key(user.id, start)
+    _seed_counter(user, key, start, end)
+    used = cache.get(key, 0)
+    limit = get_daily_limit(user)
+    return {'used': used, 'limit': limit, 'remaining': max(limit - used, 0), 'resets_at': end}
+
+
+def try_consume(user):
+    """
+    Занять одно сообщение из дневного лимита.
+    Возвращает (allowed, limit); при отказе счётчик не меняется.
+    """
+    start, end = day_bounds()
+    key = _counter_key(user.id, start)
+    limit = get_daily_limit(user)
+    _seed_counter(user, key, start, end)
+    try:
+        used = cache.incr(key)
+    except ValueError:
+        # Ключ вытеснен между заполнением и incr - считаем по БД
+        used = ChatMessage.objects.filter(user=user, created_at__gte=start, created_at__lt=end).count() + 1
+        cache.set(key, used, int((end - timezone.now()).total_seconds()) + 60)
+    if used > limit:
+        cache.decr(key)
+        return False, limit
+    return True, limit
@@ -0,0 +1,409 @@
+"""
+Поиск по материалам платформы для ответов AI тренера (BM25 в памяти процесса).
+
+Документы индекса:
+- урок: название (с двойным весом) и текстовое описание;
+- таймкод урока: подпись из Lesson.timestamps, ссылка ведёт на момент видео;
+- курс: название и полное описание.
+Слова приводятся к основе упрощённым стеммером русского языка
+(отсечение типичных окончаний), стоп-слова отбрасываются.
+
+Индекс строится в фоновом потоке при первом поиске (до этого поиск
+возвращает пустой список) и обновляется инкрементально: в своём процессе -
+сигналами Lesson/Course (ai_coach.signals), которые также пишут ID
+изменённого курса в общий журнал в кэше (record_change). Другие процессы
+при поиске сверяют номер последней записи журнала и в фоне переиндексируют
+только перечисленные курсы. Если журнал неполон (записи вытеснены или
+их слишком много), а также раз в AI_RETRIEVAL_REBUILD_INTERVAL секунд
+(изменения через QuerySet.update() сигналов не дают) индекс строится
+заново в фоне и подменяет текущий целиком.
+
+Размер индекса ограничен: не больше AI_RETRIEVAL_MAX_DOCUMENTS документов
+и AI_RETRIEVAL_MAX_TEXT_CHARS символов текста урока или курса.
+"""
+import heapq
+import math
+import re
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from courses.models import Course
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+TITLE_WEIGHT = 2
+SNIPPET_CHARS = 300
+
+JOURNAL_SEQ_KEY = 'ai-retrieval:seq'
+JOURNAL_TIMEOUT = 60 * 60 * 24
+# При большем числе изменений дешевле перестроить индекс целиком
+MAX_JOURNAL_CHANGES = 500
+# Сколько ждать запись журнала, номер которой уже выдан incr
+JOURNAL_GRACE = 5
+
+WORD_RE = re.compile(r'\w+')
+STOP_WORDS = frozenset(
+    'и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только '
+    'ее мне было вот от меня еще нет о из ему теперь когда даже ну вдруг ли если уже или ни '
+    'быть был него до вас нибудь опять уж вам ведь там потом себя ничего ей может они тут где '
+    'есть надо ней для мы тебя их чем была сам чтоб без будто чего раз тоже себе под будет ж '
+    'тогда кто этот того потому этого какой совсем ним здесь этом один почти мой тем чтобы нее '
+    'сейчас были куда зачем всех никогда можно при наконец два об другой хоть после над больше '
+    'тот через эти нас про всего них какая много разве три эту моя впрочем хорошо свою этой '
+    'перед иногда лучше чуть том нельзя такой им более всегда конечно всю между '
+    'правильно нужно'.split()
+)
+# Окончания по убыванию длины: отсекается самое длинное подходящее
+SUFFIXES = sorted(
+    set(
+        'иями ями ами ией ием иях ях ах ов ев ей ий ый ой ая яя ое ее ые ие ого его ому ему '
+        'ым им ом ем ую юю ешь ет ете ют ут ишь ит ите ят ат ал ала али ило ил ила или '
+        'ать ять еть ить уть ться тся ся сь ость ости ия ья ье ию ью иям ам а я о е и ы у ю ь'.split()
+    ),
+    key=len,
+    reverse=True,
+)
+MIN_STEM_LENGTH = 3
+
+
+@lru_cache(maxsize=100_000)
+def stem(word):
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM_LENGTH:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text):
+    return [
+        stem(word)
+        for word in WORD_RE.findall(text.lower().replace('ё', 'е'))
+        if word not in STOP_WORDS and len(word) > 1
+    ]
+
+
+def parse_timecode(value):
+    """'04:20' или '1:04:20' -> секунды; None, если формат не распознан"""
+    try:
+        seconds = 0
+        for part in str(value).split(':'):
+            seconds = seconds * 60 + int(part)
+        return seconds
+    except ValueError:
+        return None
+
+
+def _lesson_documents(lesson):
+    """(doc_id, токены, описание для ответа) для урока и его таймкодов"""
+    course = lesson.course
+    source = {
+        'course_id': course.id,
+        'course_slug': course.slug,
+        'course_title': course.title,
+        'lesson_id': lesson.id,
+        'lesson_title': lesson.title,
+        'lesson_order': lesson.order_index,
+        'timecode': None,
+        'seconds': None,
+    }
+    text = (lesson.text_content or '')[:settings.AI_RETRIEVAL_MAX_TEXT_CHARS]
+    yield (
+        ('lesson', lesson.id, None),
+        tokenize(lesson.title) * TITLE_WEIGHT + tokenize(text),
+        dict(source, snippet=text[:SNIPPET_CHARS]),
+    )
+    for index, item in enumerate(lesson.timestamps or []):
+        if not isinstance(item, dict) or not item.get('label'):
+            continue
+        label = str(item['label'])
+        yield (
+            ('timestamp', lesson.id, index),
+            tokenize(label),
+            dict(
+                source,
+                timecode=str(item.get('time', '')),
+                seconds=parse_timecode(item.get('time', '')),
+                snippet=label,
+            ),
+        )
+
+
+def _course_document(course):
+    text = (course.full_description or '')[:settings.AI_RETRIEVAL_MAX_TEXT_CHARS]
+    return (
+        ('course', course.id, None),
+        tokenize(course.title) * TITLE_WEIGHT + tokenize(text),
+        {
+            'course_id': course.id,
+            'course_slug': course.slug,
+            'course_title': course.title,
+            'lesson_id': None,
+            'lesson_title': None,
+            'lesson_order': None,
+            'timecode': None,
+            'seconds': None,
+            'snippet': text[:SNIPPET_CHARS],
+        },
+    )
+
+
+class LessonIndex:
+    """Инвертированный индекс с ранжированием BM25"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # Одна фоновая синхронизация на процесс
+        self._sync_lock = threading.Lock()
+        self.built = False
+        self.built_at = None      # time.monotonic() последней полной перестройки
+        self.seq = 0              # последняя учтённая запись журнала
+        self._gap = None          # (номер, с какого момента) отсутствующей записи журнала
+        self._reset()
+
+    def _reset(self):
+        self.postings = {}        # термин -> {doc_id: tf}
+        self.doc_lengths = {}     # doc_id -> число токенов
+        self.doc_sources = {}     # doc_id -> описание для ответа
+        self.doc_terms = {}       # doc_id -> термины (для удаления)
+        self.lesson_docs = {}     # lesson_id -> doc_id урока и таймкодов
+        self.course_lessons = {}  # course_id -> ID уроков (все проиндексированные курсы)
+        self.total_length = 0
+        self._norms = None        # doc_id -> знаменатель BM25, сбрасывается при изменениях
+
+    # --- изменение индекса ---
+
+    def _add_document(self, doc_id, tokens, source):
+        if len(self.doc_lengths) >= settings.AI_RETRIEVAL_MAX_DOCUMENTS:
+            return False
+        counts = Counter(tokens)
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        self.doc_terms[doc_id] = tuple(counts)
+        self.doc_lengths[doc_id] = len(tokens)
+        self.doc_sources[doc_id] = source
+        self.total_length += len(tokens)
+        self._norms = None
+        return True
+
+    def _remove_document(self, doc_id):
+        for term in self.doc_terms.pop(doc_id, ()):
+            docs = self.postings[term]
+            docs.pop(doc_id, None)
+            if not docs:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc_id, 0)
+        self.doc_sources.pop(doc_id, None)
+        self._norms = None
+
+    def remove_lesson(self, lesson_id):
+        with self._lock:
+            for doc_id in self.lesson_docs.pop(lesson_id, ()):
+                self._remove_document(doc_id)
+            for lesson_ids in self.course_lessons.values():
+                lesson_ids.discard(lesson_id)
+
+    def update_lesson(self, lesson):
+        """Переиндексировать урок (lesson.course должен быть загружен)"""
+        with self._lock:
+            self.remove_lesson(lesson.id)
+            if not lesson.course.is_active:
+                return
+            doc_ids = [
+                doc_id
+                for doc_id, tokens, source in _lesson_documents(lesson)
+                if self._add_document(doc_id, tokens, source)
+            ]
+            self.lesson_docs[lesson.id] = doc_ids
+            self.course_lessons.setdefault(lesson.course_id, set()).add(lesson.id)
+
+    def remove_course(self, course_id):
+        with self._lock:
+            self._remove_document(('course', course_id, None))
+            for lesson_id in list(self.course_lessons.pop(course_id, ())):
+                self.remove_lesson(lesson_id)
+
+    def update_course(self, course):
+        """Переиндексировать курс вместе с уроками (название курса есть в ссылках уроков)"""
+        with self._lock:
+            self.remove_course(course.id)
+            if not course.is_active:
+                return
+            self._add_document(*_course_document(course))
+            self.course_lessons.setdefault(course.id, set())
+            for lesson in course.lessons.all():
+                lesson.course = course
+                self.update_lesson(lesson)
+
+    # --- синхронизация с БД ---
+
+    def update_courses(self, course_ids):
+        """Переиндексировать курсы по ID (неактивные и удалённые убираются)"""
+        courses = {
+            course.id: course
+            for course in Course.objects.filter(id__in=course_ids, is_active=True).prefetch_related('lessons')
+        }
+        with self._lock:
+            for course_id in course_ids:
+                if course_id in courses:
+                    self.update_course(courses[course_id])
+                else:
+                    self.remove_course(course_id)
+
+    def build(self, seq=None):
+        """Построить индекс заново и подменить им текущий"""
+        seq = cache.get(JOURNAL_SEQ_KEY, 0) if seq is None else seq
+        fresh = LessonIndex()
+        for course in Course.objects.filter(is_active=True).prefetch_related('lessons'):
+            fresh.update_course(course)
+        fresh._get_norms()
+        with self._lock:
+            for name in ('postings', 'doc_lengths', 'doc_sources', 'doc_terms',
+                         'lesson_docs', 'course_lessons', 'total_length', '_norms'):
+                setattr(self, name, getattr(fresh, name))
+            self.built, self.built_at, self.seq, self._gap = True, time.monotonic(), seq, None
+
+    def _journal_changes(self, seq):
+        """
+        (ID курсов, номер, до которого журнал прочитан) после self.seq;
+        ID курсов None - журнал неполон и индекс нужно перестроить.
+        """
+        if seq - self.seq > MAX_JOURNAL_CHANGES:
+            return None, seq
+        numbers = range(self.seq + 1, seq + 1)
+        values = cache.get_many([_journal_key(number) for number in numbers])
+        course_ids = set()
+        for number in numbers:
+            course_id = values.get(_journal_key(number))
+            if course_id is None:
+                # Номер выдан, но запись может быть ещё не сделана писателем
+                if self._gap is None or self._gap[0] != number:
+                    self._gap = (number, time.monotonic())
+                if time.monotonic() - self._gap[1] > JOURNAL_GRACE:
+                    return None, seq
+                return course_ids, number - 1
+            course_ids.add(course_id)
+        return course_ids, seq
+
+    def _stale(self):
+        return not self.built or time.monotonic() - self.built_at > settings.AI_RETRIEVAL_REBUILD_INTERVAL
+
+    def refresh(self):
+        """Подхватить изменения каталога (синхронно)"""
+        with self._sync_lock:
+            self._refresh()
+
+    def _refresh(self):
+        seq = cache.get(JOURNAL_SEQ_KEY, 0)
+        if self._stale():
+            self.build(seq)
+            return
+        if seq == self.seq:
+            return
+        course_ids, seq = self._journal_changes(seq)
+        if course_ids is None:
+            self.build()
+            return
+        self.update_courses(course_ids)
+        with self._lock:
+            self.seq = seq
+            self._get_norms()
+
+    def _refresh_in_background(self):
+        try:
+            self._refresh()
+        finally:
+            self._sync_lock.release()
+            connection.close()
+
+    def sync(self):
+        """
+        Запустить обновление в фоновом потоке, если журнал изменений ушёл
+        вперёд или индекс устарел. Поиск не ждёт и идёт по текущему индексу.
+        """
+        if not self._stale() and cache.get(JOURNAL_SEQ_KEY, 0) == self.seq:
+            return False
+        if not self._sync_lock.acquire(blocking=False):
+            return False
+        threading.Thread(target=self._refresh_in_background, daemon=True).start()
+        return True
+
+    # --- поиск ---
+
+    def _get_norms(self):
+        """k1 * (1 - b + b * |d| / avgdl) для всех документов"""
+        if self._norms is None:
+            average_length = self.total_length / (len(self.doc_lengths) or 1) or 1
+            self._norms = {
+                doc_id: BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                for doc_id, length in self.doc_lengths.items()
+            }
+        return self._norms
+
+    def search(self, query, limit=3):
+        """Лучшие limit документов: [(score, описание), ...]"""
+        terms = set(tokenize(query))
+        with self._lock:
+            documents = len(self.doc_lengths)
+            if not terms or not documents:
+                return []
+            norms = self._get_norms()
+            scores = {}
+            get_score = scores.get
+            for term in terms:
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (documents - len(docs) + 0.5) / (len(docs) + 0.5))
+                weight = idf * (BM25_K1 + 1)
+                for doc_id, tf in docs.items():
+                    scores[doc_id] = get_score(doc_id, 0.0) + weight * tf / (tf + norms[doc_id])
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            return [(score, self.doc_sources[doc_id]) for doc_id, score in best]
+
+
+def _journal_key(seq):
+    return f'ai-retrieval:change:{seq}'
+
+
+def record_change(course_id):
+    """Записать изменённый курс в общий журнал для индексов других процессов"""
+    cache.add(JOURNAL_SEQ_KEY, 0, None)
+    seq = cache.incr(JOURNAL_SEQ_KEY)
+    cache.set(_journal_key(seq), course_id, JOURNAL_TIMEOUT)
+    return seq
+
+
+lesson_index = LessonIndex()
+
+
+def retrieve(query, limit=None):
+    """Материалы платформы, относящиеся к вопросу (см. ChatMessage.sources)"""
+    lesson_index.sync()
+    return [source for _, source in lesson_index.search(query, limit or settings.AI_RETRIEVAL_TOP_K)]
+
+
+def format_sources(sources):
+    """Блок с материалами для вставки в запрос к AI"""
+    lines = []
+    for number, source in enumerate(sources, 1):
+        if source['lesson_id'] is None:
+            where = f'Курс «{source["course_title"]}»'
+        else:
+            where = f'Курс «{source["course_title"]}», урок «{source["lesson_title"]}»'
+            if source['timecode']:
+                where += f', таймкод {source["timecode"]}'
+        lines.append(f'[{number}] {where}: {source["snippet"]}')
+    return '\n'.join(lines)
+
+
+def augment_question(message, sources):
+    """Вопрос ученика с найденными материалами для запроса к AI"""
+    if not sources:
+        return message
+    return f'Материалы платформы:\n{format_sources(sources)}\n\nВопрос ученика: {message}'
@@ -5,8 +5,8 @@ from .models import ChatMessage
 class ChatMessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ChatMessage
-        fields = ('id', 'message', 'response', 'created_at')
-        read_only_fields = ('id', 'response', 'created_at')
+        fields = ('id', 'message', 'response', 'sources', 'created_at')
+        read_only_fields = ('id', 'response', 'sources', 'created_at')
 
 
 class SendMessageSerializer(serializers.Serializer):
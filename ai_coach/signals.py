@@ -0,0 +1,33 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from courses.models import Course, Lesson
+from .retrieval import lesson_index, record_change
+
+
+@receiver(post_save, sender=Lesson)
+def lesson_saved(sender, instance, **kwargs):
+    """Переиндексировать урок для поиска AI тренера, если индекс уже построен"""
+    if lesson_index.built:
+        lesson_index.update_lesson(instance)
+    record_change(instance.course_id)
+
+
+@receiver(post_delete, sender=Lesson)
+def lesson_deleted(sender, instance, **kwargs):
+    if lesson_index.built:
+        lesson_index.remove_lesson(instance.id)
+    record_change(instance.course_id)
+
+
+@receiver(post_save, sender=Course)
+def course_saved(sender, instance, **kwargs):
+    if lesson_index.built:
+        lesson_index.update_course(instance)
+    record_change(instance.id)
+
+
+@receiver(post_delete, sender=Course)
+def course_deleted(sender, instance, **kwargs):
+    if lesson_index.built:
+        lesson_index.remove_course(instance.id)
+    record_change(instance.id)
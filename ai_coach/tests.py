@@ -0,0 +1,284 @@
+from collections import Counter
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from courses.models import Course, Lesson
+
+from . import admission, answer_cache
+from .admission import AdmissionRejected, LocalTicket, Ticket
+from .checks import check_shared_cache
+from .models import AnswerCacheBand, CachedAnswer
+from .retrieval import JOURNAL_GRACE, JOURNAL_SEQ_KEY, LessonIndex
+
+QUESTION = 'Как правильно держать руки в стойке?'
+
+
+class AnswerCacheTest(TestCase):
+    """Поиск похожих вопросов по MinHash, запись и вытеснение кэша ответов"""
+
+    def test_lookup_and_store(self):
+        self.assertIsNone(answer_cache.lookup(QUESTION))
+        entry = answer_cache.store(QUESTION, 'Подбородок прикрыт, локти у корпуса.')
+        self.assertEqual(entry.bands.count(), answer_cache.BANDS)
+
+        # Тот же вопрос в другом написании и похожая формулировка
+        for question in ('как правильно держать руки в стойке', 'Как правильно держать руки в стойке боксёра?'):
+            hit = answer_cache.lookup(question)
+            self.assertEqual(hit.id, entry.id)
+        self.assertIsNone(answer_cache.lookup('Как правильно бить джеб?'))
+
+        entry.refresh_from_db()
+        self.assertEqual(entry.hits, 2)
+
+    def test_store_is_idempotent_and_does_not_count(self):
+        answer_cache.store(QUESTION, 'Первый ответ')
+        with CaptureQueriesContext(connection) as queries:
+            answer_cache.store('КАК правильно держать руки в стойке', 'Второй ответ')
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql'].upper()])
+
+        entry = CachedAnswer.objects.get()
+        self.assertEqual(entry.response, 'Второй ответ')
+        self.assertEqual(AnswerCacheBand.objects.count(), answer_cache.BANDS)
+
+    def test_expired_entry_is_not_returned(self):
+        answer_cache.store(QUESTION, 'Ответ')
+        CachedAnswer.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(answer_cache.lookup(QUESTION))
+
+    @override_settings(AI_ANSWER_CACHE_MAX_ENTRIES=2)
+    def test_evict_expired_and_least_recently_used(self):
+        now = timezone.now()
+        questions = ['Как бить джеб?', 'Как бить хук?', 'Как бить апперкот?', 'Как делать нырок?']
+        for minutes, question in enumerate(questions):
+            answer_cache.store(question, 'Ответ')
+            CachedAnswer.objects.filter(question=question).update(last_hit_at=now - timedelta(minutes=10 - minutes))
+        CachedAnswer.objects.filter(question=questions[3]).update(expires_at=now)
+
+        self.assertEqual(answer_cache.evict(), (1, 1))
+        self.assertEqual(
+            sorted(CachedAnswer.objects.values_list('question', flat=True)),
+            sorted(questions[1:3]),
+        )
+        self.assertEqual(AnswerCacheBand.objects.count(), 2 * answer_cache.BANDS)
+
+        out = StringIO()
+        call_command('evict_answer_cache', stdout=out)
+        self.assertIn('Удалено просроченных: 0, вытеснено сверх лимита: 0', out.getvalue())
+
+
+class LessonIndexTest(TestCase):
+    """Индекс материалов AI тренера: построение, сигналы и журнал изменений"""
+
+    def setUp(self):
+        cache.clear()
+        # Индекс этого процесса, который обновляют сигналы
+        self.index = LessonIndex()
+        patcher = mock.patch('ai_coach.signals.lesson_index', self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.course = Course.objects.create(
+            title='Основы бокса', slug='osnovy', description='d', full_description='Стойка и передвижения', price=10,
+        )
+        self.jab = Lesson.objects.create(
+            course=self.course, title='Джеб', text_content='Прямой удар передней рукой',
+            timestamps=[{'time': '1:30', 'label': 'Работа ног'}, {'time': 'x', 'label': ''}],
+        )
+        self.other_course = Course.objects.create(
+            title='Защита', slug='zashchita', description='d', full_description='Нырки и уклоны', price=10,
+        )
+        self.slip = Lesson.objects.create(course=self.other_course, title='Уклон', text_content='Уход с линии атаки')
+        Course.objects.create(
+            title='Черновик', slug='chernovik', description='d', full_description='Апперкот', price=10, is_active=False,
+        )
+
+    def titles(self, index, query):
+        return [source['lesson_title'] or source['course_title'] for _, source in index.search(query, limit=10)]
+
+    def test_build_and_search(self):
+        self.index.build()
+
+        self.assertEqual(self.titles(self.index, 'как бить джеб'), ['Джеб'])
+        self.assertEqual(self.titles(self.index, 'нырки'), ['Защита'])
+        self.assertEqual(self.titles(self.index, 'апперкот'), [])
+        self.assertEqual(self.index.search('и как', limit=10), [])
+
+        _, source = self.index.search('работа ног')[0]
+        self.assertEqual((source['lesson_id'], source['timecode'], source['seconds']), (self.jab.id, '1:30', 90))
+
+    def test_signals_update_built_index(self):
+        self.index.build()
+
+        self.jab.title = 'Кросс'
+        self.jab.save()
+        self.assertEqual(self.titles(self.index, 'кросс'), ['Кросс'])
+        self.assertEqual(self.titles(self.index, 'джеб'), [])
+
+        self.other_course.is_active = False
+        self.other_course.save()
+        self.assertEqual(self.titles(self.index, 'уклон нырки'), [])
+
+        self.jab.delete()
+        self.assertEqual(self.titles(self.index, 'кросс удар'), [])
+        self.assertEqual(self.titles(self.index, 'стойка'), ['Основы бокса'])
+
+    def test_refresh_reindexes_changed_courses_from_journal(self):
+        # Индекс другого процесса видит изменения только через журнал
+        other = LessonIndex()
+        other.build()
+        self.jab.title = 'Кросс'
+        self.jab.save()
+        self.other_course.is_active = False
+        self.other_course.save()
+        self.assertEqual(self.titles(other, 'джеб'), ['Джеб'])
+
+        with mock.patch.object(other, 'build', wraps=other.build) as build, \
+                mock.patch.object(other, 'update_courses', wraps=other.update_courses) as update_courses:
+            other.refresh()
+            other.refresh()
+        build.assert_not_called()
+        update_courses.assert_called_once_with({self.course.id, self.other_course.id})
+        self.assertEqual(other.seq, cache.get(JOURNAL_SEQ_KEY))
+        self.assertEqual(self.titles(other, 'кросс'), ['Кросс'])
+        self.assertEqual(self.titles(other, 'уклон нырки'), [])
+
+    def test_missing_journal_entry_rebuilds_after_grace(self):
+        other = LessonIndex()
+        other.build()
+        # Номер выдан, а запись журнала так и не появилась
+        seq = cache.incr(JOURNAL_SEQ_KEY)
+
+        other.refresh()
+        self.assertEqual(other.seq, seq - 1)
+
+        Lesson.objects.filter(id=self.jab.id).update(title='Кросс')
+        gap_started = other._gap[1]
+        with mock.patch('ai_coach.retrieval.time.monotonic', return_value=gap_started + JOURNAL_GRACE + 1):
+            other.refresh()
+        self.assertEqual(other.seq, seq)
+        self.assertEqual(self.titles(other, 'кросс'), ['Кросс'])
+
+    @override_settings(AI_RETRIEVAL_MAX_DOCUMENTS=3)
+    def test_document_limit(self):
+        self.index.build()
+        self.assertEqual(len(self.index.doc_lengths), 3)
+
+        self.slip.save()
+        self.assertEqual(len(self.index.doc_lengths), 3)
+
+
+@override_settings(AI_MAX_IN_FLIGHT=1, AI_ADMISSION_QUEUE_SIZE=2)
+class LocalAdmissionTest(SimpleTestCase):
+    """Допуск к AI тренеру без общего кэша: лимит и очередь процесса"""
+
+    def setUp(self):
+        patcher = mock.patch.dict(admission._local, {'in_flight': 0, 'waiting': Counter()})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_admit_queue_and_reject(self):
+        holder = LocalTicket('free')
+        self.assertTrue(holder.try_admit())
+
+        free, paid = LocalTicket('free'), LocalTicket('paid')
+        self.assertFalse(free.try_admit())
+        self.assertTrue(free.enqueue(1))
+        self.assertTrue(paid.enqueue(1))
+        self.assertFalse(LocalTicket('free').enqueue(1))
+
+        holder.release()
+        # Пока ждёт владелец курса, бесплатный запрос не проходит
+        self.assertFalse(free.try_admit())
+        self.assertTrue(paid.try_admit())
+        self.assertFalse(free.try_admit())
+        paid.release()
+        self.assertTrue(free.try_admit())
+        free.release()
+        self.assertEqual(admission._local, {'in_flight': 0, 'waiting': Counter()})
+
+    @override_settings(AI_ADMISSION_WAIT={'free': 0.1, 'paid': 0.1})
+    def test_acquire_rejects_when_full_or_timed_out(self):
+        holder = LocalTicket('paid')
+        holder.try_admit()
+        with mock.patch('ai_coach.admission.get_tier', return_value='free'):
+            with self.assertRaises(AdmissionRejected) as rejected:
+                admission.acquire(None)
+            self.assertEqual(rejected.exception.retry_after, settings.AI_ADMISSION_RETRY_AFTER)
+            self.assertEqual(sum(admission._local['waiting'].values()), 0)
+
+            with override_settings(AI_ADMISSION_QUEUE_SIZE=0), self.assertRaises(AdmissionRejected):
+                admission.acquire(None)
+
+            holder.release()
+            ticket = admission.acquire(None)
+        self.assertIsInstance(ticket, LocalTicket)
+        ticket.release()
+
+
+@override_settings(AI_MAX_IN_FLIGHT=1, AI_ADMISSION_QUEUE_SIZE=2)
+class SharedAdmissionTest(SimpleTestCase):
+    """Допуск к AI тренеру через общий кэш: слоты и очереди FIFO по уровням"""
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('ai_coach.admission.is_shared_cache', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.holder = admission._new_ticket('free')
+        self.assertIsInstance(self.holder, Ticket)
+        self.assertTrue(self.holder.try_admit())
+
+    def queued(self, tier):
+        ticket = Ticket(tier)
+        self.assertFalse(ticket.try_admit())
+        self.assertTrue(ticket.enqueue(1))
+        return ticket
+
+    def test_fifo_within_tier(self):
+        first, second = self.queued('free'), self.queued('free')
+        self.assertFalse(Ticket('paid').enqueue(1))
+
+        self.holder.release()
+        self.assertFalse(second.try_admit())
+        self.assertTrue(first.try_admit())
+        self.assertFalse(second.try_admit())
+        first.release()
+        self.assertTrue(second.try_admit())
+        # Очередь пуста, новый запрос проходит сразу после освобождения слота
+        second.release()
+        self.assertTrue(Ticket('free').try_admit())
+
+    def test_paid_queue_goes_first(self):
+        free, paid = self.queued('free'), self.queued('paid')
+
+        self.holder.release()
+        self.assertFalse(free.try_admit())
+        self.assertTrue(paid.try_admit())
+        paid.release()
+        self.assertTrue(free.try_admit())
+
+    def test_abandoned_head_is_skipped(self):
+        crashed, waiting = self.queued('free'), self.queued('free')
+        # Воркер упал: ключ номера истёк, голову очереди никто не сдвинул
+        cache.delete(admission._number_key('free', crashed.number))
+
+        self.holder.release()
+        self.assertTrue(waiting.try_admit())
+
+
+class SharedCacheCheckTest(SimpleTestCase):
+    @override_settings(DEBUG=False)
+    def test_warns_without_shared_cache(self):
+        with mock.patch('ai_coach.checks.is_shared_cache', return_value=False):
+            self.assertEqual([message.id for message in check_shared_cache(None)], ['ai_coach.W001'])
+        with mock.patch('ai_coach.checks.is_shared_cache', return_value=True):
+            self.assertEqual(check_shared_cache(None), [])
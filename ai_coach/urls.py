@@ -1,8 +1,11 @@
 from django.urls import path
 from . import views
 
+# stream/ (views.stream_message) подключён только в boxer_platform.asgi_urls:
+# под WSGI потоковый ответ буферизуется целиком и занимает воркер
 urlpatterns = [
     path('send/', views.send_message, name='send_message'),
     path('history/', views.get_chat_history, name='chat_history'),
+    path('quota/', views.get_quota, name='chat_quota'),
     path('clear/', views.clear_chat_history, name='clear_chat'),
 ]
@@ -1,48 +1,39 @@
-import google.generativeai as genai
-from django.conf import settings
-from django.utils import timezone
-from rest_framework import status
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework import exceptions, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .models import ChatMessage
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from . import admission, answer_cache, memory, providers, quota, retrieval
+from .models import ChatMessage, ConversationSummary
 from .serializers import ChatMessageSerializer, SendMessageSerializer
 
 
-# Настройка Gemini
-if settings.GEMINI_API_KEY:
-    genai.configure(api_key=settings.GEMINI_API_KEY)
+NOT_CONFIGURED_REPLY = "AI тренер временно недоступен. Пожалуйста, настройте GEMINI_API_KEY."
 
 
-SYSTEM_PROMPT = """
-Ты - AI тренер по боксу. Твоя задача - помогать ученикам платформы онлайн-курсов бокса.
+def _limit_reached_body(limit):
+    return {'detail': 'Достигнут дневной лимит сообщений', 'limit': limit}
 
-Твоя роль:
-- Отвечай на вопросы о технике бокса
-- Объясняй основы и продвинутые концепции
-- Давай советы по тренировкам
-- Помогай с мотивацией
-- Отвечай на вопросы о платформе
 
-Что НЕ делать:
-- НЕ давай медицинские советы
-- НЕ диагностируй травмы
-- Если вопрос о здоровье - советуй обратиться к врачу
+def _overloaded_body(retry_after):
+    return {'detail': 'AI тренер перегружен. Пожалуйста, попробуйте позже.', 'retry_after': retry_after}
 
-Стиль общения:
-- Мотивирующий и энергичный
-- Профессиональный, но дружелюбный
-- КРАТКИЕ И ПОНЯТНЫЕ ОТВЕТЫ (максимум 3-5 предложений)
-- Используй терминологию бокса
-- Конкретика без лишних слов
-- Структурируй ответ: 1-2 ключевых момента
-- Добавляй короткие практические советы
 
-ВАЖНО: Ответы должны быть средней длины - не слишком короткие, но и не длинные. 
-Оптимально: 2-4 абзаца по 1-2 предложения в каждом.
-
-Всегда отвечай на русском языке.
-"""
+def _error_reply(error):
+    """Текст ответа, который сохраняется вместо ответа AI при ошибке"""
+    if isinstance(error, providers.ProviderRateLimited):
+        return "⚠️ Превышен лимит запросов к AI. Пожалуйста, попробуйте позже или обратитесь к администратору."
+    if isinstance(error, providers.ProviderModelNotFound):
+        return "⚠️ Модель AI недоступна. Обратитесь к администратору."
+    if isinstance(error, providers.CircuitOpen):
+        return "⚠️ AI тренер временно недоступен. Пожалуйста, попробуйте через минуту."
+    if isinstance(error, providers.ProviderTimeout):
+        return "⚠️ AI тренер не ответил вовремя. Пожалуйста, попробуйте еще раз."
+    return "⚠️ Произошла ошибка. Пожалуйста, попробуйте позже."
 
 
 @api_view(['POST'])
@@ -55,59 +46,173 @@ def send_message(request):
     
     user_message = serializer.validated_data['message']
     
-    # Проверка лимита сообщений (опционально для MVP)
-    daily_messages = ChatMessage.objects.filter(
-        user=request.user,
-        created_at__date=timezone.now().date()
-    ).count()
-    
-    if daily_messages >= 50:  # Лимит 50 сообщений в день
+    try:
+        ticket = admission.acquire(request.user)
+    except admission.AdmissionRejected as e:
         return Response(
-            {'detail': 'Достигнут дневной лимит сообщений'},
-            status=status.HTTP_429_TOO_MANY_REQUESTS
+            _overloaded_body(e.retry_after),
+            status=status.HTTP_429_TOO_MANY_REQUESTS,
+            headers={'Retry-After': str(e.retry_after)}
         )
-    
     try:
-        # Вызов Gemini API
-        if not settings.GEMINI_API_KEY:
-            ai_response = "AI тренер временно недоступен. Пожалуйста, настройте GEMINI_API_KEY."
+        return _send_message(request, user_message)
+    finally:
+        ticket.release()
+
+
+def _send_message(request, user_message):
+    """Обработка сообщения в занятом слоте ai_coach.admission"""
+    allowed, limit = quota.try_consume(request.user)
+    if not allowed:
+        return Response(_limit_reached_body(limit), status=status.HTTP_429_TOO_MANY_REQUESTS)
+    
+    sources = retrieval.retrieve(user_message)
+    prompt_message = retrieval.augment_question(user_message, sources)
+    # Кэш ответов общий для всех пользователей: самостоятельный вопрос
+    # отвечается без личной истории (реплики, конспект) и кэшируется,
+    # уточняющий - с историей и мимо кэша
+    shared = not memory.is_follow_up(user_message)
+    history = None if shared else memory.build_context(request.user, prompt_message)
+    
+    cached = answer_cache.lookup(user_message) if shared else None
+    if cached is not None:
+        ai_response = cached.response
+    elif not providers.is_configured():
+        ai_response = NOT_CONFIGURED_REPLY
+    else:
+        try:
+            # Вызов AI (срок, повторы и автомат защиты - в ai_coach.providers)
+            ai_response = providers.generate_reply(prompt_message, history)
+        except providers.ProviderError as e:
+            # Сохраняем сообщение с ошибкой
+            ai_response = _error_reply(e)
         else:
-            # Используем gemini-2.5-flash - более быстрая модель
-            model = genai.GenerativeModel('gemini-2.5-flash')
-            
-            # Формируем полный промпт
-            full_prompt = f"{SYSTEM_PROMPT}\n\nВопрос ученика: {user_message}\n\nОтвет:"
-            
-            response = model.generate_content(full_prompt)
-            ai_response = response.text
-        
-        # Сохраняем в БД
-        chat_message = ChatMessage.objects.create(
-            user=request.user,
-            message=user_message,
-            response=ai_response
-        )
-        
-        return Response(ChatMessageSerializer(chat_message).data)
+            if shared:
+                answer_cache.store(user_message, ai_response)
     
-    except Exception as e:
-        error_message = str(e)
-        # Проверяем тип ошибки
-        if '429' in error_message or 'quota' in error_message.lower():
-            ai_response = "⚠️ Превышен лимит запросов к AI. Пожалуйста, попробуйте позже или обратитесь к администратору."
-        elif '404' in error_message:
-            ai_response = "⚠️ Модель AI недоступна. Обратитесь к администратору."
+    # Сохраняем в БД
+    chat_message = ChatMessage.objects.create(
+        user=request.user,
+        message=user_message,
+        response=ai_response,
+        sources=sources
+    )
+    if providers.is_configured():
+        memory.maybe_refresh_summary(request.user.id)
+    
+    return Response(ChatMessageSerializer(chat_message).data)
+
+
+def _json(data, status_code):
+    return JsonResponse(data, status=status_code, json_dumps_params={'ensure_ascii': False})
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _stream_reply(user, user_message):
+    """
+    События SSE: token - очередной фрагмент ответа, done - сохранённое
+    сообщение целиком. При ошибке AI ответ с текстом ошибки тоже
+    сохраняется и приходит в done (как в send_message).
+    """
+    parts = []
+    sources = await sync_to_async(retrieval.retrieve)(user_message)
+    prompt_message = retrieval.augment_question(user_message, sources)
+    shared = not memory.is_follow_up(user_message)
+    history = None if shared else await sync_to_async(memory.build_context)(user, prompt_message)
+    cached = await sync_to_async(answer_cache.lookup)(user_message) if shared else None
+    if cached is not None:
+        ai_response = cached.response
+        yield _sse('token', {'text': ai_response})
+    elif not providers.is_configured():
+        ai_response = NOT_CONFIGURED_REPLY
+        yield _sse('token', {'text': ai_response})
+    else:
+        try:
+            async for text in providers.stream_reply(prompt_message, history):
+                parts.append(text)
+                yield _sse('token', {'text': text})
+        except providers.ProviderError as e:
+            ai_response = _error_reply(e)
+            yield _sse('error', {'detail': ai_response})
         else:
-            ai_response = f"⚠️ Произошла ошибка. Пожалуйста, попробуйте позже."
-        
-        # Сохраняем сообщение с ошибкой
-        chat_message = ChatMessage.objects.create(
-            user=request.user,
-            message=user_message,
-            response=ai_response
-        )
-        
-        return Response(ChatMessageSerializer(chat_message).data)
+            ai_response = ''.join(parts)
+            if shared:
+                await sync_to_async(answer_cache.store)(user_message, ai_response)
+    
+    chat_message = await ChatMessage.objects.acreate(
+        user=user,
+        message=user_message,
+        response=ai_response,
+        sources=sources
+    )
+    if providers.is_configured():
+        await sync_to_async(memory.maybe_refresh_summary)(user.id)
+    yield _sse('done', ChatMessageSerializer(chat_message).data)
+
+
+async def _admitted(ticket, events):
+    """Поток событий, по окончании которого освобождается слот ai_coach.admission"""
+    try:
+        async for event in events:
+            yield event
+    finally:
+        await sync_to_async(ticket.release)()
+
+
+async def stream_message(request):
+    """
+    Асинхронный вариант send_message: ответ AI отдаётся потоком
+    Server-Sent Events по мере генерации. Работает под ASGI
+    (boxer_platform.asgi), ожидание AI не занимает воркер.
+    DRF не поддерживает async-представления, поэтому JWT проверяется вручную.
+    """
+    if request.method != 'POST':
+        return _json({'detail': 'Метод не поддерживается'}, status.HTTP_405_METHOD_NOT_ALLOWED)
+    
+    try:
+        auth = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except exceptions.AuthenticationFailed as e:
+        return _json({'detail': str(e.detail)}, status.HTTP_401_UNAUTHORIZED)
+    if auth is None:
+        return _json({'detail': 'Учетные данные не были предоставлены.'}, status.HTTP_401_UNAUTHORIZED)
+    user = auth[0]
+    
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        return _json({'detail': 'Некорректный JSON'}, status.HTTP_400_BAD_REQUEST)
+    serializer = SendMessageSerializer(data=payload)
+    if not serializer.is_valid():
+        return _json(serializer.errors, status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        ticket = await admission.aacquire(user)
+    except admission.AdmissionRejected as e:
+        response = _json(_overloaded_body(e.retry_after), status.HTTP_429_TOO_MANY_REQUESTS)
+        response['Retry-After'] = str(e.retry_after)
+        return response
+    
+    allowed, limit = await sync_to_async(quota.try_consume)(user)
+    if not allowed:
+        await sync_to_async(ticket.release)()
+        return _json(_limit_reached_body(limit), status.HTTP_429_TOO_MANY_REQUESTS)
+    
+    response = StreamingHttpResponse(
+        _admitted(ticket, _stream_reply(user, serializer.validated_data['message'])),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Отключить буферизацию ответа в nginx
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# csrf_exempt в Django 4.2 превращает async-представление в синхронное;
+# токен передаётся в заголовке Authorization, поэтому CSRF не нужен
+stream_message.csrf_exempt = True
 
 
 @api_view(['GET'])
@@ -119,11 +224,19 @@ def get_chat_history(request):
     return Response(serializer.data)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_quota(request):
+    """Использование дневного лимита сообщений"""
+    return Response(quota.get_usage(request.user))
+
+
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def clear_chat_history(request):
     """Очистить историю чата"""
     ChatMessage.objects.filter(user=request.user).delete()
+    ConversationSummary.objects.filter(user=request.user).delete()
     return Response({'detail': 'История чата очищена'})
 
 
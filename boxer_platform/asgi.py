@@ -1,5 +1,10 @@
 """
 ASGI config for boxer_platform project.
+
+Отдельный процесс только для SSE /api/ai-coach/stream/ (boxer_platform.asgi_urls):
+FileResponse под ASGI читается в память целиком, поэтому медиа и остальной
+API остаются на WSGI. Постоянные соединения с БД под ASGI не закрываются
+между запросами (они привязаны к потокам sync_to_async), поэтому CONN_MAX_AGE=0.
 """
 
 import os
@@ -7,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'boxer_platform.settings')
+os.environ.setdefault('ROOT_URLCONF', 'boxer_platform.asgi_urls')
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
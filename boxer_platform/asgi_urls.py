@@ -0,0 +1,14 @@
+"""
+URL configuration для ASGI-процесса (boxer_platform.asgi).
+
+Под ASGI работают только потоковые ответы AI тренера. Остальной API,
+включая отдачу видео через os.sendfile (courses.media), обслуживает
+gunicorn через WSGI (boxer_platform.wsgi).
+"""
+from django.urls import path
+
+from ai_coach import views as ai_coach_views
+
+urlpatterns = [
+    path('api/ai-coach/stream/', ai_coach_views.stream_message, name='stream_message'),
+]
@@ -0,0 +1,20 @@
+"""
+Общие сведения о настроенном кэше.
+
+Буфер heartbeat (courses.progress), счётчики и слоты AI тренера
+(ai_coach.quota, ai_coach.admission) рассчитаны на кэш, общий для всех
+процессов. LocMemCache (по умолчанию без REDIS_URL) у каждого процесса
+свой: значения, записанные веб-воркером, не видны другим воркерам и
+management-командам.
+"""
+from django.conf import settings
+
+PROCESS_LOCAL_BACKENDS = frozenset({
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+})
+
+
+def is_shared_cache(alias='default'):
+    """Видят ли кэш alias все процессы (Redis, Memcached, БД, файлы)"""
+    return settings.CACHES[alias]['BACKEND'] not in PROCESS_LOCAL_BACKENDS
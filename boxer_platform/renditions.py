@@ -0,0 +1,146 @@
+"""
+Уменьшенные копии изображений (обложки, баннеры курсов и аватары).
+
+При загрузке изображения рядом с оригиналом сохраняются WebP и JPEG
+фиксированных ширин: courses/cover.jpg -> courses/cover.320w.webp, ...
+Описание копий хранится в JSON-поле модели, чтобы сериализатор мог отдать
+srcset без обращения к хранилищу:
+
+    {"source": "courses/cover.jpg", "width": 2400, "height": 1600,
+     "webp": [{"width": 320, "name": "courses/cover.320w.webp"}, ...],
+     "jpeg": [...]}
+
+Поле source позволяет понять, что оригинал сменился и копии устарели.
+"""
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+COURSE_COVER_WIDTHS = (320, 640, 960)
+COURSE_BANNER_WIDTHS = (640, 1280, 1920)
+AVATAR_WIDTHS = (64, 128, 256)
+
+# (ключ в метаданных, формат Pillow, расширение, параметры сохранения)
+RENDITION_FORMATS = (
+    ('webp', 'WEBP', 'webp', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+
+
+def _rendition_name(source, width, extension):
+    root, _ = os.path.splitext(source)
+    return f'{root}.{width}w.{extension}'
+
+
+def _flatten(image):
+    """JPEG не поддерживает прозрачность - подкладываем белый фон"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def build_renditions(field_file, widths):
+    """Сгенерировать копии изображения и вернуть их описание"""
+    storage = field_file.storage
+    with storage.open(field_file.name, 'rb') as f:
+        image = Image.open(f)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    source_width, source_height = image.size
+    # Не увеличиваем изображение: ширины больше оригинала заменяются оригинальной
+    targets = sorted({min(width, source_width) for width in widths})
+
+    metadata = {'source': field_file.name, 'width': source_width, 'height': source_height}
+    variants = {
+        'webp': image if image.mode in ('RGB', 'RGBA') else image.convert('RGBA'),
+        'jpeg': _flatten(image),
+    }
+    for key, image_format, extension, options in RENDITION_FORMATS:
+        metadata[key] = []
+        for width in targets:
+            height = max(1, round(source_height * width / source_width))
+            resized = variants[key].resize((width, height), Image.LANCZOS)
+            buffer = BytesIO()
+            resized.save(buffer, image_format, **options)
+            name = _rendition_name(field_file.name, width, extension)
+            if storage.exists(name):
+                storage.delete(name)
+            name = storage.save(name, ContentFile(buffer.getvalue()))
+            metadata[key].append({'width': width, 'name': name})
+    return metadata
+
+
+def delete_renditions(storage, metadata):
+    """Удалить файлы копий, описанные в metadata"""
+    for key, _, _, _ in RENDITION_FORMATS:
+        for rendition in (metadata or {}).get(key, []):
+            storage.delete(rendition['name'])
+
+
+def sync_renditions(instance, image_field, metadata_field, widths):
+    """
+    Перегенерировать копии, если изображение сменилось с прошлой генерации.
+    Метаданные записываются через UPDATE, без повторного save() и сигналов.
+    Возвращает True, если метаданные изменились.
+    """
+    field_file = getattr(instance, image_field)
+    metadata = getattr(instance, metadata_field) or {}
+    source = field_file.name or ''
+    if metadata.get('source', '') == source:
+        return False
+
+    delete_renditions(field_file.storage, metadata)
+    new_metadata = {}
+    if source:
+        try:
+            new_metadata = build_renditions(field_file, widths)
+        except (OSError, Image.DecompressionBombError):
+            # Битый или неподдерживаемый файл: отдаём оригинал и не пытаемся
+            # повторять генерацию при каждом сохранении
+            new_metadata = {'source': source}
+
+    setattr(instance, metadata_field, new_metadata)
+    type(instance)._default_manager.filter(pk=instance.pk).update(**{metadata_field: new_metadata})
+    return True
+
+
+class ImageRenditionsField(serializers.Field):
+    """
+    Копии изображения для фронтенда (image_field - поле с оригиналом):
+    {"width", "height", "src", "srcset": {"webp": "url 320w, ...", "jpeg": "..."}}
+    """
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def _url(self, storage, name):
+        url = storage.url(name)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def to_representation(self, metadata):
+        if not metadata or not metadata.get('jpeg'):
+            return None
+        storage = self.parent.Meta.model._meta.get_field(self.image_field).storage
+        srcset = {
+            key: ', '.join(
+                f"{self._url(storage, rendition['name'])} {rendition['width']}w"
+                for rendition in metadata[key]
+            )
+            for key, _, _, _ in RENDITION_FORMATS
+        }
+        return {
+            'width': metadata['width'],
+            'height': metadata['height'],
+            'src': self._url(storage, metadata['jpeg'][-1]['name']),
+            'srcset': srcset,
+        }
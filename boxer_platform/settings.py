@@ -55,7 +55,8 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'boxer_platform.urls'
+# boxer_platform.asgi подставляет boxer_platform.asgi_urls
+ROOT_URLCONF = config('ROOT_URLCONF', default='boxer_platform.urls')
 
 TEMPLATES = [
     {
@@ -80,7 +81,7 @@ if 'DATABASE_URL' in os.environ:
     DATABASES = {
         'default': dj_database_url.config(
             default=os.environ.get('DATABASE_URL'),
-            conn_max_age=600,
+            conn_max_age=config('DB_CONN_MAX_AGE', default=600, cast=int),
             conn_health_checks=True,
         )
     }
@@ -93,6 +94,23 @@ else:
         }
 # }
 
+# Cache: Redis, если задан REDIS_URL (общий для всех воркеров gunicorn),
+# иначе локальная память процесса
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -127,6 +145,25 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Подписанные ссылки на видео уроков (courses.media). Срок жизни должен быть
+# заметно больше CATALOG_CACHE_TIMEOUT, т.к. ссылки попадают в кэш каталога
+MEDIA_URL_TTL = config('MEDIA_URL_TTL', default=60 * 60 * 4, cast=int)
+# Передача файла прокси-серверу: '' - отдаёт Django, 'nginx' - X-Accel-Redirect,
+# 'sendfile' - X-Sendfile (Apache mod_xsendfile, lighttpd)
+MEDIA_OFFLOAD = config('MEDIA_OFFLOAD', default='')
+# internal location nginx, указывающий на MEDIA_ROOT
+MEDIA_ACCEL_REDIRECT_PREFIX = config('MEDIA_ACCEL_REDIRECT_PREFIX', default='/protected-media/')
+# Байт на секунду превью, если размер или длительность видео урока неизвестны
+# (250 КБ/с - около 2 Мбит/с, превью высокой битрейты окажется короче)
+MEDIA_PREVIEW_FALLBACK_BYTES_PER_SECOND = config(
+    'MEDIA_PREVIEW_FALLBACK_BYTES_PER_SECOND', default=250 * 1024, cast=int
+)
+
+# Загрузка видео частями (courses.uploads). Каталог лучше держать на той же
+# файловой системе, что и MEDIA_ROOT, тогда перенос готового файла мгновенный
+VIDEO_UPLOAD_TEMP_DIR = config('VIDEO_UPLOAD_TEMP_DIR', default=str(BASE_DIR / 'uploads'))
+VIDEO_UPLOAD_MAX_SIZE = config('VIDEO_UPLOAD_MAX_SIZE', default=20 * 1024 ** 3, cast=int)
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -175,6 +212,60 @@ if not DEBUG and not IS_RENDER:
 # Gemini AI
 GEMINI_API_KEY = config('GEMINI_API_KEY', default='')
 
+# Провайдер AI тренера (ai_coach.providers): gemini или stub - локальная заглушка для нагрузочных тестов
+AI_PROVIDER = config('AI_PROVIDER', default='gemini')
+# Срок ответа AI на вызов со всеми повторами, секунды
+AI_PROVIDER_TIMEOUT = config('AI_PROVIDER_TIMEOUT', default=20, cast=float)
+AI_PROVIDER_RETRIES = config('AI_PROVIDER_RETRIES', default=2, cast=int)
+# Базовая и максимальная пауза перед повтором (экспоненциальная, со случайным разбросом)
+AI_PROVIDER_BACKOFF = config('AI_PROVIDER_BACKOFF', default=0.5, cast=float)
+AI_PROVIDER_BACKOFF_MAX = config('AI_PROVIDER_BACKOFF_MAX', default=4, cast=float)
+# После AI_CIRCUIT_FAILURES сбоев за AI_CIRCUIT_WINDOW секунд вызовы AI не выполняются AI_CIRCUIT_RESET секунд
+AI_CIRCUIT_FAILURES = config('AI_CIRCUIT_FAILURES', default=5, cast=int)
+AI_CIRCUIT_WINDOW = config('AI_CIRCUIT_WINDOW', default=60, cast=int)
+AI_CIRCUIT_RESET = config('AI_CIRCUIT_RESET', default=30, cast=int)
+# Задержка ответа заглушки (AI_PROVIDER=stub), секунды
+AI_STUB_LATENCY = config('AI_STUB_LATENCY', default=0.5, cast=float)
+
+# Одновременные запросы к AI тренеру на все воркеры (ai_coach.admission)
+AI_MAX_IN_FLIGHT = config('AI_MAX_IN_FLIGHT', default=8, cast=int)
+AI_ADMISSION_QUEUE_SIZE = config('AI_ADMISSION_QUEUE_SIZE', default=16, cast=int)
+# Сколько запрос ждёт свободного слота в очереди, секунды; paid - есть доступ к курсу
+AI_ADMISSION_WAIT = {
+    'free': config('AI_ADMISSION_WAIT_FREE', default=1, cast=float),
+    'paid': config('AI_ADMISSION_WAIT_PAID', default=3, cast=float),
+}
+# Заголовок Retry-After в ответе 429 при перегрузке, секунды
+AI_ADMISSION_RETRY_AFTER = config('AI_ADMISSION_RETRY_AFTER', default=5, cast=int)
+
+# Дневной лимит сообщений AI тренеру (ai_coach.quota): paid - есть доступ к курсу
+AI_DAILY_MESSAGE_LIMITS = {
+    'free': config('AI_DAILY_LIMIT_FREE', default=50, cast=int),
+    'paid': config('AI_DAILY_LIMIT_PAID', default=200, cast=int),
+}
+
+# Память диалога AI тренера (ai_coach.memory)
+AI_MEMORY_TURNS = config('AI_MEMORY_TURNS', default=6, cast=int)
+# Сколько сообщений вне окна последних реплик может накопиться до обновления конспекта
+AI_MEMORY_SUMMARY_LAG = config('AI_MEMORY_SUMMARY_LAG', default=10, cast=int)
+# Жёсткий лимит токенов на историю и вопрос (без системного промпта)
+AI_PROMPT_TOKEN_BUDGET = config('AI_PROMPT_TOKEN_BUDGET', default=2000, cast=int)
+
+# Сколько найденных уроков/таймкодов подставляется в запрос к AI (ai_coach.retrieval)
+AI_RETRIEVAL_TOP_K = config('AI_RETRIEVAL_TOP_K', default=3, cast=int)
+# Полная перестройка индекса в фоне (ловит изменения без сигналов), секунды
+AI_RETRIEVAL_REBUILD_INTERVAL = config('AI_RETRIEVAL_REBUILD_INTERVAL', default=60 * 60, cast=int)
+# Ограничение размера индекса: число документов и символов текста на документ
+AI_RETRIEVAL_MAX_DOCUMENTS = config('AI_RETRIEVAL_MAX_DOCUMENTS', default=50000, cast=int)
+AI_RETRIEVAL_MAX_TEXT_CHARS = config('AI_RETRIEVAL_MAX_TEXT_CHARS', default=20000, cast=int)
+
+# Кэш ответов AI тренера на повторяющиеся вопросы (ai_coach.answer_cache)
+AI_ANSWER_CACHE_TTL = config('AI_ANSWER_CACHE_TTL', default=60 * 60 * 24 * 7, cast=int)
+# Лимит записей; лишние удаляет периодическая команда evict_answer_cache
+AI_ANSWER_CACHE_MAX_ENTRIES = config('AI_ANSWER_CACHE_MAX_ENTRIES', default=5000, cast=int)
+# Минимальное сходство (оценка Жаккара по MinHash), при котором вопрос считается повтором
+AI_ANSWER_CACHE_SIMILARITY = config('AI_ANSWER_CACHE_SIMILARITY', default=0.8, cast=float)
+
 # Stripe
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY', default='')
 STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY', default='')
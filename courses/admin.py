@@ -1,14 +1,24 @@
-from django.contrib import admin
-from .models import Course, Lesson, LessonProgress, CourseReview
+from django.contrib import admin, messages
+from .models import Course, CourseProgress, Enrollment, Lesson, LessonProgress, CourseReview, VideoUpload
+
+
+class EnrollmentInline(admin.TabularInline):
+    model = Enrollment
+    extra = 0
+    raw_id_fields = ('user', 'source_order')
 
 
 @admin.register(Course)
 class CourseAdmin(admin.ModelAdmin):
-    list_display = ('title', 'level', 'category', 'price', 'rating', 'reviews_count', 'is_active', 'created_at')
+    list_display = ('title', 'level', 'category', 'price', 'rating', 'reviews_count', 'lessons_count', 'is_active', 'created_at')
     list_filter = ('level', 'category', 'is_active', 'access_type')
     search_fields = ('title', 'description')
+    readonly_fields = (
+        'lessons_count', 'total_duration_minutes', 'rating', 'reviews_count', 'rating_sum',
+        'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+    )
     prepopulated_fields = {'slug': ('title',)}
-    filter_horizontal = ('students',)
+    inlines = (EnrollmentInline,)
 
 
 @admin.register(Lesson)
@@ -22,8 +32,13 @@ class LessonAdmin(admin.ModelAdmin):
             'fields': ('course', 'title', 'order_index', 'text_content')
         }),
         ('Видео', {
-            'fields': ('video_file', 'video_url', 'video_format', 'duration_minutes'),
-            'description': 'Загрузите видео файл или укажите URL. Выберите формат видео.'
+            'fields': (
+                'video_file', 'video_url', 'video_format', 'duration_minutes',
+                'video_processed_at', 'video_processing_error',
+            ),
+            'description': 'Загрузите видео файл или укажите URL. Для загруженного MP4 '
+                           'длительность и формат определяются автоматически после обработки '
+                           'командой process_lesson_videos.'
         }),
         ('Дополнительный контент', {
             'fields': ('timestamps', 'resources'),
@@ -33,6 +48,31 @@ class LessonAdmin(admin.ModelAdmin):
             'fields': ('is_free_preview', 'preview_duration_seconds')
         }),
     )
+    
+    readonly_fields = ('video_processed_at', 'video_processing_error')
+    
+    def save_model(self, request, obj, form, change):
+        if obj.video_file and 'video_file' in form.changed_data:
+            # Обработка в фоне: faststart многогигабайтного файла не укладывается в запрос
+            obj.video_processed_at = None
+            obj.video_processing_error = ''
+            obj.video_size = obj.video_file.size
+            self.message_user(
+                request,
+                'Видео будет обработано в фоне (process_lesson_videos): длительность и формат '
+                'заполнятся автоматически.',
+                level=messages.INFO,
+            )
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(VideoUpload)
+class VideoUploadAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'lesson', 'size', 'status', 'created_by', 'created_at', 'completed_at')
+    list_filter = ('status',)
+    search_fields = ('filename', 'lesson__title')
+    readonly_fields = ('lesson', 'created_by', 'filename', 'size', 'sha256', 'status', 'error',
+                       'created_at', 'updated_at', 'completed_at')
 
 
 @admin.register(LessonProgress)
@@ -43,6 +83,22 @@ class LessonProgressAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at', 'updated_at')
 
 
+@admin.register(Enrollment)
+class EnrollmentAdmin(admin.ModelAdmin):
+    list_display = ('user', 'course', 'granted_at', 'expires_at', 'source_order')
+    list_filter = ('course',)
+    search_fields = ('user__email', 'course__title')
+    raw_id_fields = ('user', 'source_order')
+
+
+@admin.register(CourseProgress)
+class CourseProgressAdmin(admin.ModelAdmin):
+    list_display = ('user', 'course', 'completed_lessons', 'watch_time_seconds', 'last_activity_at')
+    list_filter = ('course',)
+    search_fields = ('user__email', 'course__title')
+    raw_id_fields = ('last_lesson',)
+
+
 @admin.register(CourseReview)
 class CourseReviewAdmin(admin.ModelAdmin):
     list_display = ('course', 'user', 'rating', 'created_at')
@@ -0,0 +1,112 @@
+"""
+Кэш ответов каталога курсов для анонимных пользователей.
+
+Ключи включают версию каталога, которая увеличивается сигналами при любом
+изменении курсов, уроков и отзывов, поэтому явная очистка не нужна.
+Повторный запрос с совпадающим If-None-Match получает 304 без обращения к БД.
+
+Версия увеличивается только в том кэше, который видит изменивший каталог
+процесс. Если кэш не общий (LocMemCache без REDIS_URL), другие воркеры
+узнают об изменении лишь по истечении срока записи, поэтому он сокращается
+до LOCAL_CATALOG_CACHE_TIMEOUT (catalog_cache_timeout).
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+
+from boxer_platform.cache import is_shared_cache
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_CACHE_TIMEOUT = 60 * 60
+# Срок записи в кэше процесса: дольше этого другие воркеры не отдают устаревшее
+LOCAL_CATALOG_CACHE_TIMEOUT = 5
+
+
+def catalog_cache_timeout(timeout=CATALOG_CACHE_TIMEOUT):
+    """Срок записи, зависящей от версии каталога"""
+    return timeout if is_shared_cache() else min(timeout, LOCAL_CATALOG_CACHE_TIMEOUT)
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """Инвалидировать все закэшированные ответы каталога"""
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOG_VERSION_KEY, int(time.time() * 1000), None)
+
+
+def _etag_matches(request, etag):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    return '*' in etags or etag in etags
+
+
+class CatalogCacheMixin:
+    """
+    Кэширование list/retrieve для анонимных запросов.
+    Ответ сохраняется уже отрендеренным вместе со strong ETag.
+    """
+    
+    def _catalog_cache_key(self, request):
+        raw = f"{request.get_full_path()}|{request.META.get('HTTP_ACCEPT', '')}"
+        digest = hashlib.md5(raw.encode()).hexdigest()
+        return f'catalog:response:{get_catalog_version()}:{digest}'
+    
+    def _cached_or_render(self, handler, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+        
+        key = self._catalog_cache_key(request)
+        entry = cache.get(key)
+        if entry is None:
+            request._catalog_cache_key = key
+            return handler(request, *args, **kwargs)
+        
+        if _etag_matches(request, entry['etag']):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(entry['content'], content_type=entry['content_type'])
+        response['ETag'] = entry['etag']
+        patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
+    
+    def list(self, request, *args, **kwargs):
+        return self._cached_or_render(super().list, request, *args, **kwargs)
+    
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_or_render(super().retrieve, request, *args, **kwargs)
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(request, '_catalog_cache_key', None)
+        if key is None or not isinstance(response, Response) or response.status_code != 200:
+            return response
+        
+        response.render()
+        etag = '"%s"' % hashlib.sha256(response.content).hexdigest()
+        cache.set(key, {
+            'content': response.content,
+            'content_type': response['Content-Type'],
+            'etag': etag,
+        }, catalog_cache_timeout())
+        
+        if _etag_matches(request, etag):
+            response = HttpResponseNotModified()
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
@@ -0,0 +1,87 @@
+"""
+Права доступа пользователя к курсам.
+
+Множество курсов с действующим доступом (Enrollment) загружается одним
+запросом по индексу (user, course, expires_at) и переиспользуется:
+в пределах запроса - через атрибут объекта пользователя, между запросами -
+через кэш с версией, которая увеличивается при выдаче или отзыве доступа.
+Кэш живёт не дольше, чем до ближайшего окончания подписки. Если кэш не
+общий для процессов (boxer_platform.cache), версия увеличилась бы только
+в процессе, выдавшем доступ, поэтому между запросами права не кэшируются.
+"""
+import time
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from boxer_platform.cache import is_shared_cache
+
+ENTITLEMENTS_CACHE_TIMEOUT = 60 * 15
+
+
+def _version_key(user_id):
+    return f'entitlements:version:{user_id}'
+
+
+def _new_version():
+    # Версия от времени, чтобы после вытеснения ключа из кэша
+    # не вернуться к уже использованному номеру
+    return int(time.time() * 1000)
+
+
+def _get_version(user_id):
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def _load_course_ids(user):
+    """(ID курсов с действующим доступом, сколько секунд их можно кэшировать)"""
+    from .models import Enrollment
+    
+    now = timezone.now()
+    rows = list(
+        Enrollment.objects.filter(user=user).active(now).values_list('course_id', 'expires_at')
+    )
+    timeout = ENTITLEMENTS_CACHE_TIMEOUT
+    expirations = [expires_at for _, expires_at in rows if expires_at is not None]
+    if expirations:
+        seconds_left = int((min(expirations) - now).total_seconds()) + 1
+        timeout = max(1, min(timeout, seconds_left))
+    return frozenset(course_id for course_id, _ in rows), timeout
+
+
+def get_purchased_course_ids(user):
+    """Множество ID курсов, к которым у пользователя есть доступ"""
+    if not user or not user.is_authenticated:
+        return frozenset()
+    
+    course_ids = getattr(user, '_purchased_course_ids', None)
+    if course_ids is None:
+        if is_shared_cache():
+            key = f'entitlements:{user.pk}:{_get_version(user.pk)}'
+            course_ids = cache.get(key)
+            if course_ids is None:
+                course_ids, timeout = _load_course_ids(user)
+                cache.set(key, course_ids, timeout)
+        else:
+            course_ids, _ = _load_course_ids(user)
+        user._purchased_course_ids = course_ids
+    return course_ids
+
+
+def has_course_access(user, course_id):
+    """Купил ли пользователь курс"""
+    return course_id in get_purchased_course_ids(user)
+
+
+def invalidate_entitlements(user_id):
+    """Сбросить закэшированные права пользователя"""
+    key = _version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), None)
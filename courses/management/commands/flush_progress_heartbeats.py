@@ -0,0 +1,36 @@
+"""
+Management command для записи буферизованных heartbeat прогресса в БД.
+Запускается одним процессом: разово по cron или постоянно с --interval.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from courses.progress import flush_heartbeats
+
+
+class Command(BaseCommand):
+    help = 'Записать накопленные обновления прогресса просмотра в LessonProgress'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Повторять запись каждые N секунд (0 - выполнить один раз)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Количество записей в одном upsert-запросе',
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            written = flush_heartbeats(batch_size=options['batch_size'])
+            if written or not interval:
+                self.stdout.write(f'Записано строк прогресса: {written}')
+            if not interval:
+                return
+            time.sleep(interval)
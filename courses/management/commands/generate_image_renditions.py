@@ -0,0 +1,52 @@
+"""
+Management command для генерации уменьшенных копий уже загруженных
+обложек, баннеров курсов и аватаров пользователей
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from boxer_platform.renditions import (
+    AVATAR_WIDTHS,
+    COURSE_BANNER_WIDTHS,
+    COURSE_COVER_WIDTHS,
+    delete_renditions,
+    sync_renditions,
+)
+from courses.caching import bump_catalog_version
+from courses.models import Course
+
+User = get_user_model()
+
+TARGETS = (
+    (Course, 'cover_image', 'cover_renditions', COURSE_COVER_WIDTHS),
+    (Course, 'banner_image', 'banner_renditions', COURSE_BANNER_WIDTHS),
+    (User, 'avatar', 'avatar_renditions', AVATAR_WIDTHS),
+)
+
+
+class Command(BaseCommand):
+    help = 'Сгенерировать WebP/JPEG копии изображений курсов и аватаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Перегенерировать копии, даже если они актуальны',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        for model, image_field, metadata_field, widths in TARGETS:
+            updated = 0
+            queryset = model.objects.exclude(**{image_field: ''}).exclude(**{f'{image_field}__isnull': True})
+            for instance in queryset.only(image_field, metadata_field).iterator():
+                if options['force']:
+                    delete_renditions(getattr(instance, image_field).storage, getattr(instance, metadata_field))
+                    setattr(instance, metadata_field, {})
+                if sync_renditions(instance, image_field, metadata_field, widths):
+                    updated += 1
+            total += updated
+            self.stdout.write(f'{model._meta.verbose_name_plural} / {image_field}: {updated}')
+
+        if total:
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f'Обновлено изображений: {total}'))
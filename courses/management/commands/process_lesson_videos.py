@@ -0,0 +1,75 @@
+"""
+Management command для обработки загруженных видео уроков:
+перенос moov в начало файла, длительность и формат из заголовков MP4.
+Сначала завершает загрузки по частям в статусе processing (courses.uploads),
+затем обрабатывает уроки без video_processed_at (новые загрузки из админки).
+Запускается по cron или постоянно с --interval на сервере с медиафайлами.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from courses.models import Lesson, VideoUpload
+from courses.mp4 import Mp4Error, process_lesson_video
+from courses.uploads import UploadError, finish_upload
+
+
+class Command(BaseCommand):
+    help = 'Перенести moov в начало видео уроков и заполнить длительность и формат'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--course',
+            type=int,
+            help='Обработать только уроки указанного курса',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Обработать заново и уже обработанные видео',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Повторять обработку каждые N секунд (0 - выполнить один раз)',
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            processed = self.process(options)
+            if processed or not interval:
+                self.stdout.write(self.style.SUCCESS(f'Обработано уроков: {processed}'))
+            if not interval:
+                return
+            time.sleep(interval)
+
+    def process(self, options):
+        processed = 0
+        uploads = VideoUpload.objects.filter(status=VideoUpload.STATUS_PROCESSING).select_related('lesson')
+        if options['course']:
+            uploads = uploads.filter(lesson__course_id=options['course'])
+        for upload in uploads.order_by('id'):
+            try:
+                finish_upload(upload)
+            except UploadError as e:
+                self.stdout.write(self.style.WARNING(f'Загрузка id={upload.id} ({upload.filename}): {e}'))
+                continue
+            processed += 1
+            self.stdout.write(f'Загрузка id={upload.id}: {upload.filename} привязан к уроку id={upload.lesson_id}')
+
+        lessons = Lesson.objects.exclude(video_file='').exclude(video_file__isnull=True)
+        if not options['all']:
+            lessons = lessons.filter(video_processed_at__isnull=True)
+        if options['course']:
+            lessons = lessons.filter(course_id=options['course'])
+
+        for lesson in lessons.order_by('id').iterator():
+            try:
+                rewritten = process_lesson_video(lesson)
+            except (Mp4Error, OSError) as e:
+                self.stdout.write(self.style.WARNING(f'{lesson.video_file.name} (урок id={lesson.id}): {e}'))
+                continue
+            processed += 1
+            self.stdout.write(f'{lesson.video_file.name}: {"перенесён moov" if rewritten else "moov уже в начале"}')
+        return processed
@@ -0,0 +1,133 @@
+"""
+Management command для пакетной обработки подписок (monthly/yearly).
+
+1. renew  - для подписок с автопродлением, истекающих в ближайшие
+            --renew-ahead-days дней, создаются заказы на продление (bulk_create);
+2. expire - подписки с истёкшим сроком переводятся в статус expired (UPDATE).
+
+Подписки обходятся пачками по ключу (expires_at, id) без загрузки всей
+выборки в память. После каждой пачки в той же транзакции сохраняется
+контрольная точка, поэтому прерванный запуск продолжается с места сбоя.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from courses.models import Enrollment, JobCheckpoint
+from payments.models import Order
+
+CHECKPOINT_NAME = 'process_subscriptions'
+PHASES = ('renew', 'expire')
+
+
+class Command(BaseCommand):
+    help = 'Создать заказы на продление и завершить истёкшие подписки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Размер пачки')
+        parser.add_argument(
+            '--renew-ahead-days',
+            type=int,
+            default=3,
+            help='За сколько дней до окончания создавать заказ на продление',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Игнорировать контрольную точку прерванного запуска',
+        )
+
+    def handle(self, *args, **options):
+        checkpoint, created = JobCheckpoint.objects.get_or_create(name=CHECKPOINT_NAME)
+        state = checkpoint.state
+        if created or options['restart'] or not state:
+            state = {'now': timezone.now().isoformat(), 'phase': PHASES[0], 'after': None}
+            checkpoint.state = state
+            checkpoint.save()
+        else:
+            self.stdout.write(f"Продолжение с фазы {state['phase']} после {state['after']}")
+
+        # Все пачки одного запуска используют одно и то же "сейчас"
+        now = parse_datetime(state['now'])
+        self.batch_size = options['batch_size']
+        self.horizon = now + timedelta(days=options['renew_ahead_days'])
+        self.now = now
+
+        for phase in PHASES[PHASES.index(state['phase']):]:
+            if state['phase'] != phase:
+                state = {'now': state['now'], 'phase': phase, 'after': None}
+                checkpoint.state = state
+                checkpoint.save()
+            processed = self.run_phase(checkpoint, phase)
+            self.stdout.write(self.style.SUCCESS(f'{phase}: обработано подписок {processed}'))
+
+        checkpoint.state = {}
+        checkpoint.save()
+
+    def phase_queryset(self, phase):
+        if phase == 'renew':
+            return Enrollment.objects.filter(
+                status='active',
+                auto_renew=True,
+                renewal_order__isnull=True,
+                expires_at__isnull=False,
+                expires_at__lte=self.horizon,
+                course__access_type__in=list(Enrollment.ACCESS_PERIODS),
+            )
+        return Enrollment.objects.filter(status='active', expires_at__lte=self.now)
+
+    def run_phase(self, checkpoint, phase):
+        processed = 0
+        while True:
+            queryset = self.phase_queryset(phase)
+            after = checkpoint.state['after']
+            if after is not None:
+                expires_at, pk = parse_datetime(after[0]), after[1]
+                queryset = queryset.filter(
+                    Q(expires_at__gt=expires_at) | Q(expires_at=expires_at, id__gt=pk)
+                )
+
+            if phase == 'renew':
+                batch = list(
+                    queryset.order_by('expires_at', 'id')
+                    .values_list('id', 'expires_at', 'user_id', 'course_id', 'course__price')
+                    [:self.batch_size]
+                )
+            else:
+                batch = list(
+                    queryset.order_by('expires_at', 'id').values_list('id', 'expires_at')[:self.batch_size]
+                )
+            if not batch:
+                return processed
+
+            with transaction.atomic():
+                if phase == 'renew':
+                    self.create_renewal_orders(batch)
+                else:
+                    Enrollment.objects.filter(id__in=[row[0] for row in batch]).update(status='expired')
+
+                last_id, last_expires_at = batch[-1][0], batch[-1][1]
+                checkpoint.state = dict(
+                    checkpoint.state, after=[last_expires_at.isoformat(), last_id]
+                )
+                checkpoint.save()
+
+            processed += len(batch)
+
+    def create_renewal_orders(self, batch):
+        orders = Order.objects.bulk_create([
+            Order(user_id=user_id, course_id=course_id, amount=price, status='pending')
+            for _, _, user_id, course_id, price in batch
+        ])
+        # PostgreSQL и SQLite 3.35+ возвращают ID созданных строк
+        Enrollment.objects.bulk_update(
+            [
+                Enrollment(id=row[0], renewal_order_id=order.pk)
+                for row, order in zip(batch, orders)
+            ],
+            ['renewal_order'],
+        )
@@ -0,0 +1,56 @@
+"""
+Management command для пересчёта рейтингов курсов по отзывам с нуля
+"""
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q, Sum
+from courses.models import Course, CourseReview
+
+AGGREGATE_FIELDS = ['reviews_count', 'rating_sum'] + [f'rating_{stars}_count' for stars in range(1, 6)]
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать агрегаты рейтинга курсов и показать расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только показать расхождения, не изменяя данные',
+        )
+
+    def handle(self, *args, **options):
+        actual = {
+            row.pop('course'): row
+            for row in CourseReview.objects.order_by().values('course').annotate(
+                reviews_count=Count('id'),
+                rating_sum=Sum('rating'),
+                **{
+                    f'rating_{stars}_count': Count('id', filter=Q(rating=stars))
+                    for stars in range(1, 6)
+                }
+            )
+        }
+        empty = dict.fromkeys(AGGREGATE_FIELDS, 0)
+
+        drifted = []
+        for course in Course.objects.only('title', *AGGREGATE_FIELDS).iterator():
+            expected = actual.get(course.id, empty)
+            diff = {
+                field: (getattr(course, field), expected[field])
+                for field in AGGREGATE_FIELDS
+                if getattr(course, field) != expected[field]
+            }
+            if diff:
+                drifted.append(course.id)
+                self.stdout.write(self.style.WARNING(f'{course.title} (id={course.id}): {diff}'))
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('Расхождений не найдено'))
+            return
+
+        if options['check']:
+            self.stdout.write(self.style.WARNING(f'Курсов с расхождениями: {len(drifted)}'))
+            return
+
+        Course.rebuild_rating_stats(drifted)
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано курсов: {len(drifted)}'))
@@ -0,0 +1,13 @@
+"""
+Management command для пересчёта денормализованных счётчиков уроков курсов
+"""
+from django.core.management.base import BaseCommand
+from courses.models import Course
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать количество и длительность уроков для всех курсов'
+
+    def handle(self, *args, **kwargs):
+        updated = Course.refresh_lesson_stats()
+        self.stdout.write(self.style.SUCCESS(f'Обновлено курсов: {updated}'))
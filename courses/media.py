@@ -0,0 +1,238 @@
+"""
+Отдача медиафайлов уроков с поддержкой HTTP Range.
+
+Ответ строится на FileResponse: под gunicorn WSGI file_wrapper отправляет
+файл через os.sendfile (без копирования в Python), начиная с текущей
+позиции дескриптора и ровно Content-Length байт. Для частичных ответов
+используется RangeFile, который сдвигает дескриптор на начало диапазона
+и ограничивает чтение его длиной (для серверов без sendfile).
+
+Для плеера выдаются подписанные ссылки с ограниченным сроком действия
+(sign_media_url). Подпись проверяется без обращения к БД, после чего
+передача байтов может быть отдана прокси через X-Accel-Redirect/X-Sendfile.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+MEDIA_SIGNING_SALT = 'courses.media'
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class RangeFile:
+    """Файл, ограниченный диапазоном [start, start + length)"""
+    
+    def __init__(self, path, start, length):
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self.remaining = length
+    
+    def fileno(self):
+        return self._file.fileno()
+    
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self._file.read(size)
+        self.remaining -= len(data)
+        return data
+    
+    def close(self):
+        self._file.close()
+
+
+def parse_range(header, size):
+    """
+    Разобрать заголовок Range. Поддерживается один диапазон байт.
+    Возвращает (start, end) включительно или None, если заголовок
+    отсутствует или не поддерживается (тогда отдаётся весь файл).
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # bytes=-N - последние N байт
+        length = int(end)
+        if length == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+    
+    start = int(start)
+    end = int(end) if end else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable
+    return start, min(end, size - 1)
+
+
+def file_etag(stat):
+    return '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        # If-Range допускает только строгое сравнение ETag
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def ranged_file_response(request, path, content_type=None, max_length=None):
+    """
+    Ответ с файлом с учётом Range/If-Range/If-None-Match.
+    max_length ограничивает доступную клиенту часть файла (превью).
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        raise Http404('Файл не найден')
+    
+    size = stat.st_size if max_length is None else min(stat.st_size, max_length)
+    etag = file_etag(stat)
+    last_modified = int(stat.st_mtime)
+    content_type = content_type or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and etag in parse_etags(if_none_match):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+    
+    byte_range = None
+    if _if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            response['Accept-Ranges'] = 'bytes'
+            return response
+    
+    start, end = byte_range or (0, size - 1)
+    length = max(end - start + 1, 0)
+    response = FileResponse(
+        RangeFile(path, start, length),
+        content_type=content_type,
+        status=206 if byte_range else 200,
+    )
+    response['Content-Length'] = str(length)
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+
+def lesson_video_path(lesson):
+    """Путь к загруженному видео урока на диске"""
+    if not lesson.video_file:
+        raise Http404('У урока нет загруженного видео')
+    try:
+        return lesson.video_file.path
+    except NotImplementedError:
+        raise Http404('Хранилище не поддерживает локальную отдачу файлов')
+
+
+def lesson_resource_path(lesson, index):
+    """Путь к файлу из Lesson.resources, если он лежит в MEDIA_ROOT"""
+    try:
+        resource = lesson.resources[index]
+        url = resource['url']
+    except (IndexError, KeyError, TypeError):
+        raise Http404('Ресурс не найден')
+    
+    if not isinstance(url, str) or not url.startswith(settings.MEDIA_URL):
+        raise Http404('Ресурс не является загруженным файлом')
+    try:
+        return safe_join(settings.MEDIA_ROOT, url[len(settings.MEDIA_URL):])
+    except SuspiciousFileOperation:
+        raise Http404('Ресурс не найден')
+
+
+def _fallback_byte_limit(preview_seconds):
+    """Лимит превью, когда средняя битрейта урока неизвестна"""
+    return preview_seconds * settings.MEDIA_PREVIEW_FALLBACK_BYTES_PER_SECOND
+
+
+def _preview_byte_limit(lesson, preview_seconds):
+    """
+    Приблизительное число байт, соответствующее превью, по средней битрейте.
+    Размер берётся из Lesson.video_size, а не из файловой системы. Без
+    размера или длительности - консервативный фиксированный лимит: превью
+    без ограничения по байтам отдало бы неоплаченное видео целиком.
+    """
+    if not lesson.duration_minutes or not lesson.video_size:
+        return _fallback_byte_limit(preview_seconds)
+    return lesson.video_size * preview_seconds // (lesson.duration_minutes * 60)
+
+
+def sign_media_url(lesson, path, preview_seconds=None):
+    """
+    Подписанный токен на файл урока.
+    path - путь к файлу внутри MEDIA_ROOT; preview_seconds - ограничение превью.
+    """
+    payload = {'l': lesson.id, 'f': os.path.relpath(path, settings.MEDIA_ROOT)}
+    if preview_seconds:
+        payload['p'] = preview_seconds
+        payload['b'] = _preview_byte_limit(lesson, preview_seconds)
+    return signing.dumps(payload, salt=MEDIA_SIGNING_SALT, compress=True)
+
+
+def load_media_token(token):
+    """Проверить подпись и срок действия токена (без обращения к БД)"""
+    return signing.loads(token, salt=MEDIA_SIGNING_SALT, max_age=settings.MEDIA_URL_TTL)
+
+
+def signed_media_response(request, payload):
+    """
+    Отдать файл по проверенному токену: через прокси (MEDIA_OFFLOAD) или
+    самостоятельно с поддержкой Range. Превью с ограничением по байтам
+    всегда отдаётся приложением, так как прокси не обрежет файл.
+    """
+    try:
+        path = safe_join(settings.MEDIA_ROOT, payload['f'])
+    except SuspiciousFileOperation:
+        raise Http404('Файл не найден')
+    
+    if 'p' in payload and 'b' not in payload:
+        # Токен превью, выданный без лимита по байтам (до его обязательности)
+        payload['b'] = _fallback_byte_limit(payload['p'])
+    
+    offload = settings.MEDIA_OFFLOAD
+    if offload and 'b' not in payload:
+        response = HttpResponse(content_type=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        # Не-latin-1 значения заголовков Django кодирует по MIME, и прокси
+        # не нашёл бы файл с кириллицей в имени; прокси декодирует %XX сам
+        if offload == 'nginx':
+            response['X-Accel-Redirect'] = quote(settings.MEDIA_ACCEL_REDIRECT_PREFIX + payload['f'])
+        else:
+            response['X-Sendfile'] = quote(str(path))
+    else:
+        response = ranged_file_response(request, path, max_length=payload.get('b'))
+    
+    if 'p' in payload:
+        response['X-Preview-Seconds'] = str(payload['p'])
+    return response
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.11 on 2026-10-18 07:48
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_lesson_stats(apps, schema_editor):
+    Course = apps.get_model('courses', 'Course')
+    Lesson = apps.get_model('courses', 'Lesson')
+    lessons = Lesson.objects.filter(course=OuterRef('pk')).order_by().values('course')
+    Course.objects.update(
+        lessons_count=Coalesce(Subquery(lessons.annotate(value=Count('id')).values('value')), 0),
+        total_duration_minutes=Coalesce(
+            Subquery(lessons.annotate(value=Sum('duration_minutes')).values('value')), 0
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0004_auto_20260204_1640'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='lessons_count',
+            field=models.IntegerField(default=0, verbose_name='Количество уроков'),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='total_duration_minutes',
+            field=models.IntegerField(default=0, verbose_name='Длительность уроков (минуты)'),
+        ),
+        migrations.RunPython(backfill_lesson_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.11 on 2026-10-18 07:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0005_course_lesson_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='coursereview',
+            index=models.Index(fields=['course', '-created_at', '-id'], name='courses_review_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.11 on 2026-10-18 07:51
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_rating_stats(apps, schema_editor):
+    Course = apps.get_model('courses', 'Course')
+    CourseReview = apps.get_model('courses', 'CourseReview')
+    reviews = CourseReview.objects.filter(course=OuterRef('pk')).order_by().values('course')
+
+    def aggregate(expression):
+        return Coalesce(Subquery(reviews.annotate(value=expression).values('value')), 0)
+
+    Course.objects.update(
+        reviews_count=aggregate(Count('id')),
+        rating_sum=aggregate(Sum('rating')),
+        **{
+            f'rating_{stars}_count': aggregate(Count('id', filter=Q(rating=stars)))
+            for stars in range(1, 6)
+        }
+    )
+    for course in Course.objects.filter(reviews_count__gt=0).only('rating_sum', 'reviews_count'):
+        course.rating = round(course.rating_sum / course.reviews_count, 2)
+        course.save(update_fields=['rating'])
+    Course.objects.filter(reviews_count=0).update(rating=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0006_review_feed_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='rating_1_count',
+            field=models.IntegerField(default=0, verbose_name='Оценок 1'),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='rating_2_count',
+            field=models.IntegerField(default=0, verbose_name='Оценок 2'),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='rating_3_count',
+            field=models.IntegerField(default=0, verbose_name='Оценок 3'),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='rating_4_count',
+            field=models.IntegerField(default=0, verbose_name='Оценок 4'),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='rating_5_count',
+            field=models.IntegerField(default=0, verbose_name='Оценок 5'),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='rating_sum',
+            field=models.IntegerField(default=0, verbose_name='Сумма оценок'),
+        ),
+        migrations.RunPython(backfill_rating_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.11 on 2026-10-18 07:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Q, Sum
+
+
+def backfill_course_progress(apps, schema_editor):
+    LessonProgress = apps.get_model('courses', 'LessonProgress')
+    CourseProgress = apps.get_model('courses', 'CourseProgress')
+
+    last_activity = {}
+    for row in LessonProgress.objects.order_by('updated_at').values(
+        'user_id', 'lesson_id', 'lesson__course_id', 'updated_at'
+    ).iterator():
+        last_activity[(row['user_id'], row['lesson__course_id'])] = (row['lesson_id'], row['updated_at'])
+
+    totals = LessonProgress.objects.order_by().values('user_id', 'lesson__course_id').annotate(
+        completed=Count('id', filter=Q(completed=True)),
+        watch_time=Sum('watch_time_seconds'),
+    )
+    summaries = []
+    for row in totals:
+        pair = (row['user_id'], row['lesson__course_id'])
+        last_lesson_id, last_activity_at = last_activity[pair]
+        summaries.append(CourseProgress(
+            user_id=pair[0],
+            course_id=pair[1],
+            completed_lessons=row['completed'],
+            watch_time_seconds=row['watch_time'] or 0,
+            last_lesson_id=last_lesson_id,
+            last_activity_at=last_activity_at,
+        ))
+    CourseProgress.objects.bulk_create(summaries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('courses', '0008_course_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed_lessons', models.IntegerField(default=0, verbose_name='Завершено уроков')),
+                ('watch_time_seconds', models.IntegerField(default=0, verbose_name='Время просмотра (сек)')),
+                ('last_activity_at', models.DateTimeField(blank=True, null=True, verbose_name='Последняя активность')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='progress_summaries', to='courses.course')),
+                ('last_lesson', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='courses.lesson', verbose_name='Последний урок')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='course_progress', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Прогресс курса',
+                'verbose_name_plural': 'Прогресс курсов',
+                'ordering': ['-last_activity_at'],
+                'unique_together': {('user', 'course')},
+            },
+        ),
+        migrations.RunPython(backfill_course_progress, migrations.RunPython.noop),
+    ]
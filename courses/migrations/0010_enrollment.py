@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def copy_students_to_enrollments(apps, schema_editor):
+    Course = apps.get_model('courses', 'Course')
+    Enrollment = apps.get_model('courses', 'Enrollment')
+    Students = Course.students.through
+    now = django.utils.timezone.now()
+
+    batch = []
+    for user_id, course_id in Students.objects.values_list('user_id', 'course_id').iterator():
+        batch.append(Enrollment(user_id=user_id, course_id=course_id, granted_at=now))
+        if len(batch) >= 1000:
+            Enrollment.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    Enrollment.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def copy_enrollments_to_students(apps, schema_editor):
+    Course = apps.get_model('courses', 'Course')
+    Enrollment = apps.get_model('courses', 'Enrollment')
+    Students = Course.students.through
+    Students.objects.bulk_create(
+        [
+            Students(user_id=user_id, course_id=course_id)
+            for user_id, course_id in Enrollment.objects.values_list('user_id', 'course_id')
+        ],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('payments', '0001_initial'),
+        ('courses', '0009_course_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Enrollment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granted_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Доступ выдан')),
+                ('expires_at', models.DateTimeField(blank=True, null=True, verbose_name='Доступ до')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='enrollments', to='courses.course')),
+                ('source_order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='enrollments', to='payments.order', verbose_name='Заказ')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='enrollments', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Доступ к курсу',
+                'verbose_name_plural': 'Доступы к курсам',
+                'unique_together': {('user', 'course')},
+                'indexes': [models.Index(fields=['user', 'course', 'expires_at'], name='courses_enrollment_access_idx')],
+            },
+        ),
+        migrations.RunPython(copy_students_to_enrollments, copy_enrollments_to_students),
+        # Django не умеет менять обычное M2M на M2M с through, поэтому
+        # автоматическая таблица удаляется, а поле создаётся заново
+        migrations.RemoveField(
+            model_name='course',
+            name='students',
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='students',
+            field=models.ManyToManyField(blank=True, related_name='purchased_courses', through='courses.Enrollment', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.11 on 2026-10-18 07:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0001_initial'),
+        ('courses', '0010_enrollment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Задача')),
+                ('state', models.JSONField(default=dict, verbose_name='Состояние')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Контрольная точка задачи',
+                'verbose_name_plural': 'Контрольные точки задач',
+            },
+        ),
+        migrations.AddField(
+            model_name='enrollment',
+            name='auto_renew',
+            field=models.BooleanField(default=True, verbose_name='Автопродление'),
+        ),
+        migrations.AddField(
+            model_name='enrollment',
+            name='renewal_order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='payments.order', verbose_name='Заказ на продление'),
+        ),
+        migrations.AddField(
+            model_name='enrollment',
+            name='status',
+            field=models.CharField(choices=[('active', 'Активен'), ('expired', 'Истёк')], default='active', max_length=20, verbose_name='Статус'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['status', 'expires_at', 'id'], name='courses_enrollment_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.11 on 2026-10-18 08:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_subscription_scheduler'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='banner_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='cover_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.11 on 2026-10-18 08:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0013_video_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='video_processed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Видео обработано'),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='video_processing_error',
+            field=models.TextField(blank=True, verbose_name='Ошибка обработки видео'),
+        ),
+    ]
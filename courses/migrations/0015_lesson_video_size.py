@@ -0,0 +1,30 @@
+# Generated by Django 4.2.11 on 2026-10-18 08:33
+
+from django.db import migrations, models
+
+
+def backfill_video_size(apps, schema_editor):
+    Lesson = apps.get_model('courses', 'Lesson')
+    lessons = Lesson.objects.exclude(video_file='').exclude(video_file__isnull=True).only('video_file')
+    for lesson in lessons.iterator():
+        try:
+            size = lesson.video_file.size
+        except OSError:
+            continue
+        Lesson.objects.filter(pk=lesson.pk).update(video_size=size)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0014_lesson_video_processing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='video_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Размер видео, байт'),
+        ),
+        migrations.RunPython(backfill_video_size, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,9 @@
 from django.db import models
+from django.db.models import Case, Count, DecimalField, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Round
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+from datetime import timedelta
 
 User = get_user_model()
 
@@ -12,6 +16,9 @@ class Course(models.Model):
     full_description = models.TextField(verbose_name="Полное описание")
     cover_image = models.ImageField(upload_to='courses/', verbose_name="Обложка", blank=True, null=True)
     banner_image = models.ImageField(upload_to='courses/banners/', verbose_name="Баннер", blank=True, null=True)
+    # Уменьшенные копии изображений (boxer_platform.renditions, обновляются сигналами)
+    cover_renditions = models.JSONField(default=dict, blank=True, editable=False)
+    banner_renditions = models.JSONField(default=dict, blank=True, editable=False)
     
     # Категория и уровень
     category = models.CharField(max_length=100, verbose_name="Категория", blank=True)
@@ -34,13 +41,27 @@ class Course(models.Model):
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=0, verbose_name="Рейтинг")
     reviews_count = models.IntegerField(default=0, verbose_name="Количество отзывов")
     
+    # Агрегаты отзывов (обновляются атомарно сигналами CourseReview)
+    rating_sum = models.IntegerField(default=0, verbose_name="Сумма оценок")
+    rating_1_count = models.IntegerField(default=0, verbose_name="Оценок 1")
+    rating_2_count = models.IntegerField(default=0, verbose_name="Оценок 2")
+    rating_3_count = models.IntegerField(default=0, verbose_name="Оценок 3")
+    rating_4_count = models.IntegerField(default=0, verbose_name="Оценок 4")
+    rating_5_count = models.IntegerField(default=0, verbose_name="Оценок 5")
+    
+    # Денормализованные данные по урокам (обновляются сигналами Lesson)
+    lessons_count = models.IntegerField(default=0, verbose_name="Количество уроков")
+    total_duration_minutes = models.IntegerField(default=0, verbose_name="Длительность уроков (минуты)")
+    
     # Преимущества курса (JSON)
     benefits = models.JSONField(default=list, verbose_name="Преимущества", blank=True)
     
     # Управление
     is_active = models.BooleanField(default=True, verbose_name="Активен")
     has_certificate = models.BooleanField(default=False, verbose_name="Сертификат прохождения")
-    students = models.ManyToManyField(User, related_name='purchased_courses', blank=True)
+    students = models.ManyToManyField(
+        User, through='Enrollment', related_name='purchased_courses', blank=True
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -52,14 +73,88 @@ class Course(models.Model):
     def __str__(self):
         return self.title
     
-    @property
-    def lessons_count(self):
-        return self.lessons.count()
+    @classmethod
+    def refresh_lesson_stats(cls, course_ids=None):
+        """
+        Пересчитать lessons_count и total_duration_minutes одним UPDATE.
+        Если course_ids не переданы - пересчитываются все курсы.
+        """
+        lessons = Lesson.objects.filter(course=OuterRef('pk')).order_by().values('course')
+        courses = cls.objects.all()
+        if course_ids is not None:
+            courses = courses.filter(pk__in=course_ids)
+        return courses.update(
+            lessons_count=Coalesce(
+                Subquery(lessons.annotate(value=Count('id')).values('value')), 0
+            ),
+            total_duration_minutes=Coalesce(
+                Subquery(lessons.annotate(value=Sum('duration_minutes')).values('value')), 0
+            ),
+        )
     
-    @property
-    def total_duration_minutes(self):
-        """Общая длительность всех уроков в минутах"""
-        return sum(lesson.duration_minutes for lesson in self.lessons.all())
+    @staticmethod
+    def _average_rating(rating_sum, reviews_count, has_reviews):
+        """Средняя оценка с округлением до сотых, 0 если отзывов нет"""
+        average = Cast(
+            Cast(rating_sum, FloatField()) / reviews_count,
+            DecimalField(max_digits=12, decimal_places=4)
+        )
+        return Case(
+            When(has_reviews, then=Round(average, 2)),
+            default=Value(0),
+            output_field=DecimalField(max_digits=3, decimal_places=2),
+        )
+    
+    @classmethod
+    def apply_review_change(cls, course_id, old_rating=None, new_rating=None):
+        """
+        Атомарно изменить агрегаты рейтинга курса одним UPDATE.
+        old_rating - удалённая/прежняя оценка, new_rating - добавленная/новая.
+        Остальные колонки курса (в т.ч. updated_at) не затрагиваются.
+        """
+        if old_rating == new_rating:
+            return 0
+        
+        count_delta = int(new_rating is not None) - int(old_rating is not None)
+        sum_delta = (new_rating or 0) - (old_rating or 0)
+        changes = {}
+        if old_rating is not None:
+            changes[f'rating_{old_rating}_count'] = F(f'rating_{old_rating}_count') - 1
+        if new_rating is not None:
+            changes[f'rating_{new_rating}_count'] = F(f'rating_{new_rating}_count') + 1
+        
+        # В SET выражения видят значения строки до обновления
+        new_count = F('reviews_count') + count_delta
+        new_sum = F('rating_sum') + sum_delta
+        changes.update(
+            reviews_count=new_count,
+            rating_sum=new_sum,
+            rating=cls._average_rating(new_sum, new_count, Q(reviews_count__gt=-count_delta)),
+        )
+        return cls.objects.filter(pk=course_id).update(**changes)
+    
+    @classmethod
+    def rebuild_rating_stats(cls, course_ids=None):
+        """Пересчитать агрегаты рейтинга по отзывам с нуля"""
+        reviews = CourseReview.objects.filter(course=OuterRef('pk')).order_by().values('course')
+        
+        def aggregate(expression):
+            return Coalesce(Subquery(reviews.annotate(value=expression).values('value')), 0)
+        
+        courses = cls.objects.all()
+        if course_ids is not None:
+            courses = courses.filter(pk__in=course_ids)
+        courses.update(
+            reviews_count=aggregate(Count('id')),
+            rating_sum=aggregate(Sum('rating')),
+            **{
+                f'rating_{stars}_count': aggregate(Count('id', filter=Q(rating=stars)))
+                for stars in range(1, 6)
+            }
+        )
+        return courses.update(
+            rating=cls._average_rating(F('rating_sum'), F('reviews_count'), Q(reviews_count__gt=0))
+        )
 
 
 class Lesson(models.Model):
@@ -80,6 +175,13 @@ class Lesson(models.Model):
         ('1:1', 'Квадратное (1:1)'),
     ]
     video_format = models.CharField(max_length=10, choices=VIDEO_FORMATS, default='16:9', verbose_name="Формат видео")
+    # Обработка загруженного MP4 (courses.mp4) выполняется командой process_lesson_videos;
+    # пусто - файл ещё не обработан
+    video_processed_at = models.DateTimeField(null=True, blank=True, verbose_name="Видео обработано")
+    video_processing_error = models.TextField(blank=True, verbose_name="Ошибка обработки видео")
+    # Размер video_file в байтах, записывается при загрузке: превью (courses.media)
+    # оценивает по нему лимит байт без обращения к хранилищу
+    video_size = models.PositiveBigIntegerField(null=True, blank=True, verbose_name="Размер видео, байт")
     
     # Контент урока
     text_content = models.TextField(verbose_name="Текстовое описание", blank=True)
@@ -105,6 +207,13 @@ class Lesson(models.Model):
     def __str__(self):
         return f"{self.course.title} - {self.title}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем исходный курс, чтобы при переносе урока обновить оба курса
+        instance._loaded_course_id = instance.__dict__.get('course_id')
+        return instance
+    
     def get_video_url(self):
         """Возвращает URL видео - либо загруженного файла, либо внешнего URL"""
         if self.video_file:
@@ -132,6 +241,141 @@ class LessonProgress(models.Model):
         return f"{self.user.email} - {self.lesson.title}"
 
 
+class EnrollmentQuerySet(models.QuerySet):
+    def active(self, at=None):
+        """Доступ действует (пожизненный или ещё не истёк)"""
+        at = at or timezone.now()
+        return self.filter(models.Q(expires_at__isnull=True) | models.Q(expires_at__gt=at))
+
+
+class Enrollment(models.Model):
+    """Доступ пользователя к курсу"""
+    # Срок доступа для подписок, пожизненный доступ не истекает
+    ACCESS_PERIODS = {
+        'monthly': timedelta(days=30),
+        'yearly': timedelta(days=365),
+    }
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='enrollments')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='enrollments')
+    granted_at = models.DateTimeField(default=timezone.now, verbose_name="Доступ выдан")
+    expires_at = models.DateTimeField(null=True, blank=True, verbose_name="Доступ до")
+    source_order = models.ForeignKey(
+        'payments.Order', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='enrollments', verbose_name="Заказ"
+    )
+    
+    # Состояние подписки (обновляется командой process_subscriptions)
+    STATUS_CHOICES = [
+        ('active', 'Активен'),
+        ('expired', 'Истёк'),
+    ]
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active', verbose_name="Статус")
+    auto_renew = models.BooleanField(default=True, verbose_name="Автопродление")
+    renewal_order = models.ForeignKey(
+        'payments.Order', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='+', verbose_name="Заказ на продление"
+    )
+    
+    objects = EnrollmentQuerySet.as_manager()
+    
+    class Meta:
+        unique_together = ('user', 'course')
+        verbose_name = "Доступ к курсу"
+        verbose_name_plural = "Доступы к курсам"
+        indexes = [
+            # Проверка доступа: WHERE user_id = ? AND course_id = ? AND expires_at > now()
+            models.Index(fields=['user', 'course', 'expires_at'], name='courses_enrollment_access_idx'),
+            # Обход истекающих подписок планировщиком по ключу (expires_at, id)
+            models.Index(fields=['status', 'expires_at', 'id'], name='courses_enrollment_expiry_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.email} - {self.course.title}"
+    
+    @property
+    def is_active(self):
+        return self.expires_at is None or self.expires_at > timezone.now()
+    
+    @classmethod
+    def default_expires_at(cls, course, granted_at):
+        """Окончание доступа по access_type курса; None - пожизненный доступ"""
+        period = cls.ACCESS_PERIODS.get(course.access_type)
+        return granted_at + period if period else None
+    
+    def save(self, *args, **kwargs):
+        # Новый доступ без явного срока к подписочному курсу не должен стать пожизненным
+        # (Course.students.add() обрабатывается в courses.signals)
+        if self._state.adding and self.expires_at is None:
+            self.expires_at = self.default_expires_at(self.course, self.granted_at)
+        super().save(*args, **kwargs)
+    
+    @classmethod
+    def grant(cls, user, course, order=None):
+        """
+        Выдать или продлить доступ к курсу согласно его access_type.
+        Действующая подписка продлевается от даты окончания, истёкшая - от текущего момента.
+        """
+        now = timezone.now()
+        enrollment, created = cls.objects.get_or_create(
+            user=user,
+            course=course,
+            defaults={'granted_at': now}
+        )
+        
+        period = cls.ACCESS_PERIODS.get(course.access_type)
+        if period is None or (not created and enrollment.expires_at is None):
+            # Пожизненный доступ (в т.ч. уже выданный ранее) не ограничиваем
+            enrollment.expires_at = None
+        elif not created and enrollment.is_active:
+            enrollment.expires_at += period
+        else:
+            enrollment.granted_at = now
+            enrollment.expires_at = now + period
+        
+        enrollment.source_order = order or enrollment.source_order
+        enrollment.status = 'active'
+        enrollment.renewal_order = None
+        enrollment.save()
+        return enrollment
+
+
+class JobCheckpoint(models.Model):
+    """Позиция пакетной задачи для продолжения после сбоя"""
+    name = models.CharField(max_length=100, unique=True, verbose_name="Задача")
+    state = models.JSONField(default=dict, verbose_name="Состояние")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Контрольная точка задачи"
+        verbose_name_plural = "Контрольные точки задач"
+    
+    def __str__(self):
+        return self.name
+
+
+class CourseProgress(models.Model):
+    """Сводный прогресс пользователя по курсу (обновляется при изменении LessonProgress)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='course_progress')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='progress_summaries')
+    completed_lessons = models.IntegerField(default=0, verbose_name="Завершено уроков")
+    watch_time_seconds = models.IntegerField(default=0, verbose_name="Время просмотра (сек)")
+    last_lesson = models.ForeignKey(
+        Lesson, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='+', verbose_name="Последний урок"
+    )
+    last_activity_at = models.DateTimeField(null=True, blank=True, verbose_name="Последняя активность")
+    
+    class Meta:
+        unique_together = ('user', 'course')
+        verbose_name = "Прогресс курса"
+        verbose_name_plural = "Прогресс курсов"
+        ordering = ['-last_activity_at']
+    
+    def __str__(self):
+        return f"{self.user.email} - {self.course.title}"
+
+
 class CourseReview(models.Model):
     """Отзывы о курсе"""
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='reviews')
@@ -146,6 +390,66 @@ class CourseReview(models.Model):
         verbose_name = "Отзыв"
         verbose_name_plural = "Отзывы"
         ordering = ['-created_at']
+        indexes = [
+            # Лента отзывов курса с пагинацией по (created_at, id)
+            models.Index(fields=['course', '-created_at', '-id'], name='courses_review_feed_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.email} - {self.course.title} ({self.rating}/5)"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Исходная оценка нужна для инкрементального пересчёта рейтинга курса
+        instance._loaded_rating = instance.__dict__.get('rating')
+        instance._loaded_course_id = instance.__dict__.get('course_id')
+        return instance
+
+
+class VideoUpload(models.Model):
+    """
+    Возобновляемая загрузка видео урока частями (courses.uploads).
+    Части пишутся сразу по своим смещениям в заранее созданный файл,
+    полученные диапазоны хранятся в VideoUploadChunk.
+    """
+    STATUS_UPLOADING = 'uploading'
+    STATUS_PROCESSING = 'processing'
+    STATUS_COMPLETE = 'complete'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_UPLOADING, 'Загружается'),
+        (STATUS_PROCESSING, 'Обрабатывается'),
+        (STATUS_COMPLETE, 'Завершена'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+    
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='video_uploads')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    filename = models.CharField(max_length=255, verbose_name="Имя файла")
+    size = models.BigIntegerField(verbose_name="Размер (байт)")
+    sha256 = models.CharField(max_length=64, verbose_name="Контрольная сумма SHA-256")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_UPLOADING)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = "Загрузка видео"
+        verbose_name_plural = "Загрузки видео"
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.filename} ({self.get_status_display()})"
+
+
+class VideoUploadChunk(models.Model):
+    """Полученный диапазон байт [start, end) загрузки"""
+    upload = models.ForeignKey(VideoUpload, on_delete=models.CASCADE, related_name='chunks')
+    start = models.BigIntegerField()
+    end = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['start']
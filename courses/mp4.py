@@ -0,0 +1,276 @@
+"""
+Постобработка загруженных MP4 без внешних утилит.
+
+Файл разбирается по боксам (ISO BMFF): верхний уровень читается только по
+заголовкам с seek, в память загружается лишь moov. Если moov записан после
+mdat (так пишет большинство энкодеров по умолчанию), браузер не может начать
+воспроизведение, пока не скачает файл целиком. faststart() переносит moov
+перед mdat и сдвигает смещения чанков в stco/co64 на размер moov.
+
+read_video_info() достаёт длительность из mvhd и размеры кадра из tkhd
+видеодорожки с учётом матрицы поворота (вертикальные ролики с телефона
+часто записаны как 1920x1080 с поворотом на 90°).
+
+Перезапись файла размером в гигабайты не укладывается в HTTP-запрос,
+поэтому process_lesson_video вызывается только из команды
+process_lesson_videos для уроков без video_processed_at.
+"""
+import math
+import os
+import struct
+import tempfile
+
+from django.utils import timezone
+
+COPY_CHUNK_SIZE = 1024 * 1024
+# Боксы, внутри которых могут находиться tkhd/hdlr/stco
+CONTAINER_BOXES = {b'moov', b'trak', b'mdia', b'minf', b'stbl', b'edts'}
+
+
+class Mp4Error(Exception):
+    """Файл не является поддерживаемым MP4"""
+
+
+def _read_box_header(f, offset, end):
+    """Вернуть (type, size, header_size) бокса по смещению offset"""
+    f.seek(offset)
+    header = f.read(8)
+    if len(header) < 8:
+        raise Mp4Error('Обрезанный заголовок бокса')
+    size, box_type = struct.unpack('>I4s', header)
+    header_size = 8
+    if size == 1:
+        largesize = f.read(8)
+        if len(largesize) < 8:
+            raise Mp4Error('Обрезанный заголовок бокса')
+        size = struct.unpack('>Q', largesize)[0]
+        header_size = 16
+    elif size == 0:
+        size = end - offset
+    if size < header_size or offset + size > end:
+        raise Mp4Error(f'Некорректный размер бокса {box_type!r}')
+    return box_type, size, header_size
+
+
+def iter_top_level_boxes(f, file_size):
+    """Боксы верхнего уровня: (type, offset, size, header_size)"""
+    offset = 0
+    while offset < file_size:
+        box_type, size, header_size = _read_box_header(f, offset, file_size)
+        yield box_type, offset, size, header_size
+        offset += size
+
+
+def _iter_buffer_boxes(buf, start, end):
+    """Дочерние боксы внутри загруженного в память контейнера"""
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', buf, offset)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', buf, offset + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size or offset + size > end:
+            raise Mp4Error(f'Некорректный размер бокса {box_type!r}')
+        yield box_type, offset, size, header_size
+        offset += size
+
+
+def _walk(buf, start, end):
+    """Рекурсивный обход контейнеров moov"""
+    for box_type, offset, size, header_size in _iter_buffer_boxes(buf, start, end):
+        yield box_type, offset, size, header_size
+        if box_type in CONTAINER_BOXES:
+            yield from _walk(buf, offset + header_size, offset + size)
+
+
+def _find_moov(f, file_size):
+    moov = mdat = None
+    for box_type, offset, size, header_size in iter_top_level_boxes(f, file_size):
+        if box_type == b'moov' and moov is None:
+            moov = (offset, size)
+        elif box_type == b'mdat' and mdat is None:
+            mdat = (offset, size)
+    if moov is None:
+        raise Mp4Error('В файле нет moov')
+    return moov, mdat
+
+
+def _read_moov(f, offset, size):
+    f.seek(offset)
+    buf = bytearray(f.read(size))
+    if len(buf) < size:
+        raise Mp4Error('Обрезанный moov')
+    return buf
+
+
+def _parse_tkhd(buf, body):
+    """Ширина и высота кадра из tkhd с учётом поворота"""
+    version = buf[body]
+    # После version/flags: времена, track_id, duration, reserved, layer...
+    matrix_offset = body + (4 + 32 + 8 + 8 if version == 1 else 4 + 20 + 8 + 8)
+    a, b, _, c, d = struct.unpack_from('>5i', buf, matrix_offset)
+    width, height = struct.unpack_from('>II', buf, matrix_offset + 36)
+    width, height = width / 65536, height / 65536
+    # Поворот на 90/270 градусов: a = d = 0, b = ±1, c = ∓1
+    if a == 0 and d == 0 and b != 0 and c != 0:
+        width, height = height, width
+    return width, height
+
+
+def read_video_info(path):
+    """
+    Длительность (сек) и размеры кадра видеодорожки.
+    Возвращает {'duration_seconds', 'width', 'height'}; width/height = None,
+    если видеодорожка не найдена.
+    """
+    with open(path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        (moov_offset, moov_size), _ = _find_moov(f, file_size)
+        buf = _read_moov(f, moov_offset, moov_size)
+
+    duration = None
+    width = height = None
+    _, _, _, moov_header = next(_iter_buffer_boxes(buf, 0, len(buf)))
+    for box_type, offset, size, header_size in _iter_buffer_boxes(buf, moov_header, len(buf)):
+        body = offset + header_size
+        if box_type == b'mvhd':
+            if buf[body] == 1:
+                timescale, length = struct.unpack_from('>IQ', buf, body + 4 + 16)
+            else:
+                timescale, length = struct.unpack_from('>II', buf, body + 4 + 8)
+            if timescale:
+                duration = length / timescale
+        elif box_type == b'trak' and width is None:
+            track_size = None
+            handler = None
+            for child_type, child_offset, _, child_header in _walk(buf, body, offset + size):
+                child_body = child_offset + child_header
+                if child_type == b'tkhd':
+                    track_size = _parse_tkhd(buf, child_body)
+                elif child_type == b'hdlr':
+                    handler = bytes(buf[child_body + 8:child_body + 12])
+            if handler == b'vide' and track_size and all(track_size):
+                width, height = track_size
+
+    if duration is None:
+        raise Mp4Error('В moov нет mvhd')
+    return {'duration_seconds': duration, 'width': width, 'height': height}
+
+
+def _shift_chunk_offsets(buf, low, high, shift):
+    """Сдвинуть смещения чанков, попадающие в [low, high), на shift байт"""
+    for box_type, offset, _, header_size in _walk(buf, 0, len(buf)):
+        if box_type == b'cmov':
+            raise Mp4Error('Сжатый moov не поддерживается')
+        if box_type not in (b'stco', b'co64'):
+            continue
+        body = offset + header_size
+        entry_count = struct.unpack_from('>I', buf, body + 4)[0]
+        fmt, width = ('>I', 4) if box_type == b'stco' else ('>Q', 8)
+        limit = 2 ** (width * 8)
+        position = body + 8
+        for _ in range(entry_count):
+            value = struct.unpack_from(fmt, buf, position)[0]
+            if low <= value < high:
+                value += shift
+                if value >= limit:
+                    raise Mp4Error('Смещение не помещается в stco')
+                struct.pack_into(fmt, buf, position, value)
+            position += width
+
+
+def _copy_range(src, dst, start, length):
+    src.seek(start)
+    while length > 0:
+        chunk = src.read(min(COPY_CHUNK_SIZE, length))
+        if not chunk:
+            raise Mp4Error('Файл изменился во время обработки')
+        dst.write(chunk)
+        length -= len(chunk)
+
+
+def faststart(path):
+    """
+    Перенести moov перед первым mdat. Файл заменяется атомарно.
+    Возвращает True, если файл был переписан, False - если moov уже в начале.
+    """
+    with open(path, 'rb') as src:
+        file_size = os.fstat(src.fileno()).st_size
+        (moov_offset, moov_size), mdat = _find_moov(src, file_size)
+        if mdat is None or moov_offset < mdat[0]:
+            return False
+
+        insert_at = mdat[0]
+        buf = _read_moov(src, moov_offset, moov_size)
+        if struct.unpack_from('>I', buf, 0)[0] == 0:
+            # moov «до конца файла» после переноса должен получить явный размер
+            if moov_size > 0xFFFFFFFF:
+                raise Mp4Error('Слишком большой moov')
+            struct.pack_into('>I', buf, 0, moov_size)
+        # Данные между mdat и старым moov сдвигаются на размер moov
+        _shift_chunk_offsets(buf, insert_at, moov_offset, moov_size)
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.mp4.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as dst:
+                _copy_range(src, dst, 0, insert_at)
+                dst.write(buf)
+                _copy_range(src, dst, insert_at, moov_offset - insert_at)
+                tail = moov_offset + moov_size
+                _copy_range(src, dst, tail, file_size - tail)
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return True
+
+
+def nearest_video_format(width, height, choices):
+    """Ближайший к пропорциям кадра формат из choices ('16:9', '9:16', ...)"""
+    ratio = width / height
+
+    def distance(choice):
+        w, h = choice.split(':')
+        return abs(math.log(ratio * int(h) / int(w)))
+
+    return min(choices, key=distance)
+
+
+def process_lesson_video(lesson):
+    """
+    Подготовить загруженное видео урока: faststart, длительность и формат.
+    Возвращает True, если файл был переписан. Поля урока сохраняются через
+    save(), поэтому сигналы пересчитывают статистику курса. Ошибка разбора
+    сохраняется в video_processing_error, чтобы файл не обрабатывался повторно.
+    """
+    path = lesson.video_file.path
+    try:
+        rewritten = faststart(path)
+        info = read_video_info(path)
+    except (Mp4Error, OSError) as e:
+        lesson.video_processed_at = timezone.now()
+        lesson.video_processing_error = str(e)
+        lesson.save(update_fields=['video_processed_at', 'video_processing_error', 'updated_at'])
+        raise
+
+    lesson.duration_minutes = max(1, round(info['duration_seconds'] / 60))
+    # Перенос moov размер файла не меняет (stco не расширяется до co64:
+    # при переполнении faststart выбрасывает Mp4Error); здесь заполняется
+    # размер файлов, загруженных до появления video_size
+    lesson.video_size = os.path.getsize(path)
+    lesson.video_processed_at = timezone.now()
+    lesson.video_processing_error = ''
+    update_fields = [
+        'duration_minutes', 'video_size', 'video_processed_at', 'video_processing_error', 'updated_at',
+    ]
+    if info['width']:
+        formats = [value for value, _ in lesson.VIDEO_FORMATS]
+        lesson.video_format = nearest_video_format(info['width'], info['height'], formats)
+        update_fields.append('video_format')
+    lesson.save(update_fields=update_fields)
+    return rewritten
@@ -0,0 +1,303 @@
+"""
+Буферизация частых обновлений прогресса просмотра (heartbeat плеера).
+
+Позиция и время просмотра складываются в общий кэш (Redis при REDIS_URL)
+и периодически записываются в LessonProgress пачками upsert-запросов
+командой flush_progress_heartbeats. Если кэш локален для процесса
+(LocMemCache без REDIS_URL), команда его не увидит, поэтому
+буферизация выключается и heartbeat пишется в БД сразу
+(is_buffering_enabled).
+
+Устройство буфера:
+- progress-buffer:data:<user>:<lesson> - последние присланные значения;
+- progress-buffer:pending:<user>:<lesson> - пара уже стоит в очереди;
+- progress-buffer:slot:<n> - очередь пар, n выдаётся атомарным incr;
+- progress-buffer:flushed - номер последнего записанного слота.
+Флашер сначала снимает отметку pending, потом читает данные, поэтому
+heartbeat, пришедший во время записи, снова попадёт в очередь.
+Отметка pending живёт PENDING_TIMEOUT: если слот пары потерян (писатель
+упал между incr и записью слота), пара снова встанет в очередь со
+следующим heartbeat после истечения отметки.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from boxer_platform.cache import is_shared_cache
+
+from .caching import catalog_cache_timeout, get_catalog_version
+from .entitlements import get_purchased_course_ids
+from .models import CourseProgress, Lesson, LessonProgress
+
+BUFFER_TIMEOUT = 60 * 60 * 6
+# Намного больше интервала флашера, но меньше BUFFER_TIMEOUT
+PENDING_TIMEOUT = 60 * 10
+LESSON_ACCESS_TIMEOUT = 60 * 60
+HEARTBEAT_FIELDS = ('last_position_seconds', 'watch_time_seconds')
+
+SEQ_KEY = 'progress-buffer:seq'
+FLUSHED_KEY = 'progress-buffer:flushed'
+STALLED_KEY = 'progress-buffer:stalled'
+
+
+def _data_key(user_id, lesson_id):
+    return f'progress-buffer:data:{user_id}:{lesson_id}'
+
+
+def _pending_key(user_id, lesson_id):
+    return f'progress-buffer:pending:{user_id}:{lesson_id}'
+
+
+def _slot_key(slot):
+    return f'progress-buffer:slot:{slot}'
+
+
+def get_lesson_access_info(lesson_id):
+    """
+    (course_id, is_free_preview) урока без обращения к БД на горячем пути.
+    Ключ включает версию каталога, поэтому изменение урока сбрасывает кэш.
+    Возвращает None, если урока нет.
+    """
+    key = f'lesson-access:{get_catalog_version()}:{lesson_id}'
+    info = cache.get(key)
+    if info is None:
+        info = Lesson.objects.filter(id=lesson_id).values_list('course_id', 'is_free_preview').first()
+        if info is None:
+            return None
+        cache.set(key, tuple(info), catalog_cache_timeout(LESSON_ACCESS_TIMEOUT))
+    return info
+
+
+def is_buffering_enabled():
+    """Буфер работает только в кэше, общем с flush_progress_heartbeats"""
+    return is_shared_cache()
+
+
+def buffer_heartbeat(user_id, lesson_id, values):
+    """Сохранить значения heartbeat в буфер (без записи в БД)"""
+    data_key = _data_key(user_id, lesson_id)
+    data = cache.get(data_key) or {}
+    data.update({field: values[field] for field in HEARTBEAT_FIELDS if field in values})
+    data['at'] = timezone.now()
+    cache.set(data_key, data, BUFFER_TIMEOUT)
+    
+    # Ставим пару в очередь только один раз до следующей записи
+    if cache.add(_pending_key(user_id, lesson_id), True, PENDING_TIMEOUT):
+        cache.add(SEQ_KEY, 0, None)
+        slot = cache.incr(SEQ_KEY)
+        cache.set(_slot_key(slot), (user_id, lesson_id), BUFFER_TIMEOUT)
+
+
+def discard_heartbeat(user_id, lesson_id):
+    """Удалить буферизованные значения (например, после сквозной записи)"""
+    cache.delete(_data_key(user_id, lesson_id))
+
+
+def sync_progress(user, items):
+    """
+    Применить прогресс по нескольким урокам одним upsert.
+    items - провалидированные элементы ProgressSyncItemSerializer.
+    Возвращает {lesson_id: 'ok' | 'not_found' | 'forbidden'}.
+    """
+    # Для повторяющихся уроков берём последний элемент
+    items = {item['lesson']: item for item in items}
+    lessons = dict(
+        (lesson_id, (course_id, is_free_preview))
+        for lesson_id, course_id, is_free_preview in Lesson.objects.filter(id__in=items)
+        .values_list('id', 'course_id', 'is_free_preview')
+    )
+    purchased = get_purchased_course_ids(user)
+    
+    results = {}
+    allowed = []
+    for lesson_id in items:
+        if lesson_id not in lessons:
+            results[lesson_id] = 'not_found'
+        elif not lessons[lesson_id][1] and lessons[lesson_id][0] not in purchased:
+            results[lesson_id] = 'forbidden'
+        else:
+            results[lesson_id] = 'ok'
+            allowed.append(lesson_id)
+    if not allowed:
+        return results
+    
+    now = timezone.now()
+    with transaction.atomic():
+        existing = {
+            progress.lesson_id: progress
+            for progress in LessonProgress.objects.select_for_update().filter(
+                user=user, lesson_id__in=allowed
+            )
+        }
+        objects = []
+        for lesson_id in allowed:
+            item = items[lesson_id]
+            progress = existing.get(lesson_id) or LessonProgress(user=user, lesson_id=lesson_id)
+            if item.get('completed') and not progress.completed:
+                progress.completed = True
+                progress.completed_at = now
+            for field in HEARTBEAT_FIELDS:
+                if field in item:
+                    setattr(progress, field, item[field])
+            progress.updated_at = now
+            objects.append(progress)
+        
+        LessonProgress.objects.bulk_create(
+            objects,
+            update_conflicts=True,
+            unique_fields=['user', 'lesson'],
+            update_fields=['completed', 'completed_at', *HEARTBEAT_FIELDS, 'updated_at'],
+        )
+        refresh_course_progress({
+            (user.id, lessons[lesson_id][0]): (lesson_id, now)
+            for lesson_id in allowed
+        })
+    
+    # Более старые heartbeat из буфера не должны перезаписать эти значения
+    cache.delete_many([_data_key(user.id, lesson_id) for lesson_id in allowed])
+    return results
+
+
+def refresh_course_progress(activity):
+    """
+    Обновить сводный прогресс CourseProgress для затронутых пар.
+    activity: {(user_id, course_id): (lesson_id, at) или None}, где
+    (lesson_id, at) - урок и время последней активности, None - активность
+    не менялась (например, при удалении прогресса урока).
+    Выполняет один агрегирующий запрос и upsert на каждую группу полей.
+    """
+    if not activity:
+        return
+    
+    rows = (
+        LessonProgress.objects
+        .filter(
+            user_id__in={user_id for user_id, _ in activity},
+            lesson__course_id__in={course_id for _, course_id in activity},
+        )
+        .order_by()
+        .values('user', 'lesson__course')
+        .annotate(
+            completed=Count('id', filter=Q(completed=True)),
+            watch_time=Coalesce(Sum('watch_time_seconds'), 0),
+        )
+    )
+    totals = {(row['user'], row['lesson__course']): row for row in rows}
+    
+    summary_fields = ['completed_lessons', 'watch_time_seconds']
+    with_activity, without_activity = [], []
+    for (user_id, course_id), last in activity.items():
+        total = totals.get((user_id, course_id), {})
+        summary = CourseProgress(
+            user_id=user_id,
+            course_id=course_id,
+            completed_lessons=total.get('completed', 0),
+            watch_time_seconds=total.get('watch_time', 0),
+        )
+        if last is None:
+            without_activity.append(summary)
+        else:
+            summary.last_lesson_id, summary.last_activity_at = last
+            with_activity.append(summary)
+    
+    for summaries, fields in (
+        (with_activity, summary_fields + ['last_lesson', 'last_activity_at']),
+        (without_activity, summary_fields),
+    ):
+        if summaries:
+            CourseProgress.objects.bulk_create(
+                summaries,
+                update_conflicts=True,
+                unique_fields=['user', 'course'],
+                update_fields=fields,
+            )
+
+
+def _write_batch(entries):
+    """Записать пачку {(user_id, lesson_id): data} upsert-ами по уникальному ключу"""
+    # Уроки могли быть удалены, пока значения лежали в буфере
+    existing_lessons = dict(
+        Lesson.objects.filter(id__in={lesson_id for _, lesson_id in entries})
+        .values_list('id', 'course_id')
+    )
+    
+    # Группируем по набору присланных полей, чтобы не затирать
+    # непереданные значения нулями
+    groups = {}
+    activity = {}
+    for (user_id, lesson_id), data in entries.items():
+        if lesson_id not in existing_lessons:
+            continue
+        pair = (user_id, existing_lessons[lesson_id])
+        if pair not in activity or activity[pair][1] < data['at']:
+            activity[pair] = (lesson_id, data['at'])
+        fields = tuple(field for field in HEARTBEAT_FIELDS if field in data)
+        if not fields:
+            continue
+        groups.setdefault(fields, []).append(LessonProgress(
+            user_id=user_id,
+            lesson_id=lesson_id,
+            updated_at=data['at'],
+            **{field: data[field] for field in fields}
+        ))
+    
+    written = 0
+    for fields, objects in groups.items():
+        LessonProgress.objects.bulk_create(
+            objects,
+            update_conflicts=True,
+            unique_fields=['user', 'lesson'],
+            update_fields=list(fields) + ['updated_at'],
+        )
+        written += len(objects)
+    
+    refresh_course_progress(activity)
+    return written
+
+
+def flush_heartbeats(batch_size=500):
+    """
+    Записать накопленные heartbeat в LessonProgress.
+    Должна выполняться одним процессом (см. flush_progress_heartbeats).
+    Возвращает количество записанных строк.
+    """
+    flushed = cache.get(FLUSHED_KEY, 0)
+    last = cache.get(SEQ_KEY, 0)
+    written = 0
+    
+    while flushed < last:
+        slots = range(flushed + 1, min(flushed + batch_size, last) + 1)
+        slot_values = cache.get_many([_slot_key(slot) for slot in slots])
+        
+        pairs = []
+        for slot in slots:
+            pair = slot_values.get(_slot_key(slot))
+            if pair is None:
+                # Слот выдан, но ещё не записан писателем. Ждём одну итерацию,
+                # затем считаем его потерянным: пара вернётся в очередь,
+                # когда истечёт её отметка pending (PENDING_TIMEOUT)
+                if cache.get(STALLED_KEY) != slot:
+                    cache.set(STALLED_KEY, slot, None)
+                    break
+            else:
+                pairs.append(tuple(pair))
+            flushed = slot
+        
+        if pairs:
+            cache.delete_many([_pending_key(*pair) for pair in pairs])
+            values = cache.get_many([_data_key(*pair) for pair in pairs])
+            entries = {
+                pair: values[_data_key(*pair)]
+                for pair in pairs
+                if _data_key(*pair) in values
+            }
+            written += _write_batch(entries)
+        
+        cache.delete_many([_slot_key(slot) for slot in slots if slot <= flushed])
+        cache.set(FLUSHED_KEY, flushed, None)
+        if flushed < slots[-1]:
+            break
+    
+    return written
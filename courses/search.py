@@ -0,0 +1,147 @@
+"""
+Поиск и фасетная фильтрация каталога курсов.
+
+Полнотекстовый индекс зависит от СУБД:
+- PostgreSQL: генерируемая колонка courses_course.search_vector (tsvector,
+  словарь russian) с GIN-индексом, поддерживается самой базой;
+- SQLite: таблица FTS5 courses_course_fts, обновляется сигналами Course;
+- остальные: поиск через icontains (без индекса).
+"""
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import connections
+from django.db.models import BooleanField, Count, FloatField, Max, Min, Q
+from django.db.models.expressions import RawSQL
+from rest_framework.exceptions import ValidationError
+
+FACET_FIELDS = ('category', 'level', 'access_type')
+SEARCH_FIELDS = ('title', 'description', 'full_description')
+FTS_TABLE = 'courses_course_fts'
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _fts5_query(query):
+    """Запрос FTS5: все слова обязательны, каждое как префикс"""
+    words = _WORD_RE.findall(query.lower())
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_courses(queryset, query):
+    """Отфильтровать курсы по тексту и отсортировать по релевантности"""
+    query = query.strip()
+    if not query:
+        return queryset
+    
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        tsquery = "websearch_to_tsquery('russian', %s)"
+        return queryset.annotate(
+            search_match=RawSQL(f'courses_course.search_vector @@ {tsquery}', [query],
+                                output_field=BooleanField()),
+            search_rank=RawSQL(f'ts_rank(courses_course.search_vector, {tsquery})', [query],
+                               output_field=FloatField()),
+        ).filter(search_match=True).order_by('-search_rank', '-created_at')
+    
+    if vendor == 'sqlite':
+        fts_query = _fts5_query(query)
+        if not fts_query:
+            return queryset.none()
+        # Запрос идёт от индекса FTS: совпавшие записи соединяются с курсами
+        # по rowid один раз, ранг берётся из того же MATCH. Соединение с
+        # виртуальной таблицей ORM не выражает, поэтому extra().
+        # bm25() возвращает меньшие значения для более релевантных документов
+        return queryset.extra(
+            select={'search_rank': f'bm25({FTS_TABLE})'},
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE} MATCH %s', f'{FTS_TABLE}.rowid = courses_course.id'],
+            params=[fts_query],
+        ).order_by('search_rank', '-created_at')
+    
+    condition = Q()
+    for field in SEARCH_FIELDS:
+        condition |= Q(**{f'{field}__icontains': query})
+    return queryset.filter(condition)
+
+
+def index_course(course):
+    """Обновить запись курса в индексе FTS5 (для PostgreSQL ничего не нужно)"""
+    connection = connections[course._state.db or 'default']
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [course.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, description, full_description) '
+            f'VALUES (%s, %s, %s, %s)',
+            [course.pk, course.title, course.description, course.full_description]
+        )
+
+
+def unindex_course(course):
+    connection = connections[course._state.db or 'default']
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [course.pk])
+
+
+def parse_catalog_filters(query_params):
+    """
+    Фильтры каталога из query-параметров:
+    ?search=...&category=a,b&level=...&access_type=...&price_min=..&price_max=..
+    """
+    filters = {'search': query_params.get('search', '')}
+    for field in FACET_FIELDS:
+        values = [value for value in query_params.get(field, '').split(',') if value]
+        if values:
+            filters[field] = values
+    
+    for param in ('price_min', 'price_max'):
+        value = query_params.get(param)
+        if value in (None, ''):
+            continue
+        try:
+            filters[param] = Decimal(value)
+        except InvalidOperation:
+            raise ValidationError({param: 'Введите число'})
+    return filters
+
+
+def apply_catalog_filters(queryset, filters, exclude=None):
+    """Применить фасетные фильтры и диапазон цен (кроме exclude: фасет или 'price')"""
+    for field in FACET_FIELDS:
+        if field != exclude and field in filters:
+            queryset = queryset.filter(**{f'{field}__in': filters[field]})
+    if exclude != 'price':
+        if 'price_min' in filters:
+            queryset = queryset.filter(price__gte=filters['price_min'])
+        if 'price_max' in filters:
+            queryset = queryset.filter(price__lte=filters['price_max'])
+    return queryset
+
+
+def catalog_facets(queryset, filters):
+    """
+    Количество курсов по значениям фасетов.
+    Для каждого фасета учитываются все фильтры, кроме его собственного,
+    чтобы клиент видел, сколько курсов даст выбор другого значения.
+    """
+    facets = {}
+    for field in FACET_FIELDS:
+        rows = (
+            apply_catalog_filters(queryset, filters, exclude=field)
+            .order_by()
+            .values(field)
+            .annotate(count=Count('id'))
+            .order_by(field)
+        )
+        facets[field] = [{'value': row[field], 'count': row['count']} for row in rows]
+    
+    facets['price'] = (
+        apply_catalog_filters(queryset, filters, exclude='price')
+        .order_by()
+        .aggregate(min=Min('price'), max=Max('price'))
+    )
+    return facets
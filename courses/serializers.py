@@ -1,5 +1,20 @@
+import os
+
+from django.conf import settings
+from django.http import Http404
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Course, Lesson, LessonProgress, CourseReview
+from boxer_platform.renditions import ImageRenditionsField
+from .entitlements import has_course_access
+from .media import lesson_video_path, sign_media_url
+from .models import Course, CourseProgress, Lesson, LessonProgress, CourseReview, VideoUpload
+from .uploads import received_ranges
+
+
+def _request_has_access(context, course_id):
+    """Купил ли курс пользователь из запроса в контексте сериализатора"""
+    request = context.get('request')
+    return bool(request) and has_course_access(request.user, course_id)
 
 
 class LessonProgressSerializer(serializers.ModelSerializer):
@@ -19,8 +34,14 @@ class LessonSerializer(serializers.ModelSerializer):
                   'preview_duration_seconds', 'progress')
     
     def get_video_url(self, obj):
-        """Возвращает URL видео"""
+        """
+        Возвращает URL видео. Для загруженного файла - временная подписанная
+        ссылка, выдаваемая только при наличии доступа (для бесплатного
+        превью без покупки - с ограничением preview_duration_seconds).
+        """
         request = self.context.get('request')
+        if obj.video_file:
+            return self._signed_video_url(obj, request)
         video_url = obj.get_video_url()
         
         # Если это относительный URL (загруженный файл), делаем абсолютным
@@ -28,14 +49,29 @@ class LessonSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(video_url)
         return video_url
     
+    def _signed_video_url(self, obj, request):
+        purchased = _request_has_access(self.context, obj.course_id)
+        if not purchased and not obj.is_free_preview:
+            return None
+        try:
+            path = lesson_video_path(obj)
+        except Http404:
+            return None
+        
+        preview_seconds = None if purchased else obj.preview_duration_seconds
+        url = reverse('signed_media', args=[sign_media_url(obj, path, preview_seconds)])
+        return request.build_absolute_uri(url) if request else url
+    
     def get_progress(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            try:
-                progress = LessonProgress.objects.get(user=request.user, lesson=obj)
+            # Прогресс мог быть заранее загружен через prefetch (см. CourseViewSet)
+            if hasattr(obj, 'user_progress'):
+                progress = obj.user_progress[0] if obj.user_progress else None
+            else:
+                progress = LessonProgress.objects.filter(user=request.user, lesson=obj).first()
+            if progress is not None:
                 return LessonProgressSerializer(progress).data
-            except LessonProgress.DoesNotExist:
-                return None
         return None
     
     def to_representation(self, instance):
@@ -44,14 +80,7 @@ class LessonSerializer(serializers.ModelSerializer):
         
         # Если урок не бесплатный превью и пользователь не купил курс - ограничить доступ
         if request and not instance.is_free_preview:
-            user = request.user
-            if user.is_authenticated:
-                has_access = instance.course.students.filter(id=user.id).exists()
-                if not has_access:
-                    data['video_url'] = None
-                    data['text_content'] = data['text_content'][:200] + '...' if data['text_content'] else ''
-                    data['resources'] = []
-            else:
+            if not _request_has_access(self.context, instance.course_id):
                 data['video_url'] = None
                 data['text_content'] = data['text_content'][:200] + '...' if data['text_content'] else ''
                 data['resources'] = []
@@ -73,11 +102,13 @@ class CourseReviewSerializer(serializers.ModelSerializer):
 
 class CourseListSerializer(serializers.ModelSerializer):
     lessons_count = serializers.IntegerField(read_only=True)
+    cover_renditions = ImageRenditionsField('cover_image')
     
     class Meta:
         model = Course
-        fields = ('id', 'title', 'slug', 'description', 'cover_image', 'price', 'duration_hours', 
-                  'level', 'category', 'rating', 'reviews_count', 'lessons_count', 'access_type')
+        fields = ('id', 'title', 'slug', 'description', 'cover_image', 'cover_renditions', 'price',
+                  'duration_hours', 'level', 'category', 'rating', 'reviews_count', 'lessons_count',
+                  'access_type')
 
 
 class CourseDetailSerializer(serializers.ModelSerializer):
@@ -86,35 +117,46 @@ class CourseDetailSerializer(serializers.ModelSerializer):
     total_duration_minutes = serializers.IntegerField(read_only=True)
     is_purchased = serializers.SerializerMethodField()
     user_progress = serializers.SerializerMethodField()
-    reviews = CourseReviewSerializer(many=True, read_only=True)
+    reviews = CourseReviewSerializer(source='latest_reviews', many=True, read_only=True)
+    rating_histogram = serializers.SerializerMethodField()
+    cover_renditions = ImageRenditionsField('cover_image')
+    banner_renditions = ImageRenditionsField('banner_image')
     
     class Meta:
         model = Course
         fields = ('id', 'title', 'slug', 'description', 'full_description', 'cover_image', 
-                  'banner_image', 'price', 'duration_hours', 'level', 'category', 'rating', 
+                  'cover_renditions', 'banner_image', 'banner_renditions', 'price', 'duration_hours', 'level', 'category', 'rating', 
                   'reviews_count', 'benefits', 'access_type', 'has_certificate', 
                   'lessons_count', 'total_duration_minutes', 'lessons', 'is_purchased', 
-                  'user_progress', 'reviews', 'created_at')
+                  'user_progress', 'reviews', 'rating_histogram', 'created_at')
     
     def get_is_purchased(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.students.filter(id=request.user.id).exists()
-        return False
+        return _request_has_access(self.context, obj.id)
+    
+    def get_rating_histogram(self, obj):
+        """Количество отзывов по числу звёзд: {"1": .., ..., "5": ..}"""
+        return {str(stars): getattr(obj, f'rating_{stars}_count') for stars in range(1, 6)}
     
     def get_user_progress(self, obj):
         """Прогресс пользователя по курсу"""
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            total_lessons = obj.lessons.count()
+            lessons = obj.lessons.all()
+            total_lessons = len(lessons)
             if total_lessons == 0:
                 return {'completed': 0, 'total': 0, 'percentage': 0}
             
-            completed_lessons = LessonProgress.objects.filter(
-                user=request.user,
-                lesson__course=obj,
-                completed=True
-            ).count()
+            if hasattr(lessons[0], 'user_progress'):
+                completed_lessons = sum(
+                    1 for lesson in lessons
+                    if any(progress.completed for progress in lesson.user_progress)
+                )
+            else:
+                completed_lessons = LessonProgress.objects.filter(
+                    user=request.user,
+                    lesson__course=obj,
+                    completed=True
+                ).count()
             
             return {
                 'completed': completed_lessons,
@@ -128,3 +170,57 @@ class LessonProgressSerializer(serializers.ModelSerializer):
     class Meta:
         model = LessonProgress
         fields = ('lesson', 'completed', 'completed_at', 'watch_time_seconds')
+
+
+class CourseProgressSerializer(serializers.ModelSerializer):
+    course_slug = serializers.CharField(source='course.slug', read_only=True)
+    course_title = serializers.CharField(source='course.title', read_only=True)
+    total_lessons = serializers.IntegerField(source='course.lessons_count', read_only=True)
+    percentage = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = CourseProgress
+        fields = ('course', 'course_slug', 'course_title', 'completed_lessons', 'total_lessons',
+                  'percentage', 'watch_time_seconds', 'last_lesson', 'last_activity_at')
+    
+    def get_percentage(self, obj):
+        if not obj.course.lessons_count:
+            return 0
+        return round((obj.completed_lessons / obj.course.lessons_count) * 100, 2)
+
+
+class VideoUploadSerializer(serializers.ModelSerializer):
+    received = serializers.SerializerMethodField()
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$')
+    
+    class Meta:
+        model = VideoUpload
+        fields = ('id', 'lesson', 'filename', 'size', 'sha256', 'status', 'error', 'received',
+                  'created_at', 'completed_at')
+        read_only_fields = ('id', 'status', 'error', 'created_at', 'completed_at')
+    
+    def get_received(self, obj):
+        """Полученные диапазоны [[start, end), ...] для докачки"""
+        return received_ranges(obj)
+    
+    def validate_filename(self, value):
+        return os.path.basename(value)
+    
+    def validate_size(self, value):
+        if value <= 0 or value > settings.VIDEO_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError('Недопустимый размер файла')
+        return value
+
+
+class ProgressHeartbeatSerializer(serializers.Serializer):
+    last_position_seconds = serializers.IntegerField(min_value=0, required=False)
+    watch_time_seconds = serializers.IntegerField(min_value=0, required=False)
+    completed = serializers.BooleanField(required=False, default=False)
+
+
+class ProgressSyncItemSerializer(ProgressHeartbeatSerializer):
+    lesson = serializers.IntegerField()
+
+
+class ProgressSyncSerializer(serializers.Serializer):
+    items = serializers.ListField(child=serializers.DictField(), allow_empty=False, max_length=200)
@@ -0,0 +1,164 @@
+from django.db.models import F, QuerySet
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from boxer_platform.renditions import COURSE_BANNER_WIDTHS, COURSE_COVER_WIDTHS, delete_renditions, sync_renditions
+from .caching import bump_catalog_version
+from .entitlements import invalidate_entitlements
+from .models import Course, CourseProgress, Enrollment, Lesson, LessonProgress, CourseReview
+from .progress import refresh_course_progress
+from .search import index_course, unindex_course
+
+
+@receiver(post_save, sender=Lesson)
+def lesson_saved(sender, instance, **kwargs):
+    """Обновить счётчики уроков курса (и прежнего курса при переносе)"""
+    course_ids = {instance.course_id}
+    loaded_course_id = getattr(instance, '_loaded_course_id', None)
+    if loaded_course_id is not None:
+        course_ids.add(loaded_course_id)
+    instance._loaded_course_id = instance.course_id
+    Course.refresh_lesson_stats(course_ids)
+
+
+def _deleted_directly(origin, model):
+    """Удаление инициировано самой моделью, а не каскадом от родителя"""
+    if isinstance(origin, QuerySet):
+        return origin.model is model
+    return isinstance(origin, model)
+
+
+@receiver(post_delete, sender=Lesson)
+def lesson_deleted(sender, instance, origin=None, **kwargs):
+    Course.refresh_lesson_stats([instance.course_id])
+    if _deleted_directly(origin, Lesson):
+        user_ids = CourseProgress.objects.filter(
+            course_id=instance.course_id
+        ).values_list('user_id', flat=True)
+        refresh_course_progress({(user_id, instance.course_id): None for user_id in user_ids})
+
+
+def _progress_course_id(progress):
+    if LessonProgress.lesson.is_cached(progress):
+        return progress.lesson.course_id
+    return Lesson.objects.filter(pk=progress.lesson_id).values_list('course_id', flat=True).first()
+
+
+@receiver(post_save, sender=LessonProgress)
+def lesson_progress_saved(sender, instance, **kwargs):
+    """Обновить сводный прогресс пользователя по курсу"""
+    course_id = _progress_course_id(instance)
+    if course_id is not None:
+        refresh_course_progress({
+            (instance.user_id, course_id): (instance.lesson_id, instance.updated_at)
+        })
+
+
+@receiver(post_delete, sender=LessonProgress)
+def lesson_progress_deleted(sender, instance, origin=None, **kwargs):
+    # При каскадном удалении (курса, урока, пользователя) сводка
+    # удаляется или пересчитывается обработчиком родителя
+    if not _deleted_directly(origin, LessonProgress):
+        return
+    course_id = _progress_course_id(instance)
+    if course_id is not None:
+        refresh_course_progress({(instance.user_id, course_id): None})
+
+
+@receiver(post_save, sender=CourseReview)
+def review_saved(sender, instance, created, **kwargs):
+    """Инкрементально обновить рейтинг курса"""
+    loaded_course_id = getattr(instance, '_loaded_course_id', None)
+    old_rating = None if created else getattr(instance, '_loaded_rating', None)
+    
+    if loaded_course_id is not None and loaded_course_id != instance.course_id:
+        Course.apply_review_change(loaded_course_id, old_rating=old_rating)
+        old_rating = None
+    Course.apply_review_change(instance.course_id, old_rating=old_rating, new_rating=instance.rating)
+    
+    instance._loaded_rating = instance.rating
+    instance._loaded_course_id = instance.course_id
+
+
+@receiver(post_delete, sender=CourseReview)
+def review_deleted(sender, instance, **kwargs):
+    old_rating = getattr(instance, '_loaded_rating', instance.rating)
+    Course.apply_review_change(instance.course_id, old_rating=old_rating)
+
+
+@receiver(post_save, sender=Course)
+def course_saved(sender, instance, **kwargs):
+    index_course(instance)
+
+
+@receiver(post_save, sender=Course)
+def course_images_saved(sender, instance, **kwargs):
+    """Сгенерировать копии обложки и баннера (до сброса кэша каталога ниже)"""
+    sync_renditions(instance, 'cover_image', 'cover_renditions', COURSE_COVER_WIDTHS)
+    sync_renditions(instance, 'banner_image', 'banner_renditions', COURSE_BANNER_WIDTHS)
+
+
+@receiver(post_delete, sender=Course)
+def course_images_deleted(sender, instance, **kwargs):
+    delete_renditions(instance.cover_image.storage, instance.cover_renditions)
+    delete_renditions(instance.banner_image.storage, instance.banner_renditions)
+
+
+@receiver(post_delete, sender=Course)
+def course_deleted(sender, instance, **kwargs):
+    unindex_course(instance)
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+@receiver(post_save, sender=CourseReview)
+@receiver(post_delete, sender=CourseReview)
+def catalog_changed(sender, **kwargs):
+    """Сбросить кэш ответов каталога"""
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def enrollment_changed(sender, instance, **kwargs):
+    """Сбросить кэш прав доступа при выдаче, продлении или отзыве доступа"""
+    invalidate_entitlements(instance.user_id)
+
+
+def _set_subscription_expiry(instance, reverse, pk_set):
+    """
+    students.add() создаёт Enrollment через bulk_create без save(), поэтому
+    срок подписки (Enrollment.default_expires_at) проставляется здесь:
+    одним UPDATE на каждый тип подписки.
+    """
+    added = Enrollment.objects.filter(expires_at__isnull=True)
+    if reverse:
+        added = added.filter(user=instance, course_id__in=pk_set)
+    else:
+        added = added.filter(course=instance, user_id__in=pk_set)
+    for access_type, period in Enrollment.ACCESS_PERIODS.items():
+        added.filter(course__access_type=access_type).update(expires_at=F('granted_at') + period)
+
+
+@receiver(m2m_changed, sender=Course.students.through)
+def course_students_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Course.students.add()/remove() пишут в Enrollment без сигналов модели"""
+    if action == 'pre_clear' and not reverse:
+        instance._cleared_student_ids = list(instance.students.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    
+    if action == 'post_add' and pk_set:
+        _set_subscription_expiry(instance, reverse, pk_set)
+    
+    if reverse:
+        user_ids = [instance.pk]
+    elif action == 'post_clear':
+        user_ids = getattr(instance, '_cleared_student_ids', [])
+    else:
+        user_ids = pk_set or []
+    
+    for user_id in user_ids:
+        invalidate_entitlements(user_id)
@@ -0,0 +1,518 @@
+import hashlib
+import os
+import struct
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from payments.models import Order
+
+from .management.commands.process_subscriptions import Command as ProcessSubscriptionsCommand
+from .models import (
+    Course, CourseProgress, CourseReview, Enrollment, JobCheckpoint, Lesson, LessonProgress, VideoUpload,
+)
+from .mp4 import faststart, read_video_info
+from .progress import flush_heartbeats
+
+User = get_user_model()
+
+
+class CourseDetailQueriesTest(APITestCase):
+    """Число запросов к БД у /api/courses/<slug>/ не зависит от числа уроков"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('student', 'student@example.com', 'password')
+
+    def make_course(self, slug, lessons_count):
+        course = Course.objects.create(
+            title='Основы бокса', slug=slug, description='d', full_description='fd', price=10
+        )
+        Lesson.objects.bulk_create(
+            Lesson(course=course, title=f'Урок {index}', order_index=index, duration_minutes=5)
+            for index in range(lessons_count)
+        )
+        Enrollment.grant(self.user, course)
+        for lesson in course.lessons.all()[:2]:
+            LessonProgress.objects.create(user=self.user, lesson=lesson, completed=True)
+        return course
+
+    def assert_detail_queries(self, course, num):
+        # Кэш каталога и доступов (в том числе на объекте пользователя)
+        # сбрасывается, чтобы все запросы были одинаково холодными
+        cache.clear()
+        self.client.force_authenticate(User.objects.get(pk=self.user.pk))
+        with self.assertNumQueries(num):
+            response = self.client.get(f'/api/courses/{course.slug}/', secure=True)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_query_count_is_constant(self):
+        small = self.make_course('small', 3)
+        large = self.make_course('large', 30)
+
+        response = self.assert_detail_queries(small, 5)
+        self.assertEqual(len(response.data['lessons']), 3)
+
+        response = self.assert_detail_queries(large, 5)
+        self.assertEqual(len(response.data['lessons']), 30)
+        self.assertTrue(response.data['is_purchased'])
+
+
+class CourseReviewsPaginationTest(APITestCase):
+    """Отзывы курса по курсору (created_at, id) и гистограмма оценок"""
+
+    def setUp(self):
+        self.course = Course.objects.create(
+            title='Основы бокса', slug='osnovy', description='d', full_description='fd', price=10
+        )
+        for index in range(12):
+            user = User.objects.create_user(f'user{index}', f'user{index}@example.com')
+            CourseReview.objects.create(course=self.course, user=user, rating=index % 5 + 1, comment=str(index))
+        # Одинаковое время: порядок и курсор держатся на id
+        CourseReview.objects.update(created_at=timezone.now())
+
+    def test_pages_cover_all_reviews_once(self):
+        url = f'/api/courses/{self.course.id}/reviews/?page_size=5'
+        comments, sizes = [], []
+        while url:
+            response = self.client.get(url, secure=True)
+            self.assertEqual(response.status_code, 200)
+            sizes.append(len(response.data['results']))
+            comments += [review['comment'] for review in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(sizes, [5, 5, 2])
+        self.assertEqual(comments, [str(index) for index in reversed(range(12))])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(f'/api/courses/{self.course.id}/reviews/?cursor=zzz', secure=True)
+        self.assertEqual(response.status_code, 404)
+
+    def test_detail_histogram(self):
+        response = self.client.get(f'/api/courses/{self.course.slug}/', secure=True)
+        self.assertEqual(response.data['rating_histogram'], {'1': 3, '2': 3, '3': 2, '4': 2, '5': 2})
+        self.assertEqual(len(response.data['reviews']), 5)
+
+
+class CourseRatingAggregatesTest(TestCase):
+    """Агрегаты рейтинга обновляются инкрементально и сходятся с пересчётом"""
+
+    def setUp(self):
+        self.course = Course.objects.create(
+            title='Основы бокса', slug='osnovy', description='d', full_description='fd', price=10
+        )
+        self.users = [User.objects.create_user(f'user{index}', f'user{index}@example.com') for index in range(4)]
+
+    def stats(self):
+        course = Course.objects.get(pk=self.course.pk)
+        return (
+            str(course.rating), course.reviews_count, course.rating_sum,
+            [getattr(course, f'rating_{stars}_count') for stars in range(1, 6)],
+        )
+
+    def test_create_update_delete(self):
+        reviews = [
+            CourseReview.objects.create(course=self.course, user=user, rating=rating)
+            for user, rating in zip(self.users, [5, 4, 4, 1])
+        ]
+        self.assertEqual(self.stats(), ('3.50', 4, 14, [1, 0, 0, 2, 1]))
+
+        reviews[3].rating = 3
+        reviews[3].save()
+        self.assertEqual(self.stats(), ('4.00', 4, 16, [0, 0, 1, 2, 1]))
+
+        reviews[0].delete()
+        self.assertEqual(self.stats(), ('3.67', 3, 11, [0, 0, 1, 2, 0]))
+
+        for review in reviews[1:]:
+            review.delete()
+        self.assertEqual(self.stats(), ('0.00', 0, 0, [0, 0, 0, 0, 0]))
+
+    def test_repeated_save_is_idempotent(self):
+        review = CourseReview.objects.create(course=self.course, user=self.users[0], rating=4)
+        expected = self.stats()
+
+        review.save()
+        review.save()
+        CourseReview.objects.get(pk=review.pk).save()
+
+        self.assertEqual(self.stats(), expected)
+        self.assertEqual(expected, ('4.00', 1, 4, [0, 0, 0, 1, 0]))
+
+    def test_rebuild_matches_incremental_and_is_idempotent(self):
+        for user, rating in zip(self.users, [5, 2, 2]):
+            CourseReview.objects.create(course=self.course, user=user, rating=rating)
+        expected = self.stats()
+        Course.objects.filter(pk=self.course.pk).update(rating_sum=99, reviews_count=7, rating_5_count=0)
+
+        Course.rebuild_rating_stats()
+        self.assertEqual(self.stats(), expected)
+        Course.rebuild_rating_stats()
+        self.assertEqual(self.stats(), expected)
+
+
+class ProgressHeartbeatTest(APITestCase):
+    """Heartbeat: буфер в общем кэше с записью флашером, без него - сразу в БД"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('student', 'student@example.com')
+        self.client.force_authenticate(self.user)
+        course = Course.objects.create(
+            title='Основы бокса', slug='osnovy', description='d', full_description='fd', price=10
+        )
+        self.lesson = Lesson.objects.create(course=course, title='Джеб', is_free_preview=True)
+
+    def heartbeat(self, **data):
+        return self.client.post(
+            f'/api/courses/lessons/{self.lesson.id}/progress/heartbeat/', data, format='json', secure=True
+        )
+
+    def progress(self):
+        return list(LessonProgress.objects.values_list('last_position_seconds', 'watch_time_seconds', 'completed'))
+
+    def test_write_through_without_shared_cache(self):
+        response = self.heartbeat(last_position_seconds=30, watch_time_seconds=10)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.progress(), [(30, 10, False)])
+        self.assertEqual(flush_heartbeats(), 0)
+
+    @mock.patch('courses.progress.is_shared_cache', return_value=True)
+    def test_buffered_and_flushed_with_shared_cache(self, _):
+        self.heartbeat(last_position_seconds=30, watch_time_seconds=10)
+        response = self.heartbeat(last_position_seconds=42)
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.progress(), [])
+        self.assertEqual(flush_heartbeats(), 1)
+        self.assertEqual(self.progress(), [(42, 10, False)])
+        self.assertEqual(CourseProgress.objects.get(user=self.user).last_lesson_id, self.lesson.id)
+        self.assertEqual(flush_heartbeats(), 0)
+
+        # После записи пара снова встаёт в очередь
+        self.heartbeat(last_position_seconds=50)
+        self.assertEqual(flush_heartbeats(), 1)
+        self.assertEqual(self.progress(), [(50, 10, False)])
+
+    @mock.patch('courses.progress.is_shared_cache', return_value=True)
+    def test_completion_is_written_through(self, _):
+        self.heartbeat(last_position_seconds=30)
+        response = self.heartbeat(last_position_seconds=300, completed=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.progress(), [(300, 0, True)])
+        # Буферизованное раньше значение не перезапишет завершение
+        flush_heartbeats()
+        self.assertEqual(self.progress(), [(300, 0, True)])
+
+
+class ProgressSyncTest(APITestCase):
+    """Пакетная синхронизация прогресса: результат по каждому уроку и один upsert"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('student', 'student@example.com')
+        self.client.force_authenticate(self.user)
+        purchased = Course.objects.create(title='Купленный', slug='a', description='d', full_description='fd', price=10)
+        other = Course.objects.create(title='Чужой', slug='b', description='d', full_description='fd', price=10)
+        Enrollment.grant(self.user, purchased)
+        self.first, self.second = [
+            Lesson.objects.create(course=purchased, title=f'Урок {index}', order_index=index) for index in range(2)
+        ]
+        self.closed = Lesson.objects.create(course=other, title='Закрытый')
+        self.preview = Lesson.objects.create(course=other, title='Превью', is_free_preview=True)
+        LessonProgress.objects.create(user=self.user, lesson=self.first, completed=True, watch_time_seconds=100)
+
+    def test_mixed_batch(self):
+        items = [
+            {'lesson': self.first.id, 'last_position_seconds': 5},
+            {'lesson': self.second.id, 'completed': True, 'watch_time_seconds': 60},
+            {'lesson': self.closed.id, 'completed': True},
+            {'lesson': self.preview.id, 'watch_time_seconds': 3},
+            {'lesson': 999999},
+            {'lesson': 'x'},
+        ]
+        response = self.client.post('/api/courses/progress/sync/', {'items': items}, format='json', secure=True)
+
+        self.assertEqual(response.status_code, 200)
+        statuses = {result['lesson']: result['status'] for result in response.data['results']}
+        self.assertEqual(statuses, {
+            self.first.id: 'ok', self.second.id: 'ok', self.closed.id: 'forbidden',
+            self.preview.id: 'ok', 999999: 'not_found', 'x': 'invalid',
+        })
+        progress = {
+            lesson_id: (completed, watch_time, position)
+            for lesson_id, completed, watch_time, position in LessonProgress.objects.values_list(
+                'lesson', 'completed', 'watch_time_seconds', 'last_position_seconds'
+            )
+        }
+        # Непереданные поля и завершение урока не сбрасываются
+        self.assertEqual(progress, {
+            self.first.id: (True, 100, 5),
+            self.second.id: (True, 60, 0),
+            self.preview.id: (False, 3, 0),
+        })
+        summary = CourseProgress.objects.get(user=self.user, course=self.first.course)
+        self.assertEqual((summary.completed_lessons, summary.watch_time_seconds), (2, 160))
+
+    def test_empty_batch(self):
+        response = self.client.post('/api/courses/progress/sync/', {'items': []}, format='json', secure=True)
+        self.assertEqual(response.status_code, 400)
+
+
+class ProcessSubscriptionsTest(TestCase):
+    """Продление и завершение подписок пачками с контрольной точкой"""
+
+    def setUp(self):
+        self.now = timezone.now()
+        monthly = Course.objects.create(
+            title='Подписка', slug='m', description='d', full_description='fd', price=10, access_type='monthly'
+        )
+        lifetime = Course.objects.create(title='Навсегда', slug='l', description='d', full_description='fd', price=10)
+        users = User.objects.bulk_create([User(username=f'user{index}', email=f'user{index}@x') for index in range(24)])
+        Enrollment.objects.bulk_create([
+            Enrollment(
+                user=user, course=monthly, auto_renew=index % 4 != 0,
+                expires_at=self.now + timedelta(days=index % 6 - 3, hours=1),
+            )
+            for index, user in enumerate(users)
+        ] + [Enrollment(user=user, course=lifetime) for user in users[:5]])
+        self.to_renew = set(Enrollment.objects.filter(
+            course=monthly, auto_renew=True, expires_at__lte=self.now + timedelta(days=3)
+        ).values_list('id', flat=True))
+        self.to_expire = set(Enrollment.objects.filter(expires_at__lte=self.now).values_list('id', flat=True))
+
+    def run_command(self):
+        call_command('process_subscriptions', '--batch-size', '5', stdout=StringIO())
+
+    def assert_processed(self):
+        renewed = Enrollment.objects.exclude(renewal_order=None)
+        self.assertEqual(set(renewed.values_list('id', flat=True)), self.to_renew)
+        self.assertEqual(Order.objects.filter(status='pending').count(), len(self.to_renew))
+        for enrollment in renewed.select_related('renewal_order'):
+            self.assertEqual(
+                (enrollment.renewal_order.user_id, enrollment.renewal_order.course_id),
+                (enrollment.user_id, enrollment.course_id),
+            )
+        expired = Enrollment.objects.filter(status='expired')
+        self.assertEqual(set(expired.values_list('id', flat=True)), self.to_expire)
+        self.assertEqual(JobCheckpoint.objects.get(name='process_subscriptions').state, {})
+
+    def test_renew_and_expire(self):
+        self.assertTrue(self.to_renew and self.to_expire)
+        self.run_command()
+        self.assert_processed()
+
+        # Повторный запуск не создаёт новых заказов
+        self.run_command()
+        self.assert_processed()
+
+    def test_resumes_after_crash(self):
+        create_orders = ProcessSubscriptionsCommand.create_renewal_orders
+        calls = []
+
+        def crash_on_second_batch(command, batch):
+            calls.append(len(batch))
+            if len(calls) == 2:
+                raise RuntimeError('сбой')
+            return create_orders(command, batch)
+
+        with mock.patch.object(ProcessSubscriptionsCommand, 'create_renewal_orders', crash_on_second_batch):
+            with self.assertRaises(RuntimeError):
+                self.run_command()
+        state = JobCheckpoint.objects.get(name='process_subscriptions').state
+        self.assertEqual(state['phase'], 'renew')
+        self.assertEqual(Order.objects.count(), 5)
+
+        self.run_command()
+        self.assert_processed()
+
+
+def _box(box_type, payload):
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def _full_box(box_type, payload, version=0):
+    return _box(box_type, bytes([version, 0, 0, 0]) + payload)
+
+
+def _moov_last_mp4(chunks):
+    """
+    Синтетический MP4 с moov после mdat: вертикальный ролик 1920x1080
+    с поворотом на 90°, 300 секунд. Возвращает (данные, размер ftyp,
+    размер moov, смещения чанков в stco).
+    """
+    ftyp = _box(b'ftyp', b'isom' + bytes(4))
+    mdat_start = len(ftyp) + 8
+    offsets = [mdat_start + sum(len(chunk) for chunk in chunks[:index]) for index in range(len(chunks))]
+    mvhd = _full_box(b'mvhd', struct.pack('>IIII', 0, 0, 1000, 300000) + bytes(80))
+    matrix = struct.pack('>9i', 0, 65536, 0, -65536, 0, 0, 0, 0, 1 << 30)
+    tkhd = _full_box(b'tkhd', bytes(20 + 16) + matrix + struct.pack('>II', 1920 << 16, 1080 << 16))
+    hdlr = _full_box(b'hdlr', bytes(4) + b'vide' + bytes(12) + b'\0')
+    stco = _full_box(b'stco', struct.pack(f'>I{len(offsets)}I', len(offsets), *offsets))
+    mdia = _box(b'mdia', hdlr + _box(b'minf', _box(b'stbl', stco)))
+    moov = _box(b'moov', mvhd + _box(b'trak', tkhd + mdia))
+    return ftyp + _box(b'mdat', b''.join(chunks)) + moov, len(ftyp), len(moov), offsets
+
+
+class FaststartTest(SimpleTestCase):
+    """Перенос moov и чтение заголовков на синтетическом MP4 (moov после mdat)"""
+
+    CHUNKS = [b'a' * 40, b'b' * 60]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'video.mp4')
+
+    def write_moov_last(self):
+        data, ftyp_size, moov_size, offsets = _moov_last_mp4(self.CHUNKS)
+        with open(self.path, 'wb') as f:
+            f.write(data)
+        return ftyp_size, moov_size, offsets
+
+    def read_offsets(self, data):
+        position = data.index(b'stco') + 8
+        count = struct.unpack_from('>I', data, position)[0]
+        return list(struct.unpack_from(f'>{count}I', data, position + 4))
+
+    def test_moov_is_moved_and_offsets_shifted(self):
+        ftyp_size, moov_size, offsets = self.write_moov_last()
+        original_size = os.path.getsize(self.path)
+
+        self.assertTrue(faststart(self.path))
+
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        self.assertEqual(len(data), original_size)
+        self.assertEqual(data[ftyp_size + 4:ftyp_size + 8], b'moov')
+        self.assertEqual(data[ftyp_size + moov_size + 4:ftyp_size + moov_size + 8], b'mdat')
+        new_offsets = self.read_offsets(data)
+        self.assertEqual(new_offsets, [offset + moov_size for offset in offsets])
+        for offset, chunk in zip(new_offsets, self.CHUNKS):
+            self.assertEqual(data[offset:offset + len(chunk)], chunk)
+
+    def test_read_video_info(self):
+        self.write_moov_last()
+        info = read_video_info(self.path)
+        self.assertEqual(info['duration_seconds'], 300)
+        # Размеры с учётом поворота
+        self.assertEqual((info['width'], info['height']), (1080, 1920))
+
+    def test_unchanged_file_returns_false(self):
+        self.write_moov_last()
+        faststart(self.path)
+        with open(self.path, 'rb') as f:
+            before = f.read()
+
+        self.assertFalse(faststart(self.path))
+
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), before)
+
+
+class VideoUploadTest(APITestCase):
+    """Загрузка частями по Content-Range, завершение и обработка process_lesson_videos"""
+
+    PART_SIZE = 100
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(
+            MEDIA_ROOT=os.path.join(directory.name, 'media'),
+            VIDEO_UPLOAD_TEMP_DIR=os.path.join(directory.name, 'uploads'),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.upload_dir = os.path.join(directory.name, 'uploads')
+
+        course = Course.objects.create(title='Основы бокса', slug='osnovy', description='d', full_description='fd', price=10)
+        self.lesson = Lesson.objects.create(course=course, title='Джеб')
+        self.lesson.video_file.save('old.mp4', ContentFile(b'old'))
+        self.old_path = self.lesson.video_file.path
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com'))
+        self.data = _moov_last_mp4([b'a' * 150, b'b' * 170])[0]
+
+    def start(self, data, filename='../../Джеб.mp4'):
+        response = self.client.post('/api/courses/uploads/', {
+            'lesson': self.lesson.id, 'filename': filename, 'size': len(data),
+            'sha256': hashlib.sha256(data).hexdigest(),
+        }, format='json', secure=True)
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def put(self, upload_id, start, end, data=None, content_range=None):
+        return self.client.generic(
+            'PUT', f'/api/courses/uploads/{upload_id}/', (data or self.data)[start:end],
+            content_type='application/octet-stream', secure=True,
+            HTTP_CONTENT_RANGE=content_range or f'bytes {start}-{end - 1}/{len(data or self.data)}',
+        )
+
+    def complete(self, upload_id):
+        return self.client.post(f'/api/courses/uploads/{upload_id}/complete/', secure=True)
+
+    def process(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('process_lesson_videos', stdout=StringIO())
+
+    def test_chunk_assembly_and_completion(self):
+        upload_id = self.start(self.data)
+        size = len(self.data)
+        parts = [(start, min(start + self.PART_SIZE, size)) for start in range(0, size, self.PART_SIZE)]
+
+        self.assertEqual(self.put(upload_id, *parts[0]).data['received'], [[0, self.PART_SIZE]])
+        self.assertEqual(self.put(upload_id, 0, 10, content_range=f'bytes 0-20/{size}').status_code, 400)
+        self.assertEqual(self.put(upload_id, 0, 10, content_range='bytes 0-9/5').status_code, 400)
+        self.assertEqual(self.complete(upload_id).status_code, 400)
+
+        # Части в обратном порядке и повтор уже полученной
+        for start, end in reversed(parts[1:]):
+            self.put(upload_id, start, end)
+        response = self.put(upload_id, *parts[0])
+        self.assertEqual(response.data['received'], [[0, size]])
+
+        response = self.complete(upload_id)
+        self.assertEqual((response.status_code, response.data['status']), (202, VideoUpload.STATUS_PROCESSING))
+        self.assertEqual(self.complete(upload_id).status_code, 400)
+        self.assertEqual(self.put(upload_id, *parts[0]).status_code, 409)
+
+        self.process()
+
+        upload = VideoUpload.objects.get(id=upload_id)
+        self.assertEqual((upload.status, upload.error), (VideoUpload.STATUS_COMPLETE, ''))
+        self.lesson.refresh_from_db()
+        self.assertTrue(self.lesson.video_file.name.startswith('lessons/videos/Джеб'))
+        self.assertEqual(self.lesson.video_size, size)
+        self.assertEqual((self.lesson.duration_minutes, self.lesson.video_format), (5, '9:16'))
+        with open(self.lesson.video_file.path, 'rb') as f:
+            stored = f.read()
+        self.assertEqual(len(stored), size)
+        self.assertLess(stored.index(b'moov'), stored.index(b'mdat'))
+        self.assertFalse(os.path.exists(self.old_path))
+        self.assertEqual(os.listdir(self.upload_dir), [])
+        self.assertFalse(upload.chunks.exists())
+
+    def test_checksum_mismatch_fails(self):
+        upload_id = self.start(self.data)
+        corrupted = b'x' + self.data[1:]
+        self.put(upload_id, 0, len(corrupted), data=corrupted)
+        self.assertEqual(self.complete(upload_id).status_code, 202)
+
+        self.process()
+
+        upload = VideoUpload.objects.get(id=upload_id)
+        self.assertEqual(upload.status, VideoUpload.STATUS_FAILED)
+        self.lesson.refresh_from_db()
+        self.assertEqual(self.lesson.video_file.path, self.old_path)
+        self.assertTrue(os.path.exists(self.old_path))
+        self.assertEqual(os.listdir(self.upload_dir), [])
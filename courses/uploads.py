@@ -0,0 +1,166 @@
+"""
+Возобновляемая загрузка больших видео уроков частями.
+
+1. POST uploads/ с {lesson, filename, size, sha256} создаёт VideoUpload и
+   файл нужного размера в VIDEO_UPLOAD_TEMP_DIR (разреженный, место не
+   занимается заранее).
+2. PUT uploads/<id>/ с заголовком Content-Range: bytes start-end/size
+   записывает тело запроса сразу по смещению start. Части можно слать
+   параллельно и повторять - каждый полученный диапазон фиксируется
+   отдельной строкой VideoUploadChunk.
+3. GET uploads/<id>/ возвращает полученные диапазоны, по ним клиент
+   докачивает недостающее после обрыва связи.
+4. POST uploads/<id>/complete/ проверяет, что файл получен целиком,
+   переводит загрузку в processing и сразу отвечает 202.
+5. Команда process_lesson_videos (finish_upload) сверяет SHA-256,
+   переносит файл в lessons/videos/, удаляет прежнее видео урока и
+   обрабатывает MP4 (courses.mp4) - чтение многогигабайтного файла не
+   укладывается в HTTP-запрос. Клиент узнаёт результат по GET uploads/<id>/.
+
+Тело читается из потока блоками по COPY_CHUNK_SIZE, поэтому расход памяти
+не зависит ни от размера части, ни от размера файла.
+"""
+import hashlib
+import os
+import re
+import shutil
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .models import VideoUpload, VideoUploadChunk
+from .mp4 import Mp4Error, process_lesson_video
+
+COPY_CHUNK_SIZE = 1024 * 1024
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class UploadError(Exception):
+    """Некорректная часть или незавершённая загрузка"""
+
+
+def _part_path(upload):
+    return os.path.join(settings.VIDEO_UPLOAD_TEMP_DIR, f'{upload.id}.part')
+
+
+def create_upload_file(upload):
+    """Создать файл размера upload.size, в который будут писаться части"""
+    os.makedirs(settings.VIDEO_UPLOAD_TEMP_DIR, exist_ok=True)
+    with open(_part_path(upload), 'wb') as f:
+        f.truncate(upload.size)
+
+
+def parse_content_range(header, size):
+    """Заголовок Content-Range -> (start, end) с end не включительно"""
+    match = CONTENT_RANGE_RE.match(header or '')
+    if not match:
+        raise UploadError('Ожидается заголовок Content-Range: bytes start-end/size')
+    start, last, total = (int(value) for value in match.groups())
+    if total != size or start > last or last >= size:
+        raise UploadError('Диапазон не соответствует размеру файла')
+    return start, last + 1
+
+
+def write_chunk(upload, stream, start, end):
+    """Записать end - start байт из stream по смещению start"""
+    remaining = end - start
+    with open(_part_path(upload), 'r+b') as f:
+        f.seek(start)
+        while remaining > 0:
+            data = stream.read(min(COPY_CHUNK_SIZE, remaining))
+            if not data:
+                raise UploadError('Тело запроса короче указанного диапазона')
+            f.write(data)
+            remaining -= len(data)
+    VideoUploadChunk.objects.create(upload=upload, start=start, end=end)
+
+
+def received_ranges(upload):
+    """Объединённые полученные диапазоны: [[start, end), ...]"""
+    ranges = []
+    for start, end in upload.chunks.order_by('start', 'end').values_list('start', 'end'):
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+    return ranges
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def complete_upload(upload):
+    """
+    Проверить полноту и поставить загрузку в очередь обработки.
+    Статус переводится в processing условным UPDATE, поэтому повторный
+    или параллельный запрос завершения не обработает файл дважды.
+    """
+    if received_ranges(upload) != [[0, upload.size]]:
+        raise UploadError('Файл получен не полностью')
+    claimed = VideoUpload.objects.filter(
+        id=upload.id, status=VideoUpload.STATUS_UPLOADING
+    ).update(status=VideoUpload.STATUS_PROCESSING, updated_at=timezone.now())
+    if not claimed:
+        raise UploadError('Загрузка уже завершается или завершена')
+    upload.refresh_from_db()
+    return upload
+
+
+def _fail(upload, error):
+    upload.status = VideoUpload.STATUS_FAILED
+    upload.error = error
+    upload.save(update_fields=['status', 'error', 'updated_at'])
+
+
+def finish_upload(upload):
+    """
+    Сверить контрольную сумму, привязать файл к уроку и обработать MP4.
+    Вызывается командой process_lesson_videos для загрузок в processing.
+    """
+    path = _part_path(upload)
+    try:
+        checksum = _file_sha256(path)
+    except OSError as e:
+        _fail(upload, f'Файл загрузки недоступен: {e}')
+        raise UploadError(upload.error)
+    if checksum != upload.sha256.lower():
+        _fail(upload, 'Контрольная сумма не совпадает')
+        os.remove(path)
+        raise UploadError(upload.error)
+
+    lesson = upload.lesson
+    old_name = lesson.video_file.name if lesson.video_file else ''
+    name = default_storage.get_available_name(
+        lesson.video_file.field.generate_filename(lesson, upload.filename)
+    )
+    target = default_storage.path(name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # На одной файловой системе - атомарное переименование, иначе копирование
+    shutil.move(path, target)
+    with transaction.atomic():
+        lesson.video_file.name = name
+        lesson.video_size = upload.size
+        lesson.video_processed_at = None
+        lesson.save(update_fields=['video_file', 'video_size', 'video_processed_at', 'updated_at'])
+        if old_name:
+            # Прежний файл больше не нужен, но удалять его можно только после фиксации
+            transaction.on_commit(lambda: default_storage.delete(old_name))
+
+    try:
+        process_lesson_video(lesson)
+    except (Mp4Error, OSError) as e:
+        # Файл уже привязан к уроку, не хватает только метаданных
+        upload.error = f'Не удалось обработать MP4: {e}'
+
+    upload.status = VideoUpload.STATUS_COMPLETE
+    upload.completed_at = timezone.now()
+    upload.save(update_fields=['status', 'error', 'completed_at', 'updated_at'])
+    upload.chunks.all().delete()
+    return upload
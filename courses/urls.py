@@ -7,7 +7,16 @@ router.register(r'', views.CourseViewSet, basename='course')
 
 urlpatterns = [
     path('lessons/<int:lesson_id>/', views.get_lesson, name='get_lesson'),
+    path('lessons/<int:lesson_id>/video/', views.stream_lesson_video, name='lesson_video'),
+    path('lessons/<int:lesson_id>/resources/<int:index>/', views.stream_lesson_resource, name='lesson_resource'),
     path('lessons/<int:lesson_id>/progress/', views.update_lesson_progress, name='update_progress'),
+    path('lessons/<int:lesson_id>/progress/heartbeat/', views.progress_heartbeat, name='progress_heartbeat'),
+    path('uploads/', views.create_video_upload, name='create_video_upload'),
+    path('uploads/<int:upload_id>/', views.video_upload_detail, name='video_upload_detail'),
+    path('uploads/<int:upload_id>/complete/', views.complete_video_upload, name='complete_video_upload'),
+    path('media/<str:token>/', views.serve_signed_media, name='signed_media'),
+    path('progress/', views.my_courses_progress, name='my_courses_progress'),
+    path('progress/sync/', views.sync_lessons_progress, name='sync_progress'),
     path('<int:course_id>/reviews/', views.get_course_reviews, name='course_reviews'),
     path('<int:course_id>/reviews/create/', views.create_review, name='create_review'),
     path('', include(router.urls)),
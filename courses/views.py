@@ -1,56 +1,128 @@
 from rest_framework import viewsets, status
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.decorators import action, api_view, authentication_classes, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, AllowAny
+from django.core import signing
+from django.db.models import FilteredRelation, Prefetch, Q
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from .models import Course, Lesson, LessonProgress, CourseReview
+from .caching import CatalogCacheMixin
+from .entitlements import has_course_access
+from .media import (
+    lesson_resource_path,
+    lesson_video_path,
+    load_media_token,
+    ranged_file_response,
+    signed_media_response,
+)
+from .pagination import KeysetPagination
+from .progress import (
+    buffer_heartbeat,
+    discard_heartbeat,
+    get_lesson_access_info,
+    is_buffering_enabled,
+    sync_progress,
+)
+from .uploads import UploadError, complete_upload, create_upload_file, parse_content_range, write_chunk
+from .search import apply_catalog_filters, catalog_facets, parse_catalog_filters, search_courses
+from .models import Course, CourseProgress, Lesson, LessonProgress, CourseReview, VideoUpload
 from .serializers import (
     CourseListSerializer, 
     CourseDetailSerializer, 
     LessonSerializer,
     LessonProgressSerializer,
-    CourseReviewSerializer
+    CourseReviewSerializer,
+    CourseProgressSerializer,
+    ProgressHeartbeatSerializer,
+    ProgressSyncItemSerializer,
+    ProgressSyncSerializer,
+    VideoUploadSerializer,
 )
 
 
-class CourseViewSet(viewsets.ReadOnlyModelViewSet):
+# Сколько последних отзывов встраивается в детальную страницу курса
+LATEST_REVIEWS_LIMIT = 5
+
+
+class CourseViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Course.objects.filter(is_active=True)
     permission_classes = (AllowAny,)
     lookup_field = 'slug'
     
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            # Фасеты считаются по результатам поиска, до фасетных фильтров
+            self.catalog_filters = parse_catalog_filters(self.request.query_params)
+            self.search_queryset = search_courses(queryset, self.catalog_filters['search'])
+            queryset = apply_catalog_filters(self.search_queryset, self.catalog_filters)
+        elif self.action == 'retrieve':
+            # Уроки, прогресс пользователя и авторы отзывов загружаются
+            # фиксированным числом запросов, независимо от их количества
+            lessons = Lesson.objects.all()
+            user = self.request.user
+            if user.is_authenticated:
+                lessons = lessons.prefetch_related(Prefetch(
+                    'progress',
+                    queryset=LessonProgress.objects.filter(user=user),
+                    to_attr='user_progress'
+                ))
+            latest_reviews = CourseReview.objects.select_related('user').order_by('-created_at', '-id')
+            queryset = queryset.prefetch_related(
+                Prefetch('lessons', queryset=lessons),
+                Prefetch(
+                    'reviews',
+                    queryset=latest_reviews[:LATEST_REVIEWS_LIMIT],
+                    to_attr='latest_reviews'
+                ),
+            )
+        return queryset
+    
     def get_serializer_class(self):
         if self.action == 'list':
             return CourseListSerializer
         return CourseDetailSerializer
     
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data['facets'] = catalog_facets(self.search_queryset, self.catalog_filters)
+        return response
+    
     @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
     def my_progress(self, request, slug=None):
         """Получить прогресс пользователя по курсу"""
         course = self.get_object()
         
         # Проверка доступа
-        if not course.students.filter(id=request.user.id).exists():
+        if not has_course_access(request.user, course.id):
             return Response(
                 {'detail': 'У вас нет доступа к этому курсу'},
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        lessons = course.lessons.all()
-        progress_data = []
-        
-        for lesson in lessons:
-            try:
-                progress = LessonProgress.objects.get(user=request.user, lesson=lesson)
-                progress_data.append(LessonProgressSerializer(progress).data)
-            except LessonProgress.DoesNotExist:
-                progress_data.append({
-                    'lesson': lesson.id,
-                    'completed': False,
-                    'completed_at': None,
-                    'watch_time_seconds': 0
-                })
+        # Уроки и прогресс пользователя одним запросом (LEFT JOIN)
+        rows = course.lessons.annotate(
+            user_progress=FilteredRelation('progress', condition=Q(progress__user=request.user))
+        ).values(
+            'id',
+            'user_progress__completed',
+            'user_progress__completed_at',
+            'user_progress__watch_time_seconds',
+        )
         
+        completed_at_field = LessonProgressSerializer().fields['completed_at']
+        progress_data = [
+            {
+                'lesson': row['id'],
+                'completed': bool(row['user_progress__completed']),
+                'completed_at': (
+                    completed_at_field.to_representation(row['user_progress__completed_at'])
+                    if row['user_progress__completed_at'] else None
+                ),
+                'watch_time_seconds': row['user_progress__watch_time_seconds'] or 0,
+            }
+            for row in rows
+        ]
         return Response(progress_data)
 
 
@@ -61,9 +133,8 @@ def get_lesson(request, lesson_id):
     lesson = get_object_or_404(Lesson, id=lesson_id)
     
     # Проверка доступа
-    if not lesson.is_free:
-        has_access = lesson.course.students.filter(id=request.user.id).exists()
-        if not has_access:
+    if not lesson.is_free_preview:
+        if not has_course_access(request.user, lesson.course_id):
             return Response(
                 {'detail': 'Вы должны купить курс для доступа к этому уроку'},
                 status=status.HTTP_403_FORBIDDEN
@@ -73,6 +144,106 @@ def get_lesson(request, lesson_id):
     return Response(serializer.data)
 
 
+def _media_access_denied(request, lesson):
+    """Ответ с ошибкой, если у пользователя нет доступа к медиа урока"""
+    if lesson.is_free_preview or has_course_access(request.user, lesson.course_id):
+        return None
+    if not request.user.is_authenticated:
+        return Response({'detail': 'Требуется авторизация'}, status=status.HTTP_401_UNAUTHORIZED)
+    return Response(
+        {'detail': 'Вы должны купить курс для доступа к этому уроку'},
+        status=status.HTTP_403_FORBIDDEN
+    )
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def stream_lesson_video(request, lesson_id):
+    """Видео урока с поддержкой Range (перемотка без повторной загрузки)"""
+    lesson = get_object_or_404(Lesson, id=lesson_id)
+    denied = _media_access_denied(request, lesson)
+    if denied:
+        return denied
+    return ranged_file_response(request, lesson_video_path(lesson))
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def stream_lesson_resource(request, lesson_id, index):
+    """Файл из ресурсов урока с поддержкой Range"""
+    lesson = get_object_or_404(Lesson, id=lesson_id)
+    denied = _media_access_denied(request, lesson)
+    if denied:
+        return denied
+    return ranged_file_response(request, lesson_resource_path(lesson, index))
+
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def serve_signed_media(request, token):
+    """Файл урока по подписанной временной ссылке (см. LessonSerializer.get_video_url)"""
+    try:
+        payload = load_media_token(token)
+    except signing.SignatureExpired:
+        return Response({'detail': 'Срок действия ссылки истёк'}, status=status.HTTP_410_GONE)
+    except signing.BadSignature:
+        return Response({'detail': 'Неверная ссылка'}, status=status.HTTP_403_FORBIDDEN)
+    return signed_media_response(request, payload)
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def create_video_upload(request):
+    """Начать загрузку видео урока частями (см. courses.uploads)"""
+    serializer = VideoUploadSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    upload = serializer.save(created_by=request.user)
+    create_upload_file(upload)
+    return Response(VideoUploadSerializer(upload).data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET', 'PUT'])
+@permission_classes([IsAdminUser])
+def video_upload_detail(request, upload_id):
+    """
+    GET - состояние загрузки и полученные диапазоны.
+    PUT - часть файла: тело запроса с заголовком Content-Range.
+    """
+    upload = get_object_or_404(VideoUpload, id=upload_id)
+    if request.method == 'PUT':
+        if upload.status != VideoUpload.STATUS_UPLOADING:
+            return Response({'detail': 'Загрузка уже завершена'}, status=status.HTTP_409_CONFLICT)
+        try:
+            start, end = parse_content_range(request.META.get('HTTP_CONTENT_RANGE'), upload.size)
+            if int(request.META.get('CONTENT_LENGTH') or 0) != end - start:
+                raise UploadError('Content-Length не совпадает с Content-Range')
+            # Тело читается потоком, request.data не используется
+            write_chunk(upload, request.stream, start, end)
+        except UploadError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(VideoUploadSerializer(upload).data)
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def complete_video_upload(request, upload_id):
+    """
+    Завершить загрузку: файл ставится в очередь на проверку SHA-256 и привязку
+    к уроку (process_lesson_videos), статус отслеживается через GET uploads/<id>/
+    """
+    upload = get_object_or_404(VideoUpload.objects.select_related('lesson'), id=upload_id)
+    try:
+        complete_upload(upload)
+    except UploadError as e:
+        return Response(
+            {'detail': str(e), 'upload': VideoUploadSerializer(upload).data},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return Response(VideoUploadSerializer(upload).data, status=status.HTTP_202_ACCEPTED)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def update_lesson_progress(request, lesson_id):
@@ -80,35 +251,111 @@ def update_lesson_progress(request, lesson_id):
     lesson = get_object_or_404(Lesson, id=lesson_id)
     
     # Проверка доступа
-    has_access = lesson.course.students.filter(id=request.user.id).exists()
-    if not has_access and not lesson.is_free_preview:
+    if not lesson.is_free_preview and not has_course_access(request.user, lesson.course_id):
         return Response(
             {'detail': 'У вас нет доступа к этому уроку'},
             status=status.HTTP_403_FORBIDDEN
         )
     
+    progress = _save_progress(request.user, lesson, request.data)
+    serializer = LessonProgressSerializer(progress)
+    return Response(serializer.data)
+
+
+def _save_progress(user, lesson, data):
+    """Записать прогресс урока в БД"""
     progress, created = LessonProgress.objects.get_or_create(
-        user=request.user,
+        user=user,
         lesson=lesson
     )
     
     # Обновляем данные
-    if 'completed' in request.data and request.data['completed']:
+    if 'completed' in data and data['completed']:
         progress.completed = True
         progress.completed_at = timezone.now()
     
-    if 'watch_time_seconds' in request.data:
-        progress.watch_time_seconds = request.data['watch_time_seconds']
+    if 'watch_time_seconds' in data:
+        progress.watch_time_seconds = data['watch_time_seconds']
     
-    if 'last_position_seconds' in request.data:
-        progress.last_position_seconds = request.data['last_position_seconds']
+    if 'last_position_seconds' in data:
+        progress.last_position_seconds = data['last_position_seconds']
     
     progress.save()
+    return progress
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def progress_heartbeat(request, lesson_id):
+    """
+    Heartbeat плеера: позиция и время просмотра буферизуются и пишутся
+    в БД пачками (см. courses.progress). Завершение урока, а без общего
+    кэша (REDIS_URL) и любой heartbeat, записывается сразу.
+    """
+    serializer = ProgressHeartbeatSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    data = serializer.validated_data
     
-    serializer = LessonProgressSerializer(progress)
+    info = get_lesson_access_info(lesson_id)
+    if info is None:
+        return Response({'detail': 'Урок не найден'}, status=status.HTTP_404_NOT_FOUND)
+    course_id, is_free_preview = info
+    if not is_free_preview and not has_course_access(request.user, course_id):
+        return Response(
+            {'detail': 'У вас нет доступа к этому уроку'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    if data['completed'] or not is_buffering_enabled():
+        lesson = get_object_or_404(Lesson, id=lesson_id)
+        progress = _save_progress(request.user, lesson, data)
+        discard_heartbeat(request.user.id, lesson_id)
+        return Response(LessonProgressSerializer(progress).data)
+    
+    buffer_heartbeat(request.user.id, lesson_id, data)
+    return Response({'lesson': lesson_id, 'buffered': True}, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def my_courses_progress(request):
+    """Сводный прогресс пользователя по всем курсам (для дашборда)"""
+    summaries = CourseProgress.objects.filter(user=request.user).select_related('course')
+    serializer = CourseProgressSerializer(summaries, many=True)
     return Response(serializer.data)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def sync_lessons_progress(request):
+    """
+    Пакетная синхронизация прогресса (офлайн-просмотр, несколько уроков).
+    Тело: {"items": [{"lesson": 1, "completed": true, "watch_time_seconds": 300,
+    "last_position_seconds": 290}, ...]}. Ответ содержит результат по каждому уроку.
+    """
+    serializer = ProgressSyncSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    results = []
+    valid_items = []
+    for raw_item in serializer.validated_data['items']:
+        item_serializer = ProgressSyncItemSerializer(data=raw_item)
+        if item_serializer.is_valid():
+            valid_items.append(item_serializer.validated_data)
+        else:
+            results.append({
+                'lesson': raw_item.get('lesson'),
+                'status': 'invalid',
+                'errors': item_serializer.errors
+            })
+    
+    statuses = sync_progress(request.user, valid_items) if valid_items else {}
+    results.extend({'lesson': lesson_id, 'status': result} for lesson_id, result in statuses.items())
+    return Response({'results': results})
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def create_review(request, course_id):
@@ -116,7 +363,7 @@ def create_review(request, course_id):
     course = get_object_or_404(Course, id=course_id)
     
     # Проверка, что пользователь купил курс
-    if not course.students.filter(id=request.user.id).exists():
+    if not has_course_access(request.user, course.id):
         return Response(
             {'detail': 'Вы можете оставлять отзывы только о купленных курсах'},
             status=status.HTTP_403_FORBIDDEN
@@ -131,15 +378,8 @@ def create_review(request, course_id):
     
     serializer = CourseReviewSerializer(data=request.data)
     if serializer.is_valid():
-        review = serializer.save(user=request.user, course=course)
-        
-        # Обновляем рейтинг курса
-        reviews = CourseReview.objects.filter(course=course)
-        avg_rating = sum(r.rating for r in reviews) / reviews.count()
-        course.rating = round(avg_rating, 2)
-        course.reviews_count = reviews.count()
-        course.save()
-        
+        # Рейтинг курса обновляется сигналом post_save (см. courses.signals)
+        serializer.save(user=request.user, course=course)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -147,8 +387,11 @@ def create_review(request, course_id):
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_course_reviews(request, course_id):
-    """Получить все отзывы курса"""
+    """Получить отзывы курса (пагинация курсором, от новых к старым)"""
     course = get_object_or_404(Course, id=course_id)
-    reviews = CourseReview.objects.filter(course=course).order_by('-created_at')
-    serializer = CourseReviewSerializer(reviews, many=True)
-    return Response(serializer.data)
+    reviews = CourseReview.objects.filter(course=course).select_related('user')
+    
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(reviews, request)
+    serializer = CourseReviewSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
@@ -4,7 +4,8 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from courses.models import Course
+from courses.entitlements import get_purchased_course_ids, has_course_access
+from courses.models import Course, Enrollment
 from .models import Order, Payment
 from .serializers import OrderSerializer, CreateOrderSerializer
 
@@ -21,7 +22,7 @@ def create_order(request):
     course = get_object_or_404(Course, id=course_id, is_active=True)
     
     # Проверка, не куплен ли уже курс
-    if course.students.filter(id=request.user.id).exists():
+    if has_course_access(request.user, course.id):
         return Response(
             {'detail': 'Вы уже купили этот курс'},
             status=status.HTTP_400_BAD_REQUEST
@@ -63,8 +64,8 @@ def complete_payment(request, order_id):
     payment.paid_at = timezone.now()
     payment.save()
     
-    # Даём доступ к курсу
-    order.course.students.add(request.user)
+    # Даём (или продлеваем) доступ к курсу
+    Enrollment.grant(request.user, order.course, order)
     
     return Response({
         'detail': 'Оплата прошла успешно',
@@ -76,7 +77,7 @@ def complete_payment(request, order_id):
 @permission_classes([IsAuthenticated])
 def my_orders(request):
     """Получить список заказов пользователя"""
-    orders = Order.objects.filter(user=request.user)
+    orders = Order.objects.filter(user=request.user).select_related('course')
     serializer = OrderSerializer(orders, many=True)
     return Response(serializer.data)
 
@@ -85,7 +86,7 @@ def my_orders(request):
 @permission_classes([IsAuthenticated])
 def my_courses(request):
     """Получить список купленных курсов"""
-    courses = request.user.purchased_courses.all()
+    courses = Course.objects.filter(id__in=get_purchased_course_ids(request.user))
     from courses.serializers import CourseListSerializer
     serializer = CourseListSerializer(courses, many=True)
     return Response(serializer.data)